@@ -4,7 +4,9 @@ import os
 import sys
 import bcrypt 
 import time
-from database import get_db
+from database import get_db, iniciar_ciclo_leituras
+import replica
+import duplicidade
 
 def get_logo_path():
     if os.path.exists("assets/logo.jpg"): return "assets/logo.jpg"
@@ -802,6 +804,10 @@ def app_principal():
         admin.gestao_exame_de_faixa()
 
 if __name__ == "__main__":
+    get_db()  # conexão do processo (criada só no primeiro rerun)
+    replica.iniciar_todas()  # listeners das coleções pequenas (idempotente)
+    duplicidade.aquecer()    # matriz de duplicidade de questões, do disco (idempotente)
+    iniciar_ciclo_leituras()
     if not st.session_state.get('usuario') and not st.session_state.get('registration_pending'):
         login.tela_login()
     elif st.session_state.get('registration_pending'):
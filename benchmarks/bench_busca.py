@@ -0,0 +1,70 @@
+# benchmarks/bench_busca.py
+"""
+Compara a busca de questões: varredura linear (termo in pergunta) x índice
+invertido (busca.IndiceInvertido), com um banco sintético.
+
+Uso (na raiz do projeto; não acessa o Firestore):
+    python benchmarks/bench_busca.py [n_questoes]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from busca import IndiceInvertido, casa_consulta  # noqa: E402
+
+PALAVRAS = ("guarda fechada raspagem passagem montada costas armlock triângulo kimura omoplata "
+            "chave estrangulamento faixa azul roxa marrom preta regra pontuação vantagem punição "
+            "árbitro luta queda quedas defesa ataque posição joelho barriga meia-guarda gravata "
+            "mata-leão finalização história gracie tatame respeito higiene técnica transição").split()
+CATEGORIAS = ["Regras", "História", "Técnica", "Filosofia", "Graduação"]
+CONSULTAS = ["armlock", "guard", "faixa roxa", "estrang costas", "arbitro pontuacao vantagem", "xyz"]
+
+def gerar_questoes(n, seed=42):
+    rnd = random.Random(seed)
+    # Vocabulário realista: termos do BJJ (frequentes) + palavras diversas (cauda longa)
+    cauda = ["".join(rnd.choice("abcdefghijlmnoprstuv") for _ in range(rnd.randint(4, 10))) for _ in range(20000)]
+    palavra = lambda: rnd.choice(PALAVRAS) if rnd.random() < 0.3 else rnd.choice(cauda)
+    for i in range(n):
+        frase = lambda k: " ".join(palavra() for _ in range(k))
+        yield f"q{i:06d}", {
+            "pergunta": frase(14) + "?",
+            "categoria": rnd.choice(CATEGORIAS),
+            "alternativas": {l: frase(4) for l in "ABCD"},
+        }
+
+def _ms(f, rep):
+    t0 = time.perf_counter()
+    for _ in range(rep): r = f()
+    return (time.perf_counter() - t0) / rep * 1000, r
+
+def main(n=50000):
+    docs = list(gerar_questoes(n))
+
+    t0 = time.perf_counter()
+    indice = IndiceInvertido()
+    indice.reconstruir(docs)
+    print(f"{n} questões | construção do índice: {(time.perf_counter() - t0):.2f}s | vocabulário: {len(indice._vocab)}")
+
+    t0 = time.perf_counter()
+    for i in range(1000): indice.adicionar(docs[i][0], docs[-1 - i][1])
+    print(f"atualização incremental: {(time.perf_counter() - t0) / 1000 * 1e6:.0f} µs/doc")
+
+    print(f"{'consulta':<28}{'linear (ms)':>12}{'índice (ms)':>13}{'resultados':>12}")
+    for c in CONSULTAS:
+        termo = c.lower()
+        lin_ms, _ = _ms(lambda: [d for _, d in docs if termo in d["pergunta"].lower()], 3)
+        idx_ms, ids = _ms(lambda: indice.buscar(c), 50)
+        print(f"{c:<28}{lin_ms:>12.2f}{idx_ms:>13.3f}{len(ids):>12}")
+
+    # Conferência: índice == regra aplicada documento a documento
+    amostra = docs[:5000]
+    ref = IndiceInvertido(); ref.reconstruir(amostra)
+    for c in CONSULTAS:
+        assert ref.buscar(c) == {i for i, d in amostra if casa_consulta(c, d)}, c
+    print("ok: índice confere com a varredura nas consultas de teste")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
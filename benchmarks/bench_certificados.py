@@ -0,0 +1,90 @@
+# benchmarks/bench_certificados.py
+"""
+Compara a geração de certificados: montagem completa a cada PDF (como era,
+relendo o PNG do fundo) x modelo pré-montado + só os campos variáveis
+(certificados.RenderizadorCertificado, QR gerado em memória por código). Mede ms por certificado, tamanho do
+PDF e o custo único de montar o modelo.
+
+Uso (na raiz do projeto; não acessa o Firestore):
+    python benchmarks/bench_certificados.py [n_certificados]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf import FPDF  # noqa: E402
+
+import certificados  # noqa: E402
+from certificados import FUNDO_PADRAO, H, L, Y_BASE, limpa  # noqa: E402
+
+COR = (0, 100, 0)
+
+def _qrcode(pasta):
+    """QR em disco (o mesmo para todos), como a montagem antiga lia."""
+    caminho = os.path.join(pasta, "qr_bench.png")
+    if not os.path.exists(caminho):
+        import qrcode
+        qrcode.make("https://bjjdigital.com.br/verificar.html?codigo=BENCH").save(caminho)
+    return caminho
+
+def _completo(nome, faixa, professor, codigo, qr):
+    """Como o certificado era montado: tudo do zero, fundo PNG reprocessado."""
+    pdf = FPDF("L", "mm", "A4"); pdf.set_auto_page_break(False); pdf.add_page()
+    pdf.image(FUNDO_PADRAO, x=0, y=0, w=L, h=H)
+    titulo = "CERTIFICADO DE EXAME TEORICO"
+    pdf.set_y(28); pdf.set_font("Helvetica", "B", 32); pdf.set_text_color(200, 180, 100)
+    pdf.cell(0, 16, titulo, ln=False, align="C")
+    pdf.set_y(26.8); pdf.set_text_color(218, 165, 32); pdf.cell(0, 16, titulo, ln=True, align="C")
+    pdf.set_y(90); pdf.set_font("Helvetica", "", 14); pdf.set_text_color(50, 50, 50)
+    pdf.cell(0, 8, "Certificamos que o aluno(a):", ln=True, align="C")
+    pdf.set_font("Helvetica", "B", 42); pdf.set_text_color(218, 165, 32)
+    pdf.cell(0, 20, limpa(nome.upper()), ln=True, align="C")
+    pdf.ln(2); pdf.set_font("Helvetica", "", 14); pdf.set_text_color(50, 50, 50)
+    pdf.cell(0, 8, "foi aprovado(a) no exame teórico para a faixa:", ln=True, align="C")
+    pdf.ln(4); pdf.set_font("Helvetica", "B", 38); pdf.set_text_color(*COR)
+    pdf.cell(0, 18, limpa(faixa.upper()), ln=True, align="C")
+    pdf.set_xy(0, Y_BASE + 4); pdf.set_font("Helvetica", "I", 20); pdf.set_text_color(218, 165, 32)
+    pdf.cell(0, 14, limpa(professor), ln=True, align="C")
+    x = L/2 - 40; pdf.set_draw_color(60, 60, 60); pdf.line(x, pdf.get_y() + 1, x + 80, pdf.get_y() + 1)
+    pdf.ln(4); pdf.set_font("Helvetica", "", 9); pdf.set_text_color(100, 100, 100)
+    pdf.cell(0, 5, "Professor(a) Responsavel", align="C")
+    pdf.image(qr, x=L-56, y=Y_BASE, w=32)
+    pdf.set_xy(L-64, Y_BASE + 32); pdf.set_font("Courier", "", 8); pdf.cell(45, 4, f"Ref: {codigo}", align="C")
+    return pdf.output(dest="S").encode("latin-1")
+
+def _lote(n):
+    return [{"nome": f"Aluno Número {i}", "faixa": "Verde", "professor": "Mestre Fulano",
+             "codigo": f"BJJDIGITAL-2026-{i:04d}"} for i in range(n)]
+
+def main():
+    if not os.path.exists(FUNDO_PADRAO):
+        sys.exit(f"fundo não encontrado: {FUNDO_PADRAO}")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    qr = _qrcode(tempfile.gettempdir())
+    lote = _lote(n)
+
+    t0 = time.perf_counter()
+    tam_a = [len(_completo(c["nome"], c["faixa"], c["professor"], c["codigo"], qr)) for c in lote]
+    ms_a = (time.perf_counter() - t0) * 1000 / n
+
+    t0 = time.perf_counter()
+    r = certificados.RenderizadorCertificado()
+    ms_modelo = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    qrs = (("qr_" + c["codigo"], certificados.qrcode_imagem(f"https://bjjdigital.com.br/verificar.html?codigo={c['codigo']}"))
+           for c in lote)
+    tam_b = [len(p) for p in r.renderizar_lote(dict(c, cor_faixa=COR, qr=q) for c, q in zip(lote, qrs))]
+    ms_b = (time.perf_counter() - t0) * 1000 / n
+
+    print(f"{n} certificados  (fundo original: {os.path.getsize(FUNDO_PADRAO)/1024:.0f} KB)")
+    print(f"{'':22}{'ms/cert':>10}{'KB/PDF':>10}")
+    print(f"{'montagem completa':22}{ms_a:>10.1f}{sum(tam_a)/n/1024:>10.0f}")
+    print(f"{'modelo + campos':22}{ms_b:>10.1f}{sum(tam_b)/n/1024:>10.0f}")
+    print(f"modelo montado uma vez em {ms_modelo:.0f} ms (fundo {certificados.DPI_FUNDO} dpi, "
+          f"JPEG {len(r._fundo['data'])/1024:.0f} KB); ganho {ms_a/ms_b:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# benchmarks/bench_conexao.py
+"""
+Mede o custo da conexão com o Firestore:
+  - cold start: primeira chamada de get_db() (App + cliente + bucket)
+  - por chamada: get_db() já aquecido
+  - sonda de saúde (uma ida ao banco)
+
+Uso (na raiz do projeto, com .streamlit/secrets.toml):
+    python benchmarks/bench_conexao.py [n_chamadas]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+def main(n=10000):
+    t0 = time.perf_counter()
+    database.get_db()
+    cold_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        database.get_db()
+    por_chamada_us = (time.perf_counter() - t0) / n * 1e6
+
+    t0 = time.perf_counter()
+    database.obter_bucket()
+    bucket_us = (time.perf_counter() - t0) * 1e6
+
+    ok, info = database.verificar_conexao()
+
+    print(f"cold start get_db():     {cold_ms:8.1f} ms")
+    print(f"get_db() aquecido:       {por_chamada_us:8.2f} us/chamada ({n} chamadas)")
+    print(f"obter_bucket() aquecido: {bucket_us:8.2f} us")
+    print(f"sonda de saúde:          {'ok' if ok else 'FALHOU'} {info if not ok else f'{info:.1f} ms'}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
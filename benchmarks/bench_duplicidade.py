@@ -0,0 +1,53 @@
+# benchmarks/bench_duplicidade.py
+"""
+Mede o detector de duplicidade (duplicidade.DetectorDuplicidade) num banco
+sintético: construção, tamanho/tempo de carga do .npz, inclusão incremental e
+latência da consulta top-k.
+
+Uso (na raiz do projeto; não acessa o Firestore):
+    python benchmarks/bench_duplicidade.py [n_questoes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_busca import gerar_questoes  # noqa: E402
+from duplicidade import DetectorDuplicidade  # noqa: E402
+
+def main(n=50000):
+    docs = [(i, d["pergunta"]) for i, d in gerar_questoes(n)]
+    arquivo = os.path.join(tempfile.mkdtemp(), "dup.npz")
+
+    t0 = time.perf_counter()
+    det = DetectorDuplicidade(arquivo)
+    det.reconstruir(docs)
+    print(f"{n} questões | construção + gravação: {time.perf_counter() - t0:.2f}s | "
+          f"arquivo: {os.path.getsize(arquivo) / 1e6:.1f} MB")
+
+    t0 = time.perf_counter()
+    det = DetectorDuplicidade(arquivo); det.carregar()
+    print(f"carga do disco: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    det.similares("aquecimento")
+    alvo = docs[123][1]
+    variacao = alvo.replace("?", "").upper() + " ?"   # mesma questão, caixa/pontuação diferentes
+    tempos = []
+    for consulta in [alvo, variacao, "pergunta totalmente nova sobre kimura"] * 10:
+        t0 = time.perf_counter(); res = det.similares(consulta, k=5); tempos.append(time.perf_counter() - t0)
+    tempos.sort()
+    print(f"consulta top-5: mediana {tempos[len(tempos) // 2] * 1000:.1f} ms | p90 {tempos[int(len(tempos) * .9)] * 1000:.1f} ms")
+    top = det.similares(variacao, k=3)
+    print(f"variação da q000123 -> {[(i, round(s, 3)) for i, s, _ in top]}")
+    assert top[0][0] == docs[123][0]
+
+    t0 = time.perf_counter()
+    for i in range(200): det.adicionar(f"novo{i}", docs[i][1] + " variante")
+    det.similares(alvo)
+    print(f"inclusão incremental: {(time.perf_counter() - t0) / 200 * 1000:.2f} ms/questão (inclui 1 consulta)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
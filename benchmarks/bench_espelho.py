@@ -0,0 +1,96 @@
+# benchmarks/bench_espelho.py
+"""
+Espelho analítico (espelho.EspelhoColecao): primeira sincronização x
+sincronização incremental por marca d'água, com N resultados sintéticos.
+Mede tempo, pico de memória (tracemalloc), tamanho do .parquet e a leitura
+do DataFrame a partir do disco.
+
+Uso (na raiz do projeto; não acessa o Firestore):
+    python benchmarks/bench_espelho.py [n_resultados]
+"""
+import os
+import bisect
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import espelho  # noqa: E402
+
+FAIXAS = ["Cinza", "Amarela", "Laranja", "Verde", "Azul", "Roxa", "Marrom", "Preta"]
+
+class FonteSintetica:
+    """Coleção 'resultados' em memória, com atualizado_em crescente."""
+    def __init__(self, n, seed=1):
+        self.rnd = random.Random(seed)
+        self.base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.docs = {}
+        self.log = []           # (atualizado_em, id), em ordem de gravação
+        self.relogio = 0
+        for i in range(n): self.gravar(f"r{i:07d}")
+
+    def gravar(self, doc_id):
+        self.relogio += 1
+        total = self.rnd.choice([10, 15, 20]); acertos = self.rnd.randint(0, total)
+        t = self.base + timedelta(seconds=self.relogio * 30)
+        self.docs[doc_id] = {
+            "usuario": f"Aluno {self.rnd.randint(1, 5000)}", "usuario_id": f"u{self.rnd.randint(1, 5000)}",
+            "faixa": self.rnd.choice(FAIXAS), "pontuacao": acertos / total * 100, "acertos": acertos,
+            "total": total, "aprovado": acertos / total >= .7, "codigo_verificacao": None,
+            "data": t, "atualizado_em": t,
+        }
+        self.log.append((t, doc_id))
+
+    def tudo(self):
+        for k, d in self.docs.items(): yield dict(d, id=k)
+
+    def desde(self, marca):
+        """Como where(atualizado_em > marca).order_by(atualizado_em): só as entradas novas."""
+        for t, k in self.log[bisect.bisect_right(self.log, (marca, "\uffff")):]:
+            if self.docs[k]["atualizado_em"] == t: yield dict(self.docs[k], id=k)
+
+def _cenario(n, medir):
+    """Roda 1ª sync, inclusões/alterações + sync incremental, sync vazia e leitura do disco."""
+    fonte = FonteSintetica(n)
+    pasta = tempfile.mkdtemp()
+    e = espelho.EspelhoColecao("resultados", espelho.ESQUEMAS["resultados"], pasta=pasta)
+    e._ler_tudo = fonte.tudo
+    e._ler_desde = fonte.desde
+    out = {"primeira": medir(e.sincronizar)}
+    out["tamanho"] = os.path.getsize(e.arquivo)
+    for i in range(500): fonte.gravar(f"novo{i}")                 # inclusões
+    for i in range(0, 1000, 2): fonte.gravar(f"r{i:07d}")         # alterações
+    out["incremental"] = medir(e.sincronizar)
+    assert out["incremental"][0] == 1000 and len(e.dataframe(sincronizar=False)) == n + 500
+    out["vazia"] = medir(e.sincronizar)
+    outro = espelho.EspelhoColecao("resultados", espelho.ESQUEMAS["resultados"], pasta=pasta)
+    out["disco"] = medir(lambda: outro.dataframe(sincronizar=False))
+    return out
+
+def _tempo(f):
+    t0 = time.perf_counter(); r = f()
+    return r, time.perf_counter() - t0
+
+def _memoria(f):
+    tracemalloc.start(); r = f()
+    pico = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    return r, pico / 1e6
+
+def main(n=100000):
+    # Tempo e memória em execuções separadas (tracemalloc deixa o código bem mais lento)
+    t = _cenario(n, _tempo)
+    m = _cenario(n, _memoria)
+    print(f"{n} resultados | parquet: {t['tamanho'] / 1e6:.1f} MB")
+    print(f"{'etapa':<20}{'docs':>8}{'tempo (ms)':>12}{'pico (MB)':>11}")
+    for nome, chave in [("1ª sincronização", "primeira"), ("incremental", "incremental"), ("sem mudanças", "vazia")]:
+        print(f"{nome:<20}{t[chave][0]:>8}{t[chave][1] * 1000:>12.0f}{m[chave][1]:>11.1f}")
+    df = t["disco"][0]
+    print(f"{'leitura do disco':<20}{len(df):>8}{t['disco'][1] * 1000:>12.0f}{m['disco'][1]:>11.1f}"
+          f"  (DataFrame: {df.memory_usage(deep=True).sum() / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,66 @@
+# benchmarks/bench_sorteio.py
+"""
+Compara a montagem de um exame sorteado: filtra a lista inteira + random.sample
+(como era) x pools pré-separados por nível/tema (sorteio.PoolsQuestoes), para
+bancos de tamanhos crescentes.
+
+Uso (na raiz do projeto; não acessa o Firestore):
+    python benchmarks/bench_sorteio.py [n_maximo]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_busca import gerar_questoes  # noqa: E402
+from sorteio import PoolsQuestoes, chave_questao  # noqa: E402
+
+POR_NIVEL = {"1": 4, "2": 4, "3": 3, "4": 2}
+POR_TEMA = {"Regras": 3, "História": 2}
+TOTAL = 20
+
+def _linear(docs, rnd):
+    """Como o exame era montado: copia/filtra tudo a cada prova."""
+    escolhidos = set()
+    for tema, qtd in POR_TEMA.items():
+        cand = [i for i, d in docs if d["categoria"] == tema and i not in escolhidos]
+        escolhidos.update(rnd.sample(cand, min(qtd, len(cand))))
+    for nivel, qtd in POR_NIVEL.items():
+        cand = [i for i, d in docs if d["dificuldade"] == int(nivel) and i not in escolhidos]
+        escolhidos.update(rnd.sample(cand, min(qtd, len(cand))))
+    resto = [i for i, _ in docs if i not in escolhidos]
+    escolhidos.update(rnd.sample(resto, max(0, TOTAL - len(escolhidos))))
+    return list(escolhidos)
+
+def _ms(f, rep):
+    t0 = time.perf_counter()
+    for _ in range(rep): r = f()
+    return (time.perf_counter() - t0) / rep * 1000, r
+
+def main(n_max=100000):
+    rnd = random.Random(7)
+    print(f"{'questões':>9}{'linear (ms)':>13}{'pools (ms)':>12}{'pools: incremental (µs)':>25}")
+    n = 1000
+    while n <= n_max:
+        docs = [(i, dict(d, dificuldade=rnd.randint(1, 4), status="aprovada")) for i, d in gerar_questoes(n)]
+        pools = PoolsQuestoes(); pools.reconstruir(docs)
+        lin_ms, _ = _ms(lambda: _linear(docs, rnd), 5)
+        pool_ms, ids = _ms(lambda: pools.sortear(TOTAL, POR_NIVEL, POR_TEMA, rng=rnd), 200)
+        t0 = time.perf_counter()
+        for i in range(1000): pools.adicionar(docs[i][0], dict(docs[i][1], dificuldade=1 + i % 4))
+        inc_us = (time.perf_counter() - t0) / 1000 * 1e6
+        print(f"{n:>9}{lin_ms:>13.2f}{pool_ms:>12.3f}{inc_us:>25.1f}")
+
+        # Conferência: sem repetição, cotas respeitadas
+        dados = dict(docs)
+        assert len(ids) == len(set(ids)) == TOTAL
+        for tema, qtd in POR_TEMA.items():
+            assert sum(1 for i in ids if chave_questao(dados[i])[2] == tema) >= qtd
+        n *= 10
+    print("ok: sorteios sem repetição e com as cotas por tema")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,109 @@
+# benchmarks/bench_uploads.py
+"""
+Mede o motor de upload (uploads.MotorUpload) contra o Storage falso local
+(fake_gcs.py), com latência por requisição e banda por conexão simuladas:
+
+  1. vazão de um arquivo grande x tamanho do chunk;
+  2. vários arquivos: um de cada vez x em paralelo;
+  3. falhas a cada N PUTs: o envio retoma do último byte confirmado;
+  4. mesma imagem em várias questões: nome aleatório (uuid) x endereçado por
+     conteúdo (bytes guardados) e downloads de um navegador que respeita
+     Cache-Control em visitas repetidas.
+
+Uso (na raiz do projeto; não acessa a nuvem):
+    python benchmarks/bench_uploads.py [--mb 64] [--latencia-ms 20] [--banda-mbps 400]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import uploads  # noqa: E402
+from fake_gcs import FakeGCS  # noqa: E402
+
+MB = 1024 * 1024
+
+def _motor(fake, chunk, paralelos=uploads.PARALELOS_PADRAO):
+    return uploads.MotorUpload(tamanho_chunk=chunk, paralelos=paralelos,
+                               iniciar_sessao=fake.iniciar_sessao(), publicar=fake.publicar(), existe=fake.existe())
+
+def _vazao(n_bytes, segundos):
+    return n_bytes / MB / segundos
+
+class _Arquivo(io.BytesIO):
+    name, type = "foto.jpg", "image/jpeg"
+
+def _navegador(fake, urls, visitas):
+    """Downloads feitos por um navegador com cache HTTP simples (max-age) em N visitas."""
+    cache, antes = set(), fake.leituras
+    for _ in range(visitas):
+        for u in urls:
+            if u in cache: continue
+            if "max-age" in (requests.get(u, timeout=10).headers.get("Cache-Control") or ""): cache.add(u)
+    return fake.leituras - antes
+
+def _bytes_guardados(fake, prefixo):
+    return sum(len(o["dados"]) for (_, nome), o in fake.objetos.items() if nome.startswith(prefixo))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=64, help="Tamanho do arquivo grande (MB)")
+    parser.add_argument("--latencia-ms", type=float, default=20)
+    parser.add_argument("--banda-mbps", type=float, default=400, help="Banda por conexão (0 = sem limite)")
+    args = parser.parse_args()
+
+    fake = FakeGCS(args.latencia_ms / 1000, args.banda_mbps).iniciar()
+    dados = os.urandom(args.mb * MB)
+    print(f"Storage falso: latência {args.latencia_ms:.0f} ms/requisição, banda {args.banda_mbps:.0f} Mbps/conexão\n")
+
+    print(f"1) Um arquivo de {args.mb} MB")
+    print(f"{'chunk':>10}{'PUTs':>8}{'MB/s':>10}")
+    for chunk in (256 * 1024, 1 * MB, 4 * MB, 8 * MB, 16 * MB, 32 * MB):
+        fake.puts = 0
+        t0 = time.perf_counter()
+        _motor(fake, chunk).enviar(io.BytesIO(dados), f"bench/grande_{chunk}.bin", "video/mp4")
+        dt = time.perf_counter() - t0
+        rotulo = f"{chunk // 1024} KB" if chunk < MB else f"{chunk // MB} MB"
+        print(f"{rotulo:>10}{fake.puts:>8}{_vazao(len(dados), dt):>10.1f}")
+
+    n, tam = 6, max(1, args.mb // 4) * MB
+    arquivos = [os.urandom(tam) for _ in range(n)]
+    print(f"\n2) {n} arquivos de {tam // MB} MB (chunk 8 MB)")
+    for paralelos in (1, 2, 4, 6):
+        t0 = time.perf_counter()
+        urls = _motor(fake, 8 * MB, paralelos).enviar_varios(
+            [(io.BytesIO(a), f"bench/p{paralelos}_{i}.bin", "video/mp4") for i, a in enumerate(arquivos)])
+        dt = time.perf_counter() - t0
+        assert all(urls)
+        print(f"   {paralelos} em paralelo: {dt:6.2f} s  ({_vazao(n * tam, dt):6.1f} MB/s)")
+
+    print(f"\n3) Falha (503) a cada 4 PUTs, arquivo de {args.mb} MB, chunk 4 MB")
+    uploads.ESPERA_BASE_S = 0.05
+    fake.puts, fake.falhas, fake.falhar_a_cada = 0, 0, 4
+    t0 = time.perf_counter()
+    _motor(fake, 4 * MB).enviar(io.BytesIO(dados), "bench/com_falhas.bin", "video/mp4")
+    dt = time.perf_counter() - t0
+    ok = fake.objetos[("bucket-teste", "bench/com_falhas.bin")]["dados"] == dados
+    print(f"   {fake.falhas} falhas, {fake.puts} PUTs, {dt:.2f} s, conteúdo íntegro: {ok}")
+    fake.falhar_a_cada = 0
+
+    n_q, visitas = 10, 5
+    img = os.urandom(512 * 1024)
+    print(f"\n4) A mesma imagem (512 KB) em {n_q} questões; {visitas} visitas à lista")
+    m = _motor(fake, 8 * MB)
+    antigos = [m.enviar(_Arquivo(img), f"questoes/{uuid.uuid4()}.jpg", "image/jpeg") for _ in range(n_q)]
+    novos = [m.enviar_enderecado(_Arquivo(img))["url"] for _ in range(n_q)]
+    print(f"   {'':14}{'guardado':>12}{'downloads':>12}")
+    print(f"   {'uuid':14}{_bytes_guardados(fake, 'questoes/') / 1024:>9.0f} KB{_navegador(fake, antigos, visitas):>12}")
+    print(f"   {'sha256':14}{_bytes_guardados(fake, uploads.PREFIXO_ENDERECADO + '/') / 1024:>9.0f} KB{_navegador(fake, novos, visitas):>12}")
+    fake.parar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# benchmarks/fake_gcs.py
+"""
+Servidor local que imita o necessário da API JSON do Cloud Storage para
+testar/medir uploads sem rede nem credenciais:
+
+    POST  /upload/storage/v1/b/{bucket}/o?uploadType=resumable&name=...  -> Location da sessão
+    PUT   {sessão}  (Content-Range)  -> 308 + Range / 200 + metadados
+    GET   /storage/v1/b/{bucket}/o/{nome}[/acl]  -> metadados / ACL (404 se não existe)
+    GET   /{bucket}/{nome}  -> conteúdo
+    PATCH /storage/v1/b/{bucket}/o/{nome}  -> metadados (make_public / cache-control)
+
+Simula latência por requisição, banda limitada e falhas (503 a cada N PUTs).
+Também atende o cliente google-cloud-storage com
+STORAGE_EMULATOR_HOST=http://127.0.0.1:<porta>.
+
+Uso isolado:
+    python benchmarks/fake_gcs.py [--porta 9023] [--latencia-ms 0] [--falhar-a-cada 0]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+class FakeGCS:
+    def __init__(self, latencia_s=0.0, banda_mbps=0.0, falhar_a_cada=0, host="127.0.0.1", porta=0):
+        self.latencia_s = latencia_s
+        self.banda_mbps = banda_mbps
+        self.falhar_a_cada = falhar_a_cada
+        self.objetos = {}           # (bucket, nome) -> {"dados": bytes, "meta": {...}}
+        self.sessoes = {}           # upload_id -> {"bucket", "nome", "meta", "dados": bytearray}
+        self.puts = 0
+        self.falhas = 0
+        self.leituras = 0           # GETs de conteúdo (downloads)
+        self._lock = threading.Lock()
+        self._servidor = ThreadingHTTPServer((host, porta), self._handler())
+        self._servidor.daemon_threads = True
+        self.url = f"http://{host}:{self._servidor.server_address[1]}"
+
+    def iniciar(self):
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown(); self._servidor.server_close()
+
+    # Atalhos para o MotorUpload
+    def iniciar_sessao(self, bucket="bucket-teste"):
+        import requests
+        def _iniciar(destino, content_type, total, cache_control=None):
+            meta = {"name": destino, "contentType": content_type}
+            if cache_control: meta["cacheControl"] = cache_control
+            r = requests.post(f"{self.url}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&name={quote(destino, safe='')}",
+                              json=meta, timeout=10)
+            r.raise_for_status()
+            return r.headers["Location"]
+        return _iniciar
+
+    def publicar(self, bucket="bucket-teste"):
+        return lambda destino, resposta: f"{self.url}/{bucket}/{quote(destino)}"
+
+    def existe(self, bucket="bucket-teste"):
+        import requests
+        return lambda destino: requests.get(f"{self.url}/storage/v1/b/{bucket}/o/{quote(destino, safe='')}",
+                                            timeout=10).status_code == 200
+
+    # ------------------------------------------------------------------
+    def _meta(self, bucket, nome, dados, meta):
+        return {"kind": "storage#object", "bucket": bucket, "name": nome, "size": str(len(dados)),
+                "md5Hash": base64.b64encode(hashlib.md5(dados).digest()).decode(),
+                "generation": "1", "metageneration": "1", **meta}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _corpo(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                dados = self.rfile.read(n) if n else b""
+                if fake.banda_mbps and dados: time.sleep(len(dados) * 8 / (fake.banda_mbps * 1e6))
+                return dados
+
+            def _responder(self, codigo, corpo=b"", headers=None):
+                if isinstance(corpo, (dict, list)): corpo = json.dumps(corpo).encode()
+                self.send_response(codigo)
+                for k, v in (headers or {}).items(): self.send_header(k, v)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def _esperar(self):
+                if fake.latencia_s: time.sleep(fake.latencia_s)
+
+            def do_POST(self):
+                self._esperar()
+                url = urlparse(self.path); q = parse_qs(url.query)
+                m = re.match(r"^/upload/storage/v1/b/([^/]+)/o$", url.path)
+                corpo = self._corpo()
+                if not m or q.get("uploadType") != ["resumable"]: return self._responder(404)
+                meta = json.loads(corpo or b"{}")
+                nome = meta.pop("name", None) or (q.get("name") or [""])[0]
+                upload_id = uuid.uuid4().hex
+                with fake._lock:
+                    fake.sessoes[upload_id] = {"bucket": m.group(1), "nome": nome, "meta": meta, "dados": bytearray()}
+                local = f"{fake.url}/upload/storage/v1/b/{m.group(1)}/o?uploadType=resumable&upload_id={upload_id}"
+                self._responder(200, b"", {"Location": local})
+
+            def do_PUT(self):
+                self._esperar()
+                q = parse_qs(urlparse(self.path).query)
+                sessao = fake.sessoes.get((q.get("upload_id") or [""])[0])
+                corpo = self._corpo()
+                if sessao is None: return self._responder(404)
+                with fake._lock:
+                    fake.puts += 1
+                    falhar = fake.falhar_a_cada and fake.puts % fake.falhar_a_cada == 0
+                if falhar and corpo:
+                    fake.falhas += 1
+                    return self._responder(503, b"falha simulada")
+                faixa = self.headers.get("Content-Range", "")
+                m = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", faixa)
+                total = faixa.rsplit("/", 1)[-1]
+                if m:
+                    inicio = int(m.group(1))
+                    if inicio != len(sessao["dados"]): return self._responder(400, b"offset fora de ordem")
+                    sessao["dados"] += corpo
+                if total != "*" and len(sessao["dados"]) >= int(total):
+                    dados = bytes(sessao["dados"])
+                    meta = fake._meta(sessao["bucket"], sessao["nome"], dados, sessao["meta"])
+                    with fake._lock: fake.objetos[(sessao["bucket"], sessao["nome"])] = {"dados": dados, "meta": meta}
+                    return self._responder(200, meta, {"Content-Type": "application/json"})
+                h = {"Range": f"bytes=0-{len(sessao['dados']) - 1}"} if sessao["dados"] else {}
+                self._responder(308, b"", h)
+
+            def do_GET(self):
+                self._esperar()
+                url = urlparse(self.path)
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)/acl$", url.path)
+                if m:   # make_public() lê a ACL antes do PATCH
+                    obj = fake.objetos.get((m.group(1), unquote(m.group(2))))
+                    if not obj: return self._responder(404, {"error": {"code": 404}})
+                    return self._responder(200, {"items": obj["meta"].get("acl", [])}, {"Content-Type": "application/json"})
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)$", url.path)
+                if m:
+                    obj = fake.objetos.get((m.group(1), unquote(m.group(2))))
+                    if not obj: return self._responder(404, {"error": {"code": 404}})
+                    if parse_qs(url.query).get("alt") == ["media"]:
+                        fake.leituras += 1
+                        return self._responder(200, obj["dados"])
+                    return self._responder(200, obj["meta"], {"Content-Type": "application/json"})
+                partes = url.path.lstrip("/").split("/", 1)
+                obj = fake.objetos.get((partes[0], unquote(partes[1]))) if len(partes) == 2 else None
+                if not obj: return self._responder(404)
+                fake.leituras += 1
+                h = {"Content-Type": obj["meta"].get("contentType", "application/octet-stream")}
+                if obj["meta"].get("cacheControl"): h["Cache-Control"] = obj["meta"]["cacheControl"]
+                self._responder(200, obj["dados"], h)
+
+            def do_PATCH(self):
+                self._esperar()
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)$", urlparse(self.path).path)
+                corpo = self._corpo()
+                obj = fake.objetos.get((m.group(1), unquote(m.group(2)))) if m else None
+                if not obj: return self._responder(404, {"error": {"code": 404}})
+                obj["meta"].update(json.loads(corpo or b"{}"))
+                self._responder(200, obj["meta"], {"Content-Type": "application/json"})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Cloud Storage falso (local)")
+    parser.add_argument("--porta", type=int, default=9023)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--falhar-a-cada", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakeGCS(args.latencia_ms / 1000, falhar_a_cada=args.falhar_a_cada, porta=args.porta).iniciar()
+    print(f"STORAGE_EMULATOR_HOST={fake.url}")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: fake.parar()
+
+if __name__ == "__main__":
+    main()
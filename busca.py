@@ -0,0 +1,113 @@
+# main/busca.py
+"""
+Índice invertido em memória para busca textual (banco de questões).
+
+Tokens sem acento e minúsculos, como em utils.normalizar_nome. Cada termo da
+consulta casa por prefixo ("arm" acha "armlock") e os termos são combinados
+com E. O índice é atualizado documento a documento (adicionar/remover), então
+a réplica aplica só as mudanças de cada snapshot.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Abaixo disso é mais barato conferir os tokens de cada candidato do que expandir o prefixo
+LIMITE_FILTRO_CANDIDATOS = 200
+
+def normalizar_texto(texto):
+    """Mesma normalização de utils.normalizar_nome (NFKD -> ASCII -> minúsculas)."""
+    return unicodedata.normalize("NFKD", str(texto or "")).encode("ASCII", "ignore").decode().lower()
+
+def tokenizar(texto):
+    return _RE_TOKEN.findall(normalizar_texto(texto))
+
+def textos_questao(dados):
+    """Campos indexados de uma questão: pergunta, alternativas e categoria."""
+    alts = dados.get("alternativas") or {}
+    alts = alts.values() if isinstance(alts, dict) else alts
+    return [dados.get("pergunta", ""), dados.get("categoria", ""), *[str(a) for a in alts]]
+
+class IndiceInvertido:
+    def __init__(self, extrair_textos=textos_questao):
+        self.extrair_textos = extrair_textos
+        self._postings = {}      # token -> set(doc_id)
+        self._tokens_doc = {}    # doc_id -> set(token)
+        self._vocab = []         # tokens ordenados (prefixo via bisect)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tokens_doc)
+
+    def _tirar(self, doc_id):
+        for tok in self._tokens_doc.pop(doc_id, ()):
+            ids = self._postings.get(tok)
+            if ids is None: continue
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[tok]
+                i = bisect.bisect_left(self._vocab, tok)
+                if i < len(self._vocab) and self._vocab[i] == tok: self._vocab.pop(i)
+
+    def adicionar(self, doc_id, dados):
+        """Indexa (ou reindexa) um documento."""
+        tokens = set()
+        for t in self.extrair_textos(dados or {}): tokens.update(tokenizar(t))
+        with self._lock:
+            self._tirar(doc_id)
+            self._tokens_doc[doc_id] = tokens
+            for tok in tokens:
+                ids = self._postings.get(tok)
+                if ids is None:
+                    self._postings[tok] = ids = set()
+                    bisect.insort(self._vocab, tok)
+                ids.add(doc_id)
+
+    def remover(self, doc_id):
+        with self._lock:
+            self._tirar(doc_id)
+
+    def reconstruir(self, docs):
+        """docs: iterável de (doc_id, dados)."""
+        with self._lock:
+            self._postings, self._tokens_doc, self._vocab = {}, {}, []
+        for doc_id, dados in docs: self.adicionar(doc_id, dados)
+
+    def _tokens_prefixo(self, termo):
+        i = bisect.bisect_left(self._vocab, termo)
+        j = i
+        while j < len(self._vocab) and self._vocab[j].startswith(termo): j += 1
+        return self._vocab[i:j]
+
+    def _casar_prefixo(self, termo):
+        ids = set()
+        for tok in self._tokens_prefixo(termo): ids |= self._postings[tok]
+        return ids
+
+    def _estimar(self, termo):
+        return sum(len(self._postings[tok]) for tok in self._tokens_prefixo(termo))
+
+    def buscar(self, consulta):
+        """Ids que contêm todos os termos (por prefixo). None se a consulta for vazia."""
+        termos = set(tokenizar(consulta))
+        if not termos: return None
+        with self._lock:
+            # Termo mais seletivo primeiro; os demais filtram os candidatos
+            termos = sorted(termos, key=self._estimar)
+            resultado = self._casar_prefixo(termos[0])
+            for termo in termos[1:]:
+                if not resultado: break
+                if len(resultado) <= LIMITE_FILTRO_CANDIDATOS:
+                    resultado = {d for d in resultado if any(t.startswith(termo) for t in self._tokens_doc[d])}
+                else:
+                    resultado &= self._casar_prefixo(termo)
+            return resultado
+
+def casa_consulta(consulta, dados, extrair_textos=textos_questao):
+    """Mesma regra do índice, aplicada a um documento só (busca sem índice)."""
+    termos = set(tokenizar(consulta))
+    tokens = set()
+    for t in extrair_textos(dados or {}): tokens.update(tokenizar(t))
+    return all(any(tok.startswith(termo) for tok in tokens) for termo in termos)
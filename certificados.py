@@ -0,0 +1,268 @@
+# main/certificados.py
+"""
+Renderização dos certificados em PDF a partir de um modelo pré-montado.
+
+O modelo (fundo + textos fixos) é montado uma vez por processo. O fundo
+PNG (grande, com transparência) é convertido uma única vez num JPEG RGB na
+resolução certa para A4 e injetado direto no FPDF, sem reprocessar o PNG.
+Cada certificado é uma cópia do modelo com só os campos variáveis: nome,
+faixa, professor, QR e código.
+
+PDFs prontos ficam num cache endereçado pelo hash das entradas (campos +
+assinatura do layout): memória (LRU limitado em bytes) -> disco local ->
+Storage (certificados/{hash}.pdf). Só renderiza quem não está em nenhum.
+"""
+import copy
+import hashlib
+import io
+import json
+import os
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+from fpdf import FPDF
+
+FUNDO_PADRAO = os.path.join("assets", "fundo_certificado_bjj.png")
+DPI_FUNDO = 150
+QUALIDADE_JPEG = 85
+L, H = 297, 210          # A4 paisagem (mm)
+Y_BASE = 151             # linha do professor / QR
+NOME_FUNDO = "fundo_certificado"
+VERSAO_LAYOUT = 1        # mude ao alterar posições/textos do modelo (invalida o cache de PDFs)
+TAMANHO_MODULO_QR = 4    # pixels por módulo do QR (o PDF escala para 32 mm)
+CORRECAO_QR = "M"        # L/M/Q/H; a URL é curta, M já fica numa versão pequena
+BORDA_QR = 4             # zona de silêncio (módulos)
+MASCARA_QR = 0           # máscara fixa: evita testar as 8 (~5x mais rápido); None = a biblioteca escolhe
+
+def limpa(txt):
+    if not txt: return ""
+    return unicodedata.normalize('NFKD', str(txt)).encode('ASCII', 'ignore').decode('ASCII')
+
+def _fundo_jpeg(caminho, dpi=DPI_FUNDO, qualidade=QUALIDADE_JPEG):
+    """Info de imagem do FPDF (DCTDecode) com o fundo achatado em RGB e redimensionado."""
+    from PIL import Image
+    img = Image.open(caminho)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        base = Image.new("RGB", img.size, (255, 255, 255))
+        base.paste(img, mask=img.split()[-1])
+        img = base
+    else:
+        img = img.convert("RGB")
+    tamanho = (round(L / 25.4 * dpi), round(H / 25.4 * dpi))
+    if img.size != tamanho: img = img.resize(tamanho, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=qualidade, optimize=True, progressive=False)
+    return {"w": img.size[0], "h": img.size[1], "cs": "DeviceRGB", "bpc": 8, "f": "DCTDecode", "data": buf.getvalue()}
+
+def qrcode_imagem(texto, modulo=TAMANHO_MODULO_QR, correcao=CORRECAO_QR, borda=BORDA_QR, mascara=MASCARA_QR):
+    """
+    Info de imagem do FPDF (1 bit/pixel, FlateDecode) com o QR de 'texto',
+    montada em memória a partir da matriz de módulos. None sem o pacote qrcode.
+    """
+    try:
+        import qrcode
+        import numpy as np
+    except ImportError: return None
+    niveis = {"L": qrcode.constants.ERROR_CORRECT_L, "M": qrcode.constants.ERROR_CORRECT_M,
+              "Q": qrcode.constants.ERROR_CORRECT_Q, "H": qrcode.constants.ERROR_CORRECT_H}
+    qr = qrcode.QRCode(error_correction=niveis[correcao], box_size=1, border=borda, mask_pattern=mascara)
+    qr.add_data(texto); qr.make(fit=True)
+    claro = ~np.array(qr.get_matrix(), dtype=bool)          # DeviceGray 1 bit: 1 = branco
+    pixels = np.repeat(np.repeat(claro, modulo, axis=0), modulo, axis=1)
+    return {"w": pixels.shape[1], "h": pixels.shape[0], "cs": "DeviceGray", "bpc": 1,
+            "f": "FlateDecode", "data": zlib.compress(np.packbits(pixels, axis=1).tobytes(), 9)}
+
+def registrar_imagem(pdf, nome, info):
+    """Coloca uma imagem já processada no FPDF (pdf.image(nome, ...) não relê nada)."""
+    if nome not in pdf.images:
+        pdf.images[nome] = dict(info, i=len(pdf.images) + 1)
+
+class RenderizadorCertificado:
+    def __init__(self, fundo=FUNDO_PADRAO, dpi=DPI_FUNDO):
+        self._fundo = _fundo_jpeg(fundo, dpi) if fundo and os.path.exists(fundo) else None
+        self._modelo = self._montar_modelo()
+
+    def _montar_modelo(self):
+        pdf = FPDF("L", "mm", "A4")
+        pdf.set_auto_page_break(False)
+        pdf.add_page()
+        if self._fundo:
+            registrar_imagem(pdf, NOME_FUNDO, self._fundo)
+            pdf.image(NOME_FUNDO, x=0, y=0, w=L, h=H)
+        else: pdf.set_fill_color(252, 252, 252); pdf.rect(0, 0, L, H, "F")
+
+        titulo = "CERTIFICADO DE EXAME TEORICO"
+        pdf.set_y(28); pdf.set_font("Helvetica", "B", 32); pdf.set_text_color(200, 180, 100)
+        pdf.cell(0, 16, titulo, ln=False, align="C")
+        pdf.set_y(26.8); pdf.set_text_color(218, 165, 32)
+        pdf.cell(0, 16, titulo, ln=True, align="C")
+
+        pdf.set_y(90); pdf.set_font("Helvetica", "", 14); pdf.set_text_color(50, 50, 50)
+        pdf.cell(0, 8, "Certificamos que o aluno(a):", ln=True, align="C")
+        pdf.set_y(120)
+        pdf.cell(0, 8, "foi aprovado(a) no exame teórico para a faixa:", ln=True, align="C")
+
+        x_start = (L/2) - 40
+        pdf.set_draw_color(60, 60, 60)
+        pdf.line(x_start, Y_BASE + 19, x_start + 80, Y_BASE + 19)
+        pdf.set_xy(0, Y_BASE + 22); pdf.set_font("Helvetica", "", 9); pdf.set_text_color(100, 100, 100)
+        pdf.cell(0, 5, "Professor(a) Responsavel", align="C")
+
+        # Fontes da parte variável já registradas no modelo (cópias não repetem o trabalho)
+        for estilo in ("B", "I"): pdf.set_font("Helvetica", estilo, 12)
+        pdf.set_font("Courier", "", 8)
+        return pdf
+
+    def renderizar(self, nome, faixa, cor_faixa, professor, codigo, qr=None):
+        """
+        PDF (bytes) de um certificado. qr: (nome, info) vindo de qrcode_imagem
+        (ou um caminho de imagem em disco).
+        """
+        pdf = copy.deepcopy(self._modelo)   # bytes das imagens são compartilhados, não copiados
+
+        pdf.set_y(98); pdf.set_font("Helvetica", "B", 42); pdf.set_text_color(218, 165, 32)
+        pdf.cell(0, 20, limpa(nome.upper().strip()), ln=True, align="C")
+
+        pdf.set_y(132); pdf.set_font("Helvetica", "B", 38); pdf.set_text_color(*cor_faixa)
+        pdf.cell(0, 18, limpa(str(faixa).upper()), ln=True, align="C")
+
+        pdf.set_xy(0, Y_BASE + 4); pdf.set_font("Helvetica", "I", 20); pdf.set_text_color(218, 165, 32)
+        pdf.cell(0, 14, limpa(professor), ln=True, align="C")
+
+        if qr:
+            if isinstance(qr, tuple):
+                registrar_imagem(pdf, *qr); qr = qr[0]
+            if isinstance(qr, str) and (qr in pdf.images or os.path.exists(qr)):
+                pdf.image(qr, x=L-56, y=Y_BASE, w=32)
+                pdf.set_xy(L-64, Y_BASE + 32); pdf.set_font("Courier", "", 8); pdf.set_text_color(100, 100, 100)
+                pdf.cell(45, 4, f"Ref: {codigo}", align="C")
+
+        return pdf.output(dest="S").encode("latin-1")
+
+    def renderizar_lote(self, certificados):
+        """certificados: iterável de dicts com os argumentos de renderizar(). Gera bytes."""
+        for c in certificados:
+            yield self.renderizar(**c)
+
+# ==============================================================================
+# CACHE DE ARTEFATOS (PDF POR HASH DAS ENTRADAS)
+# ==============================================================================
+PASTA_ARTEFATOS = os.environ.get("BJJ_CERTIFICADOS_PASTA", os.path.join("dados", "certificados"))
+PREFIXO_STORAGE = "certificados/"
+MAX_BYTES_MEMORIA = 32 * 1024 * 1024
+
+_assinatura_layout = None
+
+def assinatura_layout(fundo=FUNDO_PADRAO):
+    """Hash do que muda o desenho sem mudar os campos: versão, fundo, DPI e parâmetros do QR."""
+    global _assinatura_layout
+    if _assinatura_layout is None:
+        h = hashlib.sha256(repr((VERSAO_LAYOUT, DPI_FUNDO, QUALIDADE_JPEG, TAMANHO_MODULO_QR,
+                                 CORRECAO_QR, BORDA_QR, MASCARA_QR)).encode())
+        if fundo and os.path.exists(fundo):
+            with open(fundo, "rb") as f: h.update(hashlib.sha256(f.read()).digest())
+        _assinatura_layout = h.hexdigest()[:16]
+    return _assinatura_layout
+
+def chave_artefato(**campos):
+    """sha256 dos campos do certificado + assinatura do layout."""
+    bruto = json.dumps([assinatura_layout(), campos], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(bruto.encode()).hexdigest()
+
+class CacheArtefatos:
+    def __init__(self, pasta=PASTA_ARTEFATOS, max_bytes=MAX_BYTES_MEMORIA, usar_storage=True):
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.usar_storage = usar_storage
+        self._memoria = OrderedDict()   # chave -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    def _da_memoria(self, chave):
+        with self._lock:
+            dados = self._memoria.get(chave)
+            if dados is not None: self._memoria.move_to_end(chave)
+            return dados
+
+    def _na_memoria(self, chave, dados):
+        if len(dados) > self.max_bytes: return
+        with self._lock:
+            if chave in self._memoria: return
+            self._memoria[chave] = dados
+            self._bytes += len(dados)
+            while self._bytes > self.max_bytes:
+                _, antigo = self._memoria.popitem(last=False)
+                self._bytes -= len(antigo)
+
+    def _arquivo(self, chave):
+        return os.path.join(self.pasta, chave[:2], f"{chave}.pdf")
+
+    def _do_disco(self, chave):
+        try:
+            with open(self._arquivo(chave), "rb") as f: return f.read()
+        except OSError: return None
+
+    def _no_disco(self, chave, dados):
+        try:
+            caminho = self._arquivo(chave)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho + ".tmp", "wb") as f: f.write(dados)
+            os.replace(caminho + ".tmp", caminho)
+        except OSError as e: print(f"[CERTIFICADOS] disco: {e}")
+
+    def _blob(self, chave):
+        from database import obter_bucket
+        return obter_bucket().blob(f"{PREFIXO_STORAGE}{chave}.pdf")
+
+    def _do_storage(self, chave):
+        if not self.usar_storage: return None
+        try: return self._blob(chave).download_as_bytes()
+        except Exception: return None   # não existe / Storage indisponível
+
+    def _no_storage(self, chave, dados):
+        if not self.usar_storage: return
+        try: self._blob(chave).upload_from_string(dados, content_type="application/pdf")
+        except Exception as e: print(f"[CERTIFICADOS] storage: {e}")
+
+    # ------------------------------------------------------------------
+    def obter(self, chave, renderizar):
+        """PDF da chave; renderizar() só é chamado se não estiver em nenhuma camada."""
+        dados = self._da_memoria(chave)
+        if dados is not None: return dados
+        dados = self._do_disco(chave)
+        if dados is None:
+            dados = self._do_storage(chave)
+            if dados is None:
+                dados = renderizar()
+                self._no_storage(chave, dados)
+            self._no_disco(chave, dados)
+        self._na_memoria(chave, dados)
+        return dados
+
+# ==============================================================================
+# INSTÂNCIAS DO PROCESSO
+# ==============================================================================
+_renderizador = None
+_cache = None
+_lock = threading.Lock()
+
+def obter_renderizador():
+    """Renderizador único do processo (modelo montado na primeira chamada)."""
+    global _renderizador
+    if _renderizador is None:
+        with _lock:
+            if _renderizador is None:
+                _renderizador = RenderizadorCertificado()
+    return _renderizador
+
+def obter_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = CacheArtefatos()
+    return _cache
@@ -1,68 +1,257 @@
 # main/database.py
 import streamlit as st
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, storage
 import json
+import threading
+import time
 
 # --- CONSTANTES GLOBAIS ---
 OPCOES_SEXO = [" ", "Masculino", "Feminino", "Outros"]
 
-def get_db():
-    """
-    Conexão ESTRITA com o banco 'bjj-digital'.
-    Inicializa também o Storage com o bucket correto.
-    """
+# --- CONEXÃO ÚNICA POR PROCESSO ---
+# O app Firebase, o cliente Firestore e o bucket são criados uma única vez por
+# processo e reaproveitados por todas as sessões. get_db() vira uma leitura de
+# variável; a sonda de saúde roda no máximo a cada INTERVALO_SONDA_S e, se
+# falhar, a conexão é refeita.
+DATABASE_ID = 'bjj-digital'
+INTERVALO_SONDA_S = 300
+
+_lock_conexao = threading.Lock()
+_conexao = {"db": None, "bucket": None, "app": None, "ultima_sonda": 0.0, "criado_em": None}
+
+def _ler_credenciais():
+    """Lê as credenciais e o nome do bucket do secrets.toml."""
+    key_dict = None
+    if "firebase" in st.secrets:
+        key_dict = dict(st.secrets["firebase"])
+    elif "textkey" in st.secrets:
+        if isinstance(st.secrets["textkey"], str):
+            key_dict = json.loads(st.secrets["textkey"])
+        else:
+            key_dict = dict(st.secrets["textkey"])
+    elif "project_id" in st.secrets:
+        key_dict = dict(st.secrets)
+
+    if key_dict is None:
+        st.error("❌ Credenciais não encontradas no secrets.toml")
+        st.stop()
+
+    # --- LÓGICA DE BUCKET ---
+    bucket_name = key_dict.get("storage_bucket")
+    if not bucket_name:
+        bucket_name = st.secrets.get("storage_bucket")
+    
+    if not bucket_name:
+        project_id = key_dict.get("project_id")
+        if project_id:
+            bucket_name = f"{project_id}.firebasestorage.app"
+    
+    if not bucket_name:
+        st.error("❌ Erro Crítico: 'storage_bucket' não encontrado no secrets.toml.")
+        st.stop()
+
+    return key_dict, bucket_name
+
+def _iniciar_app(nome=firebase_admin._DEFAULT_APP_NAME):
+    key_dict, bucket_name = _ler_credenciais()
+    return firebase_admin.initialize_app(credentials.Certificate(key_dict), {
+        'storageBucket': bucket_name
+    }, name=nome)
+
+def _criar_conexao(app=None):
+    """Cria cliente + bucket no App informado (padrão: o App default). Chamar com o lock."""
     # 1. Inicializa o App (se ainda não estiver rodando)
-    if not firebase_admin._apps:
+    if app is None:
         try:
-            key_dict = None
-            
-            # Procura as credenciais
-            if "firebase" in st.secrets:
-                key_dict = dict(st.secrets["firebase"])
-            elif "textkey" in st.secrets:
-                if isinstance(st.secrets["textkey"], str):
-                    key_dict = json.loads(st.secrets["textkey"])
-                else:
-                    key_dict = dict(st.secrets["textkey"])
-            elif "project_id" in st.secrets:
-                key_dict = dict(st.secrets)
-
-            if key_dict is None:
-                st.error("❌ Credenciais não encontradas no secrets.toml")
-                st.stop()
-
-            cred = credentials.Certificate(key_dict)
-            
-            # --- LÓGICA DE BUCKET ---
-            bucket_name = key_dict.get("storage_bucket")
-            if not bucket_name:
-                bucket_name = st.secrets.get("storage_bucket")
-            
-            if not bucket_name:
-                project_id = key_dict.get("project_id")
-                if project_id:
-                    bucket_name = f"{project_id}.firebasestorage.app"
-            
-            if not bucket_name:
-                st.error("❌ Erro Crítico: 'storage_bucket' não encontrado no secrets.toml.")
-                st.stop()
-
-            # Inicializa
-            firebase_admin.initialize_app(cred, {
-                'storageBucket': bucket_name
-            })
-
+            app = firebase_admin.get_app() if firebase_admin._apps else _iniciar_app()
         except Exception as e:
             st.error(f"❌ Erro ao iniciar Firebase App: {e}")
             st.stop()
 
     # 2. Conecta ESPECIFICAMENTE ao banco 'bjj-digital'
     try:
-        db = firestore.client(database_id='bjj-digital')
-        return db
+        db = firestore.client(app=app, database_id=DATABASE_ID)
     except TypeError:
-        return firestore.client()
+        db = firestore.client(app=app)
     except Exception as e:
-        st.error(f"❌ Não foi possível conectar ao banco 'bjj-digital'. Erro: {e}")
+        st.error(f"❌ Não foi possível conectar ao banco '{DATABASE_ID}'. Erro: {e}")
         st.stop()
+
+    try: bucket = storage.bucket(app=app)
+    except Exception as e:
+        print(f"[CONEXAO] bucket indisponível: {e}")
+        bucket = None
+
+    _conexao.update({"db": db, "bucket": bucket, "app": app, "ultima_sonda": time.monotonic(), "criado_em": time.time()})
+    return db
+
+def verificar_conexao(timeout=5):
+    """
+    Sonda de saúde: uma leitura de documento (inexistente) no banco.
+    Retorna (ok, latencia_ms ou mensagem de erro).
+    """
+    db = _conexao["db"]
+    if db is None: return False, "sem conexão"
+    t0 = time.perf_counter()
+    try:
+        db.collection('_saude').document('sonda').get(timeout=timeout)
+        return True, (time.perf_counter() - t0) * 1000
+    except Exception as e:
+        return False, str(e)
+
+def reconectar():
+    """
+    Cria uma conexão nova (num App novo) e troca a compartilhada. Só depois
+    religa os listeners das réplicas e descarta o App antigo: sessões que
+    ainda usam o cliente antigo terminam o que estavam fazendo.
+    """
+    with _lock_conexao:
+        antigo = _conexao["app"]
+        try:
+            novo = _iniciar_app(f"bjj-{time.time_ns()}")
+        except Exception as e:
+            print(f"[CONEXAO] erro ao criar app novo: {e}")
+            return _conexao["db"]
+        db = _criar_conexao(novo)
+
+    try:
+        import replica
+        replica.reiniciar_todas()
+    except Exception as e:
+        print(f"[CONEXAO] erro ao religar réplicas: {e}")
+
+    if antigo is not None:
+        try: firebase_admin.delete_app(antigo)
+        except Exception as e: print(f"[CONEXAO] erro ao descartar app: {e}")
+    return db
+
+def get_db():
+    """
+    Conexão ESTRITA com o banco 'bjj-digital', compartilhada pelo processo.
+    Inicializa também o Storage com o bucket correto.
+    """
+    db = _conexao["db"]
+    if db is None:
+        with _lock_conexao:
+            db = _conexao["db"] or _criar_conexao()
+        return db
+
+    if time.monotonic() - _conexao["ultima_sonda"] > INTERVALO_SONDA_S:
+        _conexao["ultima_sonda"] = time.monotonic()
+        ok, info = verificar_conexao()
+        if not ok:
+            print(f"[CONEXAO] sonda falhou ({info}); reconectando...")
+            db = reconectar()
+    return db
+
+def obter_bucket():
+    """Bucket do Storage criado junto com a conexão (sem resolver a cada upload)."""
+    if _conexao["db"] is None: get_db()
+    if _conexao["bucket"] is None:
+        with _lock_conexao:
+            if _conexao["bucket"] is None: _conexao["bucket"] = storage.bucket(app=_conexao["app"])
+    return _conexao["bucket"]
+
+# ==============================================================================
+# CARREGADOR EM LOTE (N+1) - ESCOPO DE UM RERUN
+# ------------------------------------------------------------------------------
+# Junta as leituras de documentos pedidas durante um rerun e busca tudo com
+# get_all em blocos. Documentos já lidos no mesmo rerun saem do mapa de
+# identidade, sem nova ida ao banco.
+# ==============================================================================
+TAMANHO_LOTE_LEITURA = 100
+
+class CarregadorDocumentos:
+    def __init__(self, db=None, tamanho_lote=TAMANHO_LOTE_LEITURA):
+        self._db = db
+        self.tamanho_lote = tamanho_lote
+        self._mapa = {}        # (colecao, id) -> dict ou None (não existe)
+        self._pendentes = {}   # (colecao, id) aguardando o próximo despacho (ordenado)
+        self.solicitadas = 0   # leituras pedidas pelos chamadores
+        self.lidas = 0         # documentos efetivamente buscados no banco
+        self.lotes = 0         # chamadas get_all (idas ao banco)
+
+    @property
+    def db(self):
+        if self._db is None: self._db = get_db()
+        return self._db
+
+    @property
+    def economizadas(self):
+        """Idas ao banco evitadas em relação a um .get() por documento."""
+        return max(self.solicitadas - self.lotes, 0)
+
+    def agendar(self, colecao, doc_id):
+        """Marca um documento para a próxima busca em lote (sem ler ainda)."""
+        if not doc_id: return
+        chave = (colecao, str(doc_id))
+        if chave not in self._mapa and chave not in self._pendentes:
+            self._pendentes[chave] = True
+
+    def agendar_muitos(self, colecao, ids):
+        for doc_id in ids or []: self.agendar(colecao, doc_id)
+
+    def despachar(self):
+        """Busca todos os pendentes com get_all, em blocos de `tamanho_lote`."""
+        pendentes, self._pendentes = list(self._pendentes), {}
+        for i in range(0, len(pendentes), self.tamanho_lote):
+            bloco = pendentes[i:i + self.tamanho_lote]
+            refs = [self.db.collection(c).document(d) for c, d in bloco]
+            for c, d in bloco: self._mapa[(c, d)] = None
+            try:
+                for snap in self.db.get_all(refs):
+                    chave = (snap.reference.parent.id, snap.id)
+                    self._mapa[chave] = snap.to_dict() if snap.exists else None
+            except Exception as e:
+                # Falha não é "não existe": tira o bloco do mapa e o próximo obter tenta de novo
+                print(f"[CARREGADOR] erro no get_all: {e}")
+                for chave in bloco: self._mapa.pop(chave, None)
+            self.lotes += 1
+            self.lidas += len(bloco)
+
+    def obter(self, colecao, doc_id):
+        """Retorna uma cópia dos dados do documento (ou None se não existir)."""
+        if not doc_id: return None
+        chave = (colecao, str(doc_id))
+        self.solicitadas += 1
+        if chave not in self._mapa:
+            self.agendar(colecao, doc_id)
+            self.despachar()
+        return self._copia(chave)
+
+    def _copia(self, chave):
+        dados = self._mapa.get(chave)
+        return dict(dados) if dados is not None else None
+
+    def obter_muitos(self, colecao, ids):
+        """Retorna {id: dados ou None} preservando a ordem dos ids (um despacho só)."""
+        ids = [str(i) for i in (ids or []) if i]
+        self.agendar_muitos(colecao, ids)
+        if self._pendentes: self.despachar()
+        self.solicitadas += len(ids)
+        return {doc_id: self._copia((colecao, doc_id)) for doc_id in ids}
+
+    def esquecer(self, colecao, doc_id):
+        """Remove um documento do mapa (usar após escrever nele no mesmo rerun)."""
+        self._mapa.pop((colecao, str(doc_id)), None)
+
+    def resumo(self):
+        return {"solicitadas": self.solicitadas, "lidas": self.lidas,
+                "lotes": self.lotes, "economizadas": self.economizadas}
+
+def obter_carregador():
+    """Carregador do rerun atual (um por sessão, renovado a cada rerun)."""
+    if "_carregador_docs" not in st.session_state:
+        st.session_state["_carregador_docs"] = CarregadorDocumentos()
+    return st.session_state["_carregador_docs"]
+
+def iniciar_ciclo_leituras():
+    """
+    Chamado no topo de cada rerun (app.py): registra o contador do rerun
+    anterior e começa um mapa de identidade vazio.
+    """
+    anterior = st.session_state.get("_carregador_docs")
+    if anterior is not None and anterior.solicitadas:
+        st.session_state["_carregador_ultimo_resumo"] = anterior.resumo()
+    st.session_state["_carregador_docs"] = CarregadorDocumentos()
@@ -0,0 +1,224 @@
+# main/duplicidade.py
+"""
+Detector de questões quase duplicadas, 100% local (scikit-learn, sem API).
+
+Cada enunciado vira um vetor TF-IDF de n-gramas de caracteres (3 a 5, dentro
+das palavras, sem acento) via HashingVectorizer, então não há vocabulário a
+recalcular: incluir uma questão é só acrescentar uma linha. As linhas ficam
+normalizadas (L2) com o IDF vigente; a consulta é um único produto
+matriz esparsa x vetor. Quando o banco cresce/encolhe mais que
+LIMIAR_REPESAGEM desde o último IDF, as linhas são repesadas.
+
+A matriz de contagens (com ids e enunciados) fica num .npz compacto em disco,
+carregado na primeira chamada do processo e regravado após mudanças.
+"""
+import atexit
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.preprocessing import normalize
+    DISPONIVEL = True
+except ImportError:
+    DISPONIVEL = False
+
+from busca import normalizar_texto
+
+ARQUIVO_PADRAO = os.environ.get("BJJ_DUPLICIDADE_ARQUIVO", os.path.join("dados", "duplicidade_questoes.npz"))
+N_FEATURES = 2 ** 18
+LIMIAR_REPESAGEM = 0.25         # variação relativa do nº de questões que força novo IDF
+MAX_LINHAS_EXTRAS = 2000        # linhas novas fora da matriz base antes de fundir
+INTERVALO_GRAVACAO_S = 30       # no máximo uma gravação em disco a cada N segundos
+FORMATO_VERSAO = 1
+
+def _vetorizador():
+    return HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=N_FEATURES,
+                             alternate_sign=False, norm=None, preprocessor=normalizar_texto)
+
+class DetectorDuplicidade:
+    def __init__(self, arquivo=ARQUIVO_PADRAO):
+        self.arquivo = arquivo
+        self._vet = _vetorizador()
+        self._lock = threading.RLock()
+        self._contagens = sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)  # tf bruto
+        self._pendentes = []            # linhas ainda não empilhadas (vstack em lote)
+        self._ids = []                  # id por linha; None = removida
+        self._textos = []
+        self._linha = {}                # id -> linha
+        self._mortas = set()            # linhas removidas (até compactar)
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        self._idf = np.ones(N_FEATURES, dtype=np.float32)
+        self._n_idf = 0                 # nº de questões quando o IDF foi calculado
+        self._base = None               # TF-IDF normalizada (CSC: consulta por colunas)
+        self._extras = None             # linhas novas já pesadas (CSR), fora da base
+        self._sujo = False
+        self._ultima_gravacao = 0.0
+
+    # ------------------------------------------------------------------
+    @property
+    def total(self):
+        return len(self._linha)
+
+    def _contar(self, texto):
+        c = self._vet.transform([texto or ""]).astype(np.float32)
+        c.data = 1.0 + np.log(c.data)   # tf sublinear
+        return c
+
+    def _empilhar(self):
+        if self._pendentes:
+            self._contagens = sparse.vstack([self._contagens, *self._pendentes], format="csr")
+            self._pendentes = []
+
+    def _recalcular_idf(self):
+        n = max(self.total, 1)
+        self._idf = (np.log((1 + n) / (1 + self._df)) + 1).astype(np.float32)
+        self._n_idf = self.total
+        self._base = self._extras = None
+
+    def _pesar(self, contagens):
+        return normalize(contagens.multiply(self._idf).tocsr())
+
+    def _matrizes(self):
+        """(base CSC, extras CSR) cobrindo todas as linhas; repesa se o IDF envelheceu."""
+        self._empilhar()
+        if self._n_idf == 0 or abs(self.total - self._n_idf) > LIMIAR_REPESAGEM * self._n_idf:
+            self._recalcular_idf()
+        n = self._contagens.shape[0]
+        nb = 0 if self._base is None else self._base.shape[0]
+        ne = 0 if self._extras is None else self._extras.shape[0]
+        if self._base is None or n - nb > MAX_LINHAS_EXTRAS:
+            self._base, self._extras = self._pesar(self._contagens).tocsc(), None
+        elif nb + ne < n:
+            novas = self._pesar(self._contagens[nb + ne:])
+            self._extras = novas if self._extras is None else sparse.vstack([self._extras, novas], format="csr")
+        return self._base, self._extras
+
+    # ------------------------------------------------------------------
+    def adicionar(self, doc_id, texto):
+        """Inclui (ou substitui) uma questão."""
+        with self._lock:
+            self.remover(doc_id, gravar=False)
+            c = self._contar(texto)
+            self._df[c.indices] += 1
+            self._linha[str(doc_id)] = len(self._ids)
+            self._ids.append(str(doc_id)); self._textos.append(str(texto or ""))
+            self._pendentes.append(c)
+            self._marcar_sujo()
+
+    def remover(self, doc_id, gravar=True):
+        with self._lock:
+            linha = self._linha.pop(str(doc_id), None)
+            if linha is None: return
+            self._empilhar()
+            self._df[self._contagens[linha].indices] -= 1
+            self._ids[linha] = None; self._textos[linha] = ""
+            self._mortas.add(linha)
+            if gravar: self._marcar_sujo()
+
+    def reconstruir(self, docs):
+        """docs: iterável de (doc_id, texto). Substitui tudo e grava."""
+        with self._lock:
+            docs = [(str(i), str(t or "")) for i, t in docs]
+            self._ids = [i for i, _ in docs]; self._textos = [t for _, t in docs]
+            self._linha = {i: n for n, i in enumerate(self._ids)}
+            self._mortas = set()
+            c = self._vet.transform(self._textos).astype(np.float32).tocsr() if docs \
+                else sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+            c.data = 1.0 + np.log(c.data)
+            self._contagens, self._pendentes = c, []
+            self._df = np.bincount(c.indices, minlength=N_FEATURES).astype(np.int32)
+            self._recalcular_idf()
+            self.salvar()
+
+    def similares(self, texto, k=5):
+        """Top-k [(id, score, texto)] por similaridade de cosseno."""
+        with self._lock:
+            if not self.total or not str(texto or "").strip(): return []
+            base, extras = self._matrizes()
+            q = self._pesar(self._contar(texto))
+            # Produto só nas colunas (n-gramas) presentes na consulta
+            scores = base[:, q.indices] @ q.data
+            if extras is not None:
+                scores = np.concatenate([scores, (extras @ q.T).toarray().ravel()])
+            if self._mortas: scores[list(self._mortas)] = -1
+            k = min(k, self.total)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[i], float(scores[i]), self._textos[i]) for i in top if scores[i] > 0]
+
+    # ------------------------------------------------------------------
+    def _marcar_sujo(self):
+        self._sujo = True
+        if time.monotonic() - self._ultima_gravacao >= INTERVALO_GRAVACAO_S:
+            self.salvar()
+
+    def _removidas(self):
+        return len(self._ids) - self.total
+
+    def _compactar(self):
+        """Tira do disco/memória as linhas removidas."""
+        self._empilhar()
+        manter = [n for n, i in enumerate(self._ids) if i is not None]
+        self._contagens = self._contagens[manter]
+        self._ids = [self._ids[n] for n in manter]; self._textos = [self._textos[n] for n in manter]
+        self._linha = {i: n for n, i in enumerate(self._ids)}
+        self._mortas = set()
+        self._base = self._extras = None
+
+    def salvar(self):
+        with self._lock:
+            if self._removidas(): self._compactar()
+            self._empilhar()
+            pasta = os.path.dirname(self.arquivo)
+            if pasta: os.makedirs(pasta, exist_ok=True)
+            tmp = self.arquivo + ".tmp.npz"
+            c = self._contagens
+            np.savez_compressed(tmp, versao=FORMATO_VERSAO, data=c.data, indices=c.indices, indptr=c.indptr,
+                                ids=np.array(self._ids, dtype=str), textos=np.array(self._textos, dtype=str))
+            os.replace(tmp, self.arquivo)
+            self._sujo = False
+            self._ultima_gravacao = time.monotonic()
+
+    def carregar(self):
+        """Carrega o .npz (se existir). Retorna True se carregou."""
+        if not os.path.exists(self.arquivo): return False
+        with self._lock, np.load(self.arquivo) as z:
+            if int(z["versao"]) != FORMATO_VERSAO: return False
+            ids = [str(i) for i in z["ids"]]
+            self._contagens = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]),
+                                                shape=(len(ids), N_FEATURES), dtype=np.float32)
+            self._ids, self._textos = ids, [str(t) for t in z["textos"]]
+            self._linha = {i: n for n, i in enumerate(ids)}
+            self._mortas, self._pendentes = set(), []
+            self._df = np.bincount(self._contagens.indices, minlength=N_FEATURES).astype(np.int32)
+            self._recalcular_idf()
+            self._ultima_gravacao = time.monotonic()
+        return True
+
+# ==============================================================================
+# INSTÂNCIA DO PROCESSO
+# ==============================================================================
+_detector = None
+_lock_detector = threading.Lock()
+
+def obter_detector():
+    """Detector único do processo, carregado do disco na primeira chamada."""
+    global _detector
+    if _detector is None:
+        with _lock_detector:
+            if _detector is None:
+                d = DetectorDuplicidade()
+                try: d.carregar()
+                except Exception as e: print(f"[DUPLICIDADE] não foi possível carregar {d.arquivo}: {e}")
+                _detector = d
+                atexit.register(lambda: d._sujo and d.salvar())
+    return _detector
+
+def aquecer():
+    """Carrega o detector em segundo plano (chamado no início do app; idempotente)."""
+    if DISPONIVEL and _detector is None:
+        threading.Thread(target=obter_detector, daemon=True).start()
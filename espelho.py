@@ -0,0 +1,174 @@
+# main/espelho.py
+"""
+Espelho local (Parquet) das coleções usadas nos painéis analíticos.
+
+A primeira sincronização lê a coleção inteira (só as colunas do esquema) e
+grava um .parquet com tipos compactos (categorias, inteiros pequenos,
+float32, datas). As seguintes pedem ao Firestore só os documentos com
+atualizado_em maior que a marca d'água salva e os mesclam por id. Os
+painéis leem o DataFrame do disco/memória em vez de refazer streams.
+
+Remoções no banco não chegam por marca d'água: use sincronizar(completo=True)
+(ou o comando "sincronizar-espelho --completo" do manutencao.py).
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (motor do to_parquet/read_parquet)
+    DISPONIVEL = True
+except ImportError:
+    DISPONIVEL = False
+
+PASTA_PADRAO = os.environ.get("BJJ_ESPELHO_PASTA", os.path.join("dados", "analytics"))
+CAMPO_MARCA = "atualizado_em"
+INTERVALO_SYNC_S = 30       # no máximo uma sincronização por coleção a cada N segundos
+MARGEM_RELOGIO = timedelta(minutes=5)   # marca inicial quando nenhum doc tem atualizado_em
+FORMATO_VERSAO = 1
+
+# Esquemas: coluna -> tipo no DataFrame
+ESQUEMAS = {
+    "resultados": {
+        "usuario": "category", "usuario_id": "string", "faixa": "category",
+        "pontuacao": "float32", "acertos": "Int16", "total": "Int16", "aprovado": "boolean",
+        "codigo_verificacao": "string", "data": "datetime64[ns, UTC]", CAMPO_MARCA: "datetime64[ns, UTC]",
+    },
+}
+
+def _ts(v):
+    """Timestamp do Firestore / datetime / ISO -> datetime UTC (ou None)."""
+    if isinstance(v, str):
+        try: v = datetime.fromisoformat(v.replace('Z', ''))
+        except ValueError: return None
+    if not isinstance(v, datetime): return None
+    return v.replace(tzinfo=timezone.utc) if v.tzinfo is None else v.astimezone(timezone.utc)
+
+class EspelhoColecao:
+    def __init__(self, colecao, esquema, pasta=PASTA_PADRAO):
+        self.colecao = colecao
+        self.esquema = dict(esquema)
+        self.arquivo = os.path.join(pasta, f"{colecao}.parquet")
+        self.arquivo_meta = os.path.join(pasta, f"{colecao}.meta.json")
+        self._df = None
+        self._marca = None              # datetime UTC do último atualizado_em visto
+        self._ultima_sync = 0.0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Fonte (Firestore). Os benchmarks trocam estes dois métodos.
+    def _ler_tudo(self):
+        from database import get_db
+        q = get_db().collection(self.colecao).select(list(self.esquema))
+        for d in q.stream(): yield dict(d.to_dict() or {}, id=d.id)
+
+    def _ler_desde(self, marca):
+        from database import get_db
+        q = (get_db().collection(self.colecao).where(CAMPO_MARCA, ">", marca)
+             .order_by(CAMPO_MARCA).select(list(self.esquema)))
+        for d in q.stream(): yield dict(d.to_dict() or {}, id=d.id)
+
+    # ------------------------------------------------------------------
+    def _tipar(self, registros):
+        """Lista de dicts -> DataFrame com as colunas/tipos do esquema (índice = id)."""
+        df = pd.DataFrame.from_records(registros, columns=["id", *self.esquema])
+        for col, tipo in self.esquema.items():
+            if tipo.startswith("datetime64"):
+                # Timestamps do Firestore já chegam como datetime com fuso: conversão vetorizada
+                if isinstance(df[col].dtype, pd.DatetimeTZDtype): df[col] = df[col].dt.tz_convert("UTC").astype(tipo)
+                else: df[col] = pd.to_datetime(df[col].map(_ts), utc=True).astype(tipo)
+            elif tipo in ("Int16", "Int32", "float32"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(tipo)
+            elif tipo == "boolean":
+                df[col] = df[col].map(lambda v: v if isinstance(v, bool) else pd.NA).astype("boolean")
+            else:
+                df[col] = df[col].astype(tipo)
+        return df.set_index("id")
+
+    def _maior_marca(self, df):
+        if df.empty or df[CAMPO_MARCA].isna().all(): return self._marca
+        m = df[CAMPO_MARCA].max().to_pydatetime()
+        return m if self._marca is None or m > self._marca else self._marca
+
+    def _mesclar(self, novos):
+        """Upsert por id; categorias re-unidas para não virar object."""
+        if self._df is None or self._df.empty: return novos
+        base = self._df.drop(index=novos.index, errors="ignore")
+        for col, tipo in self.esquema.items():
+            if tipo == "category":
+                cats = base[col].cat.categories.union(novos[col].cat.categories)
+                base[col] = base[col].cat.set_categories(cats)
+                novos[col] = novos[col].cat.set_categories(cats)
+        return pd.concat([base, novos])
+
+    def sincronizar(self, completo=False):
+        """Traz as mudanças (ou tudo) e regrava o .parquet. Retorna nº de docs recebidos."""
+        with self._lock:
+            inicio = None
+            if self._df is None and not completo: self._carregar_disco()
+            if completo or self._df is None or self._marca is None:
+                inicio = datetime.now(timezone.utc) - MARGEM_RELOGIO
+                df = self._tipar(list(self._ler_tudo()))
+                self._marca = None
+                recebidos = len(df)
+            else:
+                novos = self._tipar(list(self._ler_desde(self._marca)))
+                recebidos = len(novos)
+                df = self._mesclar(novos) if recebidos else self._df
+            self._marca = self._maior_marca(df)
+            if self._marca is None: self._marca = inicio
+            self._df = df
+            if recebidos or not os.path.exists(self.arquivo): self._gravar()
+            self._ultima_sync = time.monotonic()
+            return recebidos
+
+    def dataframe(self, sincronizar=True):
+        """DataFrame atual (sincroniza antes se a última foi há mais de INTERVALO_SYNC_S)."""
+        if sincronizar and time.monotonic() - self._ultima_sync >= INTERVALO_SYNC_S:
+            try: self.sincronizar()
+            except Exception as e: print(f"[ESPELHO] {self.colecao}: sincronização falhou: {e}")
+        with self._lock:
+            if self._df is None: self._carregar_disco()
+            return (self._df if self._df is not None else self._tipar([])).reset_index()
+
+    # ------------------------------------------------------------------
+    def _gravar(self):
+        os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+        tmp = self.arquivo + ".tmp"
+        self._df.to_parquet(tmp, compression="zstd")
+        os.replace(tmp, self.arquivo)
+        with open(self.arquivo_meta + ".tmp", "w") as f:
+            json.dump({"versao": FORMATO_VERSAO, "marca": self._marca.isoformat() if self._marca else None,
+                       "linhas": len(self._df), "esquema": self.esquema}, f)
+        os.replace(self.arquivo_meta + ".tmp", self.arquivo_meta)
+
+    def _carregar_disco(self):
+        if not (os.path.exists(self.arquivo) and os.path.exists(self.arquivo_meta)): return False
+        with open(self.arquivo_meta) as f: meta = json.load(f)
+        if meta.get("versao") != FORMATO_VERSAO or meta.get("esquema") != self.esquema: return False
+        self._df = pd.read_parquet(self.arquivo)
+        self._marca = datetime.fromisoformat(meta["marca"]) if meta.get("marca") else None
+        return True
+
+# ==============================================================================
+# INSTÂNCIAS DO PROCESSO
+# ==============================================================================
+_espelhos = {}
+_lock_espelhos = threading.Lock()
+
+def obter(colecao):
+    with _lock_espelhos:
+        if colecao not in _espelhos:
+            _espelhos[colecao] = EspelhoColecao(colecao, ESQUEMAS[colecao])
+        return _espelhos[colecao]
+
+def dataframe(colecao):
+    """DataFrame da coleção pelo espelho local (ou leitura direta sem pyarrow)."""
+    if not DISPONIVEL:
+        from database import get_db
+        return pd.DataFrame([dict(d.to_dict() or {}, id=d.id) for d in get_db().collection(colecao).stream()])
+    return obter(colecao).dataframe()
@@ -0,0 +1,171 @@
+# main/importacao.py
+"""
+Importação em massa de questões (CSV/XLSX).
+
+- Leitura em fluxo, linha a linha (csv / openpyxl read_only), sem DataFrame.
+- Validação por linha com relatório de erros (linha, motivo).
+- Duplicadas descartadas: dentro do arquivo e contra o banco (enunciado
+  normalizado; opcionalmente também por similaridade, via duplicidade.py).
+- Gravação em batches de até 500 escritas. O checkpoint
+  (importacoes/{hash do arquivo}) vai no mesmo batch das questões, e cada
+  questão tem id determinístico: rodar de novo o mesmo arquivo retoma de onde
+  parou sem duplicar.
+"""
+import csv
+import hashlib
+import io
+import re
+import time
+
+from firebase_admin import firestore
+
+from busca import normalizar_texto
+from database import get_db
+
+IMPORTACOES_COLLECTION = "importacoes"
+MAX_ESCRITAS_BATCH = 500
+QUESTOES_POR_BATCH = MAX_ESCRITAS_BATCH - 1   # +1 escrita do checkpoint
+
+COLUNAS_OBRIGATORIAS = ("pergunta", "alt_a", "alt_b", "correta")
+NIVEIS_VALIDOS = (1, 2, 3, 4)
+LIMIAR_SIMILAR = 0.9
+
+# ==============================================================================
+# LEITURA EM FLUXO
+# ==============================================================================
+def _linhas_csv(conteudo):
+    texto = io.TextIOWrapper(io.BytesIO(conteudo), encoding="utf-8-sig", newline="")
+    amostra = texto.read(4096); texto.seek(0)
+    delim = ";" if amostra.count(";") >= amostra.count(",") else ","
+    yield from csv.DictReader(texto, delimiter=delim)
+
+def _linhas_xlsx(conteudo):
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        cab = [str(c or "").strip() for c in next(linhas, [])]
+        for valores in linhas:
+            if valores is None or all(v is None for v in valores): continue
+            yield dict(zip(cab, valores))
+    finally:
+        wb.close()
+
+def ler_linhas(conteudo, nome_arquivo):
+    """Gera dicts {coluna: valor} do arquivo (colunas em minúsculas)."""
+    leitor = _linhas_xlsx if str(nome_arquivo).lower().endswith(".xlsx") else _linhas_csv
+    for linha in leitor(conteudo):
+        yield {str(k or "").strip().lower(): v for k, v in linha.items()}
+
+# ==============================================================================
+# VALIDAÇÃO
+# ==============================================================================
+def _txt(v):
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    return str(v).strip()
+
+def chave_enunciado(pergunta):
+    """Enunciado normalizado (sem acento, caixa, pontuação ou espaços extras)."""
+    return " ".join(re.findall(r"[a-z0-9]+", normalizar_texto(pergunta)))
+
+def validar_linha(linha):
+    """(questao_dict, None) se válida; (None, motivo) se não."""
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if not _txt(linha.get(c))]
+    if faltando: return None, f"campos obrigatórios vazios: {', '.join(faltando)}"
+
+    correta = _txt(linha.get("correta")).upper()
+    if correta not in ("A", "B", "C", "D"): return None, f"correta inválida: '{correta}'"
+    alts = {l: _txt(linha.get(f"alt_{l.lower()}")) for l in "ABCD"}
+    if not alts[correta]: return None, f"alternativa correta ({correta}) está vazia"
+
+    try: dif = int(float(_txt(linha.get("dificuldade")) or 1))
+    except ValueError: return None, f"dificuldade inválida: '{_txt(linha.get('dificuldade'))}'"
+    if dif not in NIVEIS_VALIDOS: return None, f"dificuldade fora de 1-4: {dif}"
+
+    return {
+        "pergunta": _txt(linha.get("pergunta")),
+        "alternativas": alts,
+        "resposta_correta": correta,
+        "dificuldade": dif,
+        "categoria": _txt(linha.get("categoria")) or "Geral",
+    }, None
+
+# ==============================================================================
+# MOTOR
+# ==============================================================================
+def _chaves_do_banco(db):
+    """Enunciados normalizados de todas as questões (só o campo pergunta)."""
+    return {chave_enunciado((d.to_dict() or {}).get("pergunta", ""))
+            for d in db.collection("questoes").select(["pergunta"]).stream()}
+
+def importar_questoes(conteudo, nome_arquivo, autor, ao_progresso=None, verificar_similares=False, detector=None):
+    """
+    Importa o arquivo (bytes). Retorna o relatório:
+      {"importacao_id", "lidas", "gravadas", "retomadas", "duplicadas",
+       "erros": [(linha, motivo)], "segundos", "linhas_por_s"}
+    ao_progresso(relatorio) é chamado a cada batch gravado.
+    """
+    db = get_db()
+    inicio = time.perf_counter()
+    imp_id = hashlib.sha256(conteudo).hexdigest()[:20]
+    ckpt_ref = db.collection(IMPORTACOES_COLLECTION).document(imp_id)
+    ckpt = ckpt_ref.get()
+    ja_feitas = int((ckpt.to_dict() or {}).get("linhas_processadas", 0)) if ckpt.exists else 0
+
+    rel = {"importacao_id": imp_id, "lidas": 0, "gravadas": 0, "retomadas": ja_feitas,
+           "duplicadas": [], "erros": [], "segundos": 0.0, "linhas_por_s": 0.0}
+    vistas = set()
+    no_banco = _chaves_do_banco(db)
+    questoes_ref = db.collection("questoes")
+    lote = []
+
+    def _gravar(ate_linha, final=False):
+        batch = db.batch()
+        for n, q in lote:
+            batch.set(questoes_ref.document(f"imp_{imp_id}_{n}"), q)
+        batch.set(ckpt_ref, {
+            "arquivo": nome_arquivo, "autor": autor, "linhas_processadas": ate_linha,
+            "status": "concluida" if final else "em_andamento",
+            "atualizado_em": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        batch.commit()
+        if detector is not None:
+            for n, q in lote: detector.adicionar(f"imp_{imp_id}_{n}", q["pergunta"])
+        rel["gravadas"] += len(lote)
+        lote.clear()
+        _medir()
+        if ao_progresso: ao_progresso(rel)
+
+    def _medir():
+        rel["segundos"] = time.perf_counter() - inicio
+        rel["linhas_por_s"] = rel["lidas"] / rel["segundos"] if rel["segundos"] else 0.0
+
+    n = 1  # nº da linha no arquivo (1 = cabeçalho)
+    for linha in ler_linhas(conteudo, nome_arquivo):
+        n += 1
+        rel["lidas"] += 1
+        q, erro = validar_linha(linha)
+        if erro:
+            rel["erros"].append((n, erro)); continue
+
+        chave = chave_enunciado(q["pergunta"])
+        if chave in vistas:
+            rel["duplicadas"].append((n, "repetida no arquivo")); continue
+        vistas.add(chave)
+        if n <= ja_feitas: continue  # gravada numa execução anterior
+        if chave in no_banco:
+            rel["duplicadas"].append((n, "já existe no banco")); continue
+        if verificar_similares and detector is not None:
+            sim = detector.similares(q["pergunta"], k=1)
+            if sim and sim[0][1] >= LIMIAR_SIMILAR:
+                rel["duplicadas"].append((n, f"similar a '{sim[0][2][:60]}' ({sim[0][1]:.0%})")); continue
+
+        lote.append((n, {**q, "status": "aprovada", "criado_por": f"{autor} (Import)",
+                         "importacao_id": imp_id, "data_criacao": firestore.SERVER_TIMESTAMP}))
+        if len(lote) >= QUESTOES_POR_BATCH:
+            _gravar(n)
+
+    _gravar(n, final=True)
+    _medir()
+    return rel
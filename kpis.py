@@ -0,0 +1,80 @@
+# main/kpis.py
+"""
+Indicadores numéricos por consultas de agregação do Firestore.
+
+count() e sum() rodam no servidor: uma ida e volta por métrica e nenhum
+documento lido/baixado. Os valores ficam num cache do processo por
+TTL_S segundos (compartilhado entre as sessões). Se a agregação não for
+suportada (cliente antigo, emulador), cai para uma varredura só com os
+campos necessários.
+"""
+import threading
+import time
+
+from database import get_db
+
+TTL_S = 60
+
+_cache = {}                 # chave -> (expira_em, valor)
+_lock = threading.Lock()
+
+def _query(colecao, filtros):
+    q = get_db().collection(colecao)
+    for campo, op, valor in filtros:
+        q = q.where(campo, op, valor)
+    return q
+
+def _em_cache(chave, calcular):
+    agora = time.monotonic()
+    with _lock:
+        achado = _cache.get(chave)
+        if achado and achado[0] > agora: return achado[1]
+    valor = calcular()
+    with _lock:
+        _cache[chave] = (agora + TTL_S, valor)
+    return valor
+
+def contar(colecao, filtros=()):
+    """Nº de documentos (count() no servidor)."""
+    filtros = tuple(filtros)
+    def _calc():
+        q = _query(colecao, filtros)
+        try: return int(q.count(alias="n").get()[0][0].value)
+        except Exception as e:
+            print(f"[KPIS] count() indisponível em {colecao}: {e}")
+            return sum(1 for _ in q.select([]).stream())
+    return _em_cache(("count", colecao, filtros), _calc)
+
+def somar(colecao, campo, filtros=()):
+    """Soma de um campo numérico (sum() no servidor)."""
+    filtros = tuple(filtros)
+    def _calc():
+        q = _query(colecao, filtros)
+        try: return float(q.sum(campo, alias="s").get()[0][0].value or 0)
+        except Exception as e:
+            print(f"[KPIS] sum() indisponível em {colecao}.{campo}: {e}")
+            total = 0.0
+            for d in q.select([campo]).stream():
+                v = (d.to_dict() or {}).get(campo)
+                if isinstance(v, (int, float)) and not isinstance(v, bool): total += v
+            return total
+    return _em_cache(("sum", colecao, campo, filtros), _calc)
+
+def limpar_cache():
+    with _lock:
+        _cache.clear()
+
+def kpis_topo():
+    """Métricas da linha de topo do painel do administrador."""
+    exames = contar('resultados')
+    aprovados = contar('resultados', [('aprovado', '==', True)])
+    return {
+        "usuarios": contar('usuarios'),
+        "professores": contar('usuarios', [('tipo_usuario', '==', 'professor')]),
+        "questoes": contar('questoes'),
+        "equipes": contar('equipes'),
+        "exames": exames,
+        "aprovados": aprovados,
+        "taxa_aprovacao": (aprovados / exames * 100) if exames else 0.0,
+        "nota_media": (somar('resultados', 'pontuacao') / exames) if exames else 0.0,
+    }
@@ -0,0 +1,200 @@
+# main/manutencao.py
+"""
+Comandos de manutenção do banco (rodar fora do Streamlit).
+
+Uso (na raiz do projeto, com .streamlit/secrets.toml):
+    python manutencao.py reconciliar-aulas [curso_id ...]
+    python manutencao.py migrar-progresso [--aplicar]
+    python manutencao.py reconciliar-saldos [professor_id ...]
+    python manutencao.py reconstruir-duplicidade
+    python manutencao.py reconstruir-estatisticas
+    python manutencao.py rollup-kpis [--data AAAA-MM-DD] [--dias N]
+    python manutencao.py sincronizar-espelho [--completo] [colecao ...]
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from database import get_db
+import espelho
+import rollups
+import utils
+
+# ==============================================================================
+# CONTADOR DE AULAS ATIVAS
+# ==============================================================================
+def cmd_reconciliar_aulas(args):
+    ids = args.curso_ids or [c.id for c in get_db().collection('cursos').stream()]
+    for curso_id in ids:
+        total = utils.reconciliar_total_aulas_curso(curso_id, forcar=True)
+        print(f"{curso_id}: total_aulas_ativas={total}")
+    print(f"{len(ids)} curso(s) reconciliado(s).")
+
+# ==============================================================================
+# PROGRESSO: IDs DETERMINÍSTICOS ({usuario_id}_{curso_id})
+# ==============================================================================
+def _mesclar_progressos(usuario_id, curso_id, docs):
+    """Une vários docs de progresso do mesmo (aluno, curso) em um só."""
+    def _ts(d):
+        t = d.get("atualizado_em") or d.get("criado_em")
+        return t.timestamp() if hasattr(t, "timestamp") else 0
+
+    docs = sorted(docs, key=_ts)
+    aulas = set()
+    for d in docs: aulas.update(str(a) for a in d.get("aulas_concluidas", []) or [])
+
+    total = utils.obter_total_aulas_ativas(curso_id)
+    progresso = int((len(aulas) / total) * 100) if total > 0 else 0
+    progresso = max([progresso] + [int(d.get("progresso_percentual", 0) or 0) for d in docs])
+    criados = [d.get("criado_em") for d in docs if d.get("criado_em")]
+
+    return {
+        "usuario_id": str(usuario_id),
+        "curso_id": str(curso_id),
+        "aulas_concluidas": sorted(aulas),
+        "progresso_percentual": min(progresso, 100),
+        "ultima_aula_id": next((d.get("ultima_aula_id") for d in reversed(docs) if d.get("ultima_aula_id")), ""),
+        "concluido": progresso >= 100 or any(d.get("concluido") for d in docs),
+        "criado_em": criados[0] if criados else utils.firestore.SERVER_TIMESTAMP,
+        "atualizado_em": utils.firestore.SERVER_TIMESTAMP,
+    }
+
+def cmd_migrar_progresso(args):
+    db = get_db()
+    col = db.collection(utils.PROGRESSO_COLLECTION)
+
+    grupos = defaultdict(list)
+    for snap in col.stream():
+        d = snap.to_dict() or {}
+        if not d.get("usuario_id") or not d.get("curso_id"): continue
+        grupos[(str(d["usuario_id"]), str(d["curso_id"]))].append((snap.id, d))
+
+    pendentes = {k: v for k, v in grupos.items()
+                 if len(v) > 1 or v[0][0] != utils.progresso_doc_id(*k)}
+    duplicados = sum(1 for v in pendentes.values() if len(v) > 1)
+    print(f"{len(grupos)} par(es) aluno/curso; {len(pendentes)} a migrar ({duplicados} com duplicatas).")
+    if not args.aplicar:
+        print("Simulação. Use --aplicar para gravar.")
+        return
+
+    batch, ops = db.batch(), 0
+    for (usuario_id, curso_id), docs in pendentes.items():
+        novo_id = utils.progresso_doc_id(usuario_id, curso_id)
+        batch.set(col.document(novo_id), _mesclar_progressos(usuario_id, curso_id, [d for _, d in docs]))
+        ops += 1
+        for doc_id, _ in docs:
+            if doc_id != novo_id:
+                batch.delete(col.document(doc_id)); ops += 1
+        if ops >= 400:
+            batch.commit(); batch, ops = db.batch(), 0
+    if ops: batch.commit()
+    print(f"{len(pendentes)} progresso(s) migrado(s).")
+
+# ==============================================================================
+# SALDOS DOS PROFESSORES
+# ==============================================================================
+def cmd_reconciliar_saldos(args):
+    ids = args.professor_ids or sorted({(f.to_dict() or {}).get('professor_id')
+                                        for f in get_db().collection('financeiro').stream()} - {None})
+    for professor_id in ids:
+        total = utils.reconciliar_saldo_professor(professor_id)
+        print(f"{professor_id}: saldo={total['saldo']:.2f} vendas={total['qtd_vendas']}")
+    print(f"{len(ids)} professor(es) reconciliado(s).")
+
+# ==============================================================================
+# DUPLICIDADE DE QUESTÕES
+# ==============================================================================
+def cmd_reconstruir_duplicidade(args):
+    total = utils.reconstruir_indice_duplicidade()
+    print(f"{total} questão(ões) na matriz de duplicidade.")
+
+# ==============================================================================
+# ESTATÍSTICAS POR QUESTÃO
+# ==============================================================================
+def cmd_reconstruir_estatisticas(args):
+    total = utils.reconstruir_estatisticas_questoes()
+    print(f"{total} questão(ões) com estatísticas recalculadas a partir de resultados.")
+
+# ==============================================================================
+# VERIFICAÇÃO DE CERTIFICADOS
+# ==============================================================================
+def cmd_indexar_certificados(args):
+    total = utils.reconstruir_indice_certificados()
+    print(f"{total} certificado(s) em {utils.CODIGOS_CERTIFICADO_COLLECTION}.")
+
+# ==============================================================================
+# MÍDIAS ENDEREÇADAS POR CONTEÚDO
+# ==============================================================================
+def cmd_limpar_midias(args):
+    orfas = utils.limpar_midias_orfas(aplicar=args.aplicar)
+    for sha, caminho, tamanho in orfas: print(f"{caminho}  {tamanho / 1024:.0f} KB")
+    acao = "apagada(s)" if args.aplicar else "sem referência (use --aplicar para apagar)"
+    print(f"{len(orfas)} mídia(s) {acao}, {sum(t for _, _, t in orfas) / 1024 / 1024:.1f} MB.")
+
+# ==============================================================================
+# SNAPSHOTS DIÁRIOS DO PAINEL (kpis_diarios)
+# ==============================================================================
+def cmd_rollup_kpis(args):
+    fim = date.fromisoformat(args.data) if args.data else datetime.now(timezone.utc).date() - timedelta(days=1)
+    for i in reversed(range(args.dias)):
+        dia = fim - timedelta(days=i)
+        t = rollups.gravar_rollup(dia)["totais"]
+        print(f"{dia}: usuarios={t.get('usuarios', 0)} exames={t.get('exames', 0)} questoes={t.get('questoes', 0)}")
+
+# ==============================================================================
+# ESPELHO ANALÍTICO (PARQUET)
+# ==============================================================================
+def cmd_sincronizar_espelho(args):
+    for colecao in args.colecoes or list(espelho.ESQUEMAS):
+        e = espelho.obter(colecao)
+        n = e.sincronizar(completo=args.completo)
+        print(f"{colecao}: {n} doc(s) recebido(s), marca={e._marca}")
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do BJJ Digital")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("reconciliar-aulas", help="Recalcula total_aulas_ativas dos cursos")
+    p.add_argument("curso_ids", nargs="*", help="Cursos específicos (padrão: todos)")
+    p.set_defaults(func=cmd_reconciliar_aulas)
+
+    p = sub.add_parser("migrar-progresso", help="Move progresso_curso para IDs {usuario_id}_{curso_id}, unindo duplicatas")
+    p.add_argument("--aplicar", action="store_true", help="Grava (sem isso só simula)")
+    p.set_defaults(func=cmd_migrar_progresso)
+
+    p = sub.add_parser("reconciliar-saldos", help="Recalcula saldos_professores a partir de financeiro/saques")
+    p.add_argument("professor_ids", nargs="*", help="Professores específicos (padrão: todos com vendas)")
+    p.set_defaults(func=cmd_reconciliar_saldos)
+
+    p = sub.add_parser("reconstruir-duplicidade", help="Regrava a matriz TF-IDF de duplicidade a partir de questoes")
+    p.set_defaults(func=cmd_reconstruir_duplicidade)
+
+    p = sub.add_parser("reconstruir-estatisticas", help="Refaz estatisticas_questoes a partir do histórico de resultados")
+    p.set_defaults(func=cmd_reconstruir_estatisticas)
+
+    p = sub.add_parser("indexar-certificados", help="Grava codigos_certificado a partir dos resultados aprovados")
+    p.set_defaults(func=cmd_indexar_certificados)
+
+    p = sub.add_parser("limpar-midias", help="Apaga do Storage as mídias com refs <= 0 em midias")
+    p.add_argument("--aplicar", action="store_true", help="Apaga (sem isso só lista)")
+    p.set_defaults(func=cmd_limpar_midias)
+
+    p = sub.add_parser("rollup-kpis", help="Gera/regrava os snapshots diários do painel do administrador")
+    p.add_argument("--data", help="Último dia (AAAA-MM-DD, padrão: ontem UTC)")
+    p.add_argument("--dias", type=int, default=1, help="Quantos dias até --data (padrão: 1)")
+    p.set_defaults(func=cmd_rollup_kpis)
+
+    p = sub.add_parser("sincronizar-espelho", help="Atualiza os .parquet do espelho analítico (dados/analytics)")
+    p.add_argument("colecoes", nargs="*", help="Coleções (padrão: todas do esquema)")
+    p.add_argument("--completo", action="store_true", help="Relê tudo (aplica remoções)")
+    p.set_defaults(func=cmd_sincronizar_espelho)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# main/replica.py
+"""
+Réplica em memória das coleções pequenas e muito lidas.
+
+config_exames, equipes, questões aprovadas e vínculos ativos de professores
+mudam pouco e são lidos em quase toda página. Cada uma é mantida no processo
+por um listener on_snapshot do Firestore; as telas consultam a cópia local.
+Enquanto a réplica não recebeu o primeiro snapshot (ou o listener caiu), a
+consulta cai para uma leitura direta no banco.
+"""
+import threading
+import time
+from database import get_db, obter_carregador
+from busca import IndiceInvertido, casa_consulta
+from sorteio import PoolsQuestoes
+
+# Estados da réplica
+INICIANDO = "iniciando"
+PRONTA = "pronta"
+OBSOLETA = "obsoleta"
+
+# Tempo mínimo entre tentativas de religar um listener que caiu
+INTERVALO_RELIGAR_S = 30
+
+class ReplicaColecao:
+    def __init__(self, nome, colecao, filtros=(), indice=None, pools=None):
+        self.nome = nome
+        self.colecao = colecao
+        self.filtros = tuple(filtros)  # ((campo, op, valor), ...)
+        # indice/pools: fábricas opcionais (IndiceInvertido para busca textual,
+        # PoolsQuestoes para sorteio); cada 1º snapshot monta objetos novos
+        self._criar_indice = indice
+        self._criar_pools = pools
+        self.indice = indice() if indice else None
+        self.pools = pools() if pools else None
+        self._docs = {}
+        self._sincronizado = False     # primeiro snapshot do listener atual já chegou?
+        self._lock = threading.Lock()
+        self._watch = None
+        self._ultima_tentativa = 0.0
+        self.estado = INICIANDO
+        self.atualizado_em = None
+        self.leituras_diretas = 0
+
+    def _query(self):
+        q = get_db().collection(self.colecao)
+        for campo, op, valor in self.filtros:
+            q = q.where(campo, op, valor)
+        return q
+
+    @staticmethod
+    def _montar(criar, docs):
+        if criar is None: return None
+        derivado = criar()
+        derivado.reconstruir(docs.items())
+        return derivado
+
+    def _ao_receber(self, docs, changes, read_time):
+        novos = {d.id: d.to_dict() or {} for d in docs}
+        if not self._sincronizado:
+            # 1º snapshot de um listener: índice/pools novos montados fora do
+            # lock e trocados junto com os documentos
+            indice, pools = self._montar(self._criar_indice, novos), self._montar(self._criar_pools, novos)
+            with self._lock:
+                self._docs, self.indice, self.pools = novos, indice, pools
+                self._marcar_pronta()
+            return
+        # Depois, só as mudanças; buscar/sortear consultam sob o mesmo lock
+        with self._lock:
+            for derivado in (self.indice, self.pools):
+                if derivado is None: continue
+                for ch in changes:
+                    if ch.type.name == "REMOVED": derivado.remover(ch.document.id)
+                    else: derivado.adicionar(ch.document.id, ch.document.to_dict() or {})
+            self._docs = novos
+            self._marcar_pronta()
+
+    def _marcar_pronta(self):
+        self._sincronizado = True
+        self.estado = PRONTA
+        self.atualizado_em = time.time()
+
+    def iniciar(self):
+        """Liga (ou religa) o listener. Seguro para chamar várias vezes."""
+        with self._lock:
+            if self._watch is not None and self._watch.is_active: return
+            if time.monotonic() - self._ultima_tentativa < INTERVALO_RELIGAR_S: return
+            self._ultima_tentativa = time.monotonic()
+        try:
+            self._sincronizado = False
+            self._watch = self._query().on_snapshot(self._ao_receber)
+        except Exception as e:
+            print(f"[REPLICA] {self.nome}: não foi possível ligar listener: {e}")
+            self.estado = OBSOLETA
+
+    def parar(self):
+        if self._watch is not None:
+            try: self._watch.unsubscribe()
+            except Exception: pass
+        self._watch = None
+        self.estado = OBSOLETA
+
+    def reiniciar(self):
+        """Desliga e religa já (ex.: depois de trocar a conexão), sem esperar o intervalo."""
+        if self._watch is None: return     # nunca ligada: liga sozinha no próximo uso
+        self.parar()
+        self._ultima_tentativa = 0.0
+        self.iniciar()
+
+    def pronta(self):
+        """True se a cópia local está válida (listener vivo e já sincronizado)."""
+        if self._watch is None or not self._watch.is_active:
+            if self.estado == PRONTA: self.estado = OBSOLETA
+            self.iniciar()
+        return self.estado == PRONTA
+
+    def listar(self):
+        """Lista de dicts (cópias) com 'id'. Lê direto do banco se não estiver pronta."""
+        if self.pronta():
+            with self._lock:
+                return [dict(d, id=doc_id) for doc_id, d in self._docs.items()]
+        self.leituras_diretas += 1
+        try:
+            return [dict(d.to_dict() or {}, id=d.id) for d in self._query().stream()]
+        except Exception as e:
+            print(f"[REPLICA] {self.nome}: leitura direta falhou: {e}")
+            return []
+
+    def documento(self, doc_id):
+        """Dados de um documento (cópia com 'id') ou None se não está no conjunto."""
+        if not doc_id: return None
+        if self.pronta():
+            with self._lock:
+                d = self._docs.get(str(doc_id))
+            return dict(d, id=str(doc_id)) if d is not None else None
+        # Fallback: lê só o documento e confere os filtros
+        self.leituras_diretas += 1
+        try:
+            snap = get_db().collection(self.colecao).document(str(doc_id)).get()
+        except Exception as e:
+            print(f"[REPLICA] {self.nome}: leitura direta falhou: {e}")
+            return None
+        if not snap.exists: return None
+        d = snap.to_dict() or {}
+        if not self._no_conjunto(d): return None
+        return dict(d, id=snap.id)
+
+    def documentos(self, ids):
+        """
+        {id: cópia com 'id' ou None} de vários documentos, na ordem dos ids.
+        Sem réplica pronta, uma leitura em lote (carregador do rerun).
+        """
+        ids = [str(i) for i in ids if i]
+        if self.pronta():
+            with self._lock:
+                return {i: dict(self._docs[i], id=i) if i in self._docs else None for i in ids}
+        self.leituras_diretas += 1
+        lidos = obter_carregador().obter_muitos(self.colecao, ids)
+        return {i: dict(d, id=i) if d is not None and self._no_conjunto(d) else None
+                for i, d in ((i, lidos.get(i)) for i in ids)}
+
+    def _no_conjunto(self, d):
+        # Filtros da réplica são todos de igualdade
+        return all(d.get(campo) == valor for campo, _, valor in self.filtros)
+
+    def filtrar(self, **campos):
+        """Documentos cujos campos batem exatamente com os valores informados."""
+        return [d for d in self.listar() if all(d.get(k) == v for k, v in campos.items())]
+
+    def buscar(self, consulta):
+        """
+        Documentos que casam com a consulta (termos por prefixo, sem acento, E).
+        Consulta vazia -> todos. Usa o índice quando a réplica está pronta.
+        """
+        if self.indice is not None and self.pronta():
+            with self._lock:
+                ids = self.indice.buscar(consulta)
+                if ids is not None:
+                    return [dict(self._docs[i], id=i) for i in sorted(ids) if i in self._docs]
+            return self.listar()
+        return [d for d in self.listar() if casa_consulta(consulta, d)]
+
+    def sortear(self, total=10, por_nivel=None, por_tema=None):
+        """
+        Documentos sorteados para um exame (cópias com 'id', na ordem do sorteio;
+        cotas por tema/nível, ver PoolsQuestoes.sortear). Sem réplica pronta,
+        monta pools temporários a partir da leitura direta e devolve os
+        documentos já lidos nela.
+        """
+        if self.pools is not None and self.pronta():
+            with self._lock:
+                ids = self.pools.sortear(total, por_nivel, por_tema)
+                return [dict(self._docs[i], id=i) for i in ids if i in self._docs]
+        lidos = {d["id"]: d for d in self.listar()}
+        temp = PoolsQuestoes()
+        temp.reconstruir(lidos.items())
+        return [lidos[i] for i in temp.sortear(total, por_nivel, por_tema) if i in lidos]
+
+    def resumo(self):
+        return {"estado": self.estado, "docs": len(self._docs),
+                "atualizado_em": self.atualizado_em, "leituras_diretas": self.leituras_diretas}
+
+# ==============================================================================
+# REGISTRO DAS RÉPLICAS (UM POR PROCESSO)
+# ==============================================================================
+_REPLICAS = {
+    "config_exames": ReplicaColecao("config_exames", "config_exames"),
+    "equipes": ReplicaColecao("equipes", "equipes"),
+    "questoes_aprovadas": ReplicaColecao("questoes_aprovadas", "questoes", [("status", "==", "aprovada")],
+                                         indice=IndiceInvertido, pools=PoolsQuestoes),
+    "professores_ativos": ReplicaColecao("professores_ativos", "professores", [("status_vinculo", "==", "ativo")]),
+}
+
+def obter(nome):
+    return _REPLICAS[nome]
+
+def listar(nome):
+    return _REPLICAS[nome].listar()
+
+def documento(nome, doc_id):
+    return _REPLICAS[nome].documento(doc_id)
+
+def documentos(nome, ids):
+    return _REPLICAS[nome].documentos(ids)
+
+def filtrar(nome, **campos):
+    return _REPLICAS[nome].filtrar(**campos)
+
+def buscar(nome, consulta):
+    return _REPLICAS[nome].buscar(consulta)
+
+def sortear(nome, total=10, por_nivel=None, por_tema=None):
+    return _REPLICAS[nome].sortear(total, por_nivel, por_tema)
+
+def iniciar_todas():
+    for r in _REPLICAS.values(): r.iniciar()
+
+def reiniciar_todas():
+    for r in _REPLICAS.values(): r.reiniciar()
+
+def estado():
+    return {nome: r.resumo() for nome, r in _REPLICAS.items()}
@@ -0,0 +1,175 @@
+# main/rollups.py
+"""
+Snapshots diários dos indicadores do painel do administrador.
+
+kpis_diarios/{AAAA-MM-DD} guarda, de forma compacta, o estado ao fim daquele
+dia (UTC): totais, cadastros por mês e perfil, resultados de exames,
+distribuição por sexo e por faixa, maiores equipes e contribuidores de
+questões. O painel lê o último snapshot e soma só o que foi criado depois
+(consultas por data de criação), em vez de varrer seis coleções inteiras.
+
+Recalcular um dia regrava o mesmo documento (idempotente). Para datas
+passadas, usuários/resultados/questões criados depois do dia ficam de fora;
+equipes, vínculos e campos como faixa/sexo refletem o estado atual.
+"""
+from collections import Counter
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+from firebase_admin import firestore
+
+from database import get_db
+
+ROLLUPS_COLLECTION = "kpis_diarios"
+TOP_EQUIPES = 10
+
+# ==============================================================================
+# AUXILIARES
+# ==============================================================================
+def _para_datetime(v):
+    """Timestamp do Firestore / datetime / ISO -> datetime UTC (ou None)."""
+    if v is None: return None
+    if isinstance(v, str):
+        try: v = datetime.fromisoformat(v.replace('Z', ''))
+        except ValueError: return None
+    if not isinstance(v, datetime): return None
+    return v.replace(tzinfo=timezone.utc) if v.tzinfo is None else v.astimezone(timezone.utc)
+
+def corte_do_dia(dia):
+    """Fim do dia (início do seguinte), em UTC."""
+    return datetime.combine(dia + timedelta(days=1), dtime(0, 0), tzinfo=timezone.utc)
+
+def _autor(criado_por):
+    return str(criado_por).split('(')[0].strip() if criado_por else "Desconhecido"
+
+class _Acumulador:
+    """Contadores em memória; vira/volta do formato gravado (listas de mapas)."""
+    def __init__(self):
+        self.totais = Counter()
+        self.cadastros = Counter()      # (AAAA-MM, tipo)
+        self.sexo = Counter()           # (tipo, sexo)
+        self.faixas = Counter()         # faixa (só alunos)
+        self.contribuidores = Counter() # autor
+        self.equipes = []
+
+    def usuario(self, d):
+        tipo = d.get('tipo_usuario')
+        self.totais['usuarios'] += 1
+        if tipo == 'aluno': self.totais['alunos'] += 1
+        elif tipo == 'professor': self.totais['professores'] += 1
+        criado = _para_datetime(d.get('data_criacao'))
+        if criado and tipo in ('aluno', 'professor'):
+            self.cadastros[(criado.strftime('%Y-%m'), tipo)] += 1
+        if d.get('sexo'): self.sexo[(tipo or '-', d['sexo'])] += 1
+        if tipo == 'aluno' and d.get('faixa_atual'): self.faixas[d['faixa_atual']] += 1
+
+    def resultado(self, d):
+        self.totais['exames'] += 1
+        if d.get('aprovado') is True: self.totais['aprovados'] += 1
+
+    def questao(self, d):
+        self.totais['questoes'] += 1
+        self.contribuidores[_autor(d.get('criado_por'))] += 1
+
+    def para_doc(self):
+        return {
+            "totais": dict(self.totais),
+            "cadastros_mensais": [{"mes": m, "tipo": t, "qtd": n} for (m, t), n in sorted(self.cadastros.items())],
+            "sexo": [{"tipo": t, "sexo": s, "qtd": n} for (t, s), n in self.sexo.items()],
+            "faixas_alunos": [{"faixa": f, "qtd": n} for f, n in self.faixas.most_common()],
+            "contribuidores": [{"autor": a, "qtd": n} for a, n in self.contribuidores.most_common()],
+            "equipes_top": self.equipes,
+        }
+
+    @classmethod
+    def de_doc(cls, doc):
+        a = cls()
+        a.totais.update(doc.get('totais', {}))
+        a.cadastros.update({(i['mes'], i['tipo']): i['qtd'] for i in doc.get('cadastros_mensais', [])})
+        a.sexo.update({(i['tipo'], i['sexo']): i['qtd'] for i in doc.get('sexo', [])})
+        a.faixas.update({i['faixa']: i['qtd'] for i in doc.get('faixas_alunos', [])})
+        a.contribuidores.update({i['autor']: i['qtd'] for i in doc.get('contribuidores', [])})
+        a.equipes = list(doc.get('equipes_top', []))
+        return a
+
+    def somar(self, outro):
+        for nome in ('totais', 'cadastros', 'sexo', 'faixas', 'contribuidores'):
+            getattr(self, nome).update(getattr(outro, nome))
+
+# ==============================================================================
+# CÁLCULO E GRAVAÇÃO
+# ==============================================================================
+CAMPOS_USUARIO = ['tipo_usuario', 'sexo', 'faixa_atual', 'data_criacao']
+CAMPOS_RESULTADO = ['aprovado', 'data']
+CAMPOS_QUESTAO = ['criado_por', 'data_criacao']
+
+def _antes(d, campo, corte):
+    t = _para_datetime(d.get(campo))
+    return t is None or t < corte
+
+def _equipes_top(db):
+    alunos = Counter(d.to_dict().get('equipe_id') for d in db.collection('alunos').select(['equipe_id']).stream())
+    profs = Counter(d.to_dict().get('equipe_id') for d in db.collection('professores').select(['equipe_id']).stream())
+    equipes = [{"id": e.id, "nome": (e.to_dict() or {}).get('nome', '-'),
+                "alunos": alunos.get(e.id, 0), "professores": profs.get(e.id, 0)}
+               for e in db.collection('equipes').select(['nome']).stream()]
+    equipes.sort(key=lambda e: e['alunos'] + e['professores'], reverse=True)
+    return equipes[:TOP_EQUIPES], len(equipes)
+
+def calcular_rollup(dia):
+    """Snapshot (dict) do estado ao fim de 'dia' (date)."""
+    db = get_db()
+    corte = corte_do_dia(dia)
+    a = _Acumulador()
+    for snap in db.collection('usuarios').select(CAMPOS_USUARIO).stream():
+        d = snap.to_dict() or {}
+        if _antes(d, 'data_criacao', corte): a.usuario(d)
+    for snap in db.collection('resultados').select(CAMPOS_RESULTADO).stream():
+        d = snap.to_dict() or {}
+        if _antes(d, 'data', corte): a.resultado(d)
+    for snap in db.collection('questoes').select(CAMPOS_QUESTAO).stream():
+        d = snap.to_dict() or {}
+        if _antes(d, 'data_criacao', corte): a.questao(d)
+    a.equipes, a.totais['equipes'] = _equipes_top(db)
+    return {**a.para_doc(), "data": dia.isoformat(), "corte": corte}
+
+def gravar_rollup(dia):
+    """Calcula e grava kpis_diarios/{dia} (sobrescreve). Retorna o snapshot."""
+    snap = calcular_rollup(dia)
+    get_db().collection(ROLLUPS_COLLECTION).document(dia.isoformat()).set(
+        {**snap, "gerado_em": firestore.SERVER_TIMESTAMP})
+    return snap
+
+def ultimo_rollup():
+    """Snapshot mais recente (dict) ou None."""
+    docs = list(get_db().collection(ROLLUPS_COLLECTION)
+                .order_by('data', direction=firestore.Query.DESCENDING).limit(1).stream())
+    return docs[0].to_dict() if docs else None
+
+# ==============================================================================
+# LEITURA PARA O PAINEL (SNAPSHOT + DELTA)
+# ==============================================================================
+def delta_desde(corte):
+    """Acumulador só com o que foi criado a partir de 'corte'."""
+    db = get_db()
+    a = _Acumulador()
+    for snap in db.collection('usuarios').where('data_criacao', '>=', corte).select(CAMPOS_USUARIO).stream():
+        a.usuario(snap.to_dict() or {})
+    for snap in db.collection('resultados').where('data', '>=', corte).select(CAMPOS_RESULTADO).stream():
+        a.resultado(snap.to_dict() or {})
+    for snap in db.collection('questoes').where('data_criacao', '>=', corte).select(CAMPOS_QUESTAO).stream():
+        a.questao(snap.to_dict() or {})
+    return a
+
+def obter_painel(hoje=None):
+    """
+    Indicadores atuais: último snapshot + delta desde o seu corte.
+    Se o snapshot de ontem ainda não existe, ele é gerado (uma vez por dia).
+    Retorna (dados no formato do snapshot, data do snapshot usado).
+    """
+    ontem = (hoje or datetime.now(timezone.utc).date()) - timedelta(days=1)
+    snap = ultimo_rollup()
+    if snap is None or snap.get('data', '') < ontem.isoformat():
+        snap = gravar_rollup(ontem)
+    a = _Acumulador.de_doc(snap)
+    a.somar(delta_desde(_para_datetime(snap.get('corte')) or corte_do_dia(date.fromisoformat(snap['data']))))
+    return a.para_doc(), snap['data']
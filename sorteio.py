@@ -0,0 +1,112 @@
+# main/sorteio.py
+"""
+Pools de questões pré-separados para montar exames por sorteio.
+
+Cada pool é a lista compacta de ids de uma combinação (status, dificuldade,
+categoria), com mapa id -> posição para incluir/remover em O(1) (troca com o
+último). O sorteio escolhe o pool com peso pelo tamanho e um id uniforme dentro
+dele: k questões custam O(k) (mais O(nº de pools) para os pesos), não importa
+o tamanho do banco.
+"""
+import bisect
+import random
+import threading
+
+STATUS_PADRAO = "aprovada"
+
+def chave_questao(dados):
+    """(status, dificuldade, categoria) de uma questão."""
+    try: dif = int(dados.get("dificuldade", 1) or 1)
+    except (TypeError, ValueError): dif = 1
+    return (dados.get("status", STATUS_PADRAO), dif, str(dados.get("categoria") or "Geral"))
+
+class PoolsQuestoes:
+    def __init__(self):
+        self._pools = {}     # chave -> [ids]
+        self._pos = {}       # id -> (chave, índice na lista)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pos)
+
+    def _tirar(self, doc_id):
+        achado = self._pos.pop(doc_id, None)
+        if achado is None: return
+        chave, i = achado
+        ids = self._pools[chave]
+        ultimo = ids.pop()
+        if ultimo != doc_id:
+            ids[i] = ultimo
+            self._pos[ultimo] = (chave, i)
+        if not ids: del self._pools[chave]
+
+    def adicionar(self, doc_id, dados):
+        chave = chave_questao(dados or {})
+        with self._lock:
+            atual = self._pos.get(doc_id)
+            if atual is not None and atual[0] == chave: return
+            self._tirar(doc_id)
+            ids = self._pools.setdefault(chave, [])
+            self._pos[doc_id] = (chave, len(ids))
+            ids.append(doc_id)
+
+    def remover(self, doc_id):
+        with self._lock:
+            self._tirar(doc_id)
+
+    def reconstruir(self, docs):
+        """docs: iterável de (doc_id, dados)."""
+        with self._lock:
+            self._pools, self._pos = {}, {}
+        for doc_id, dados in docs: self.adicionar(doc_id, dados)
+
+    def tamanhos(self):
+        """{(status, dificuldade, categoria): qtd}."""
+        with self._lock:
+            return {k: len(v) for k, v in self._pools.items()}
+
+    # ------------------------------------------------------------------
+    def _sortear(self, filtro, k, escolhidos, rng):
+        """Até k ids novos dos pools que passam no filtro (peso = tamanho do pool)."""
+        pools = [ids for chave, ids in self._pools.items() if filtro(chave)]
+        acum, total = [], 0
+        for ids in pools:
+            total += len(ids); acum.append(total)
+        novos = []
+        disponiveis = total - sum(1 for d in escolhidos if filtro(self._pos[d][0]))
+        k = min(k, max(disponiveis, 0))
+        tentativas = 0
+        while len(novos) < k and tentativas < 20 * k + 100:
+            tentativas += 1
+            r = rng.randrange(total)
+            p = bisect.bisect_right(acum, r)
+            ids = pools[p]
+            doc_id = ids[r - (acum[p] - len(ids))]
+            if doc_id in escolhidos: continue
+            escolhidos.add(doc_id); novos.append(doc_id)
+        if len(novos) < k:
+            # Sobrou pouca coisa: completa varrendo só os pools filtrados
+            resto = [d for ids in pools for d in ids if d not in escolhidos]
+            for doc_id in rng.sample(resto, min(k - len(novos), len(resto))):
+                escolhidos.add(doc_id); novos.append(doc_id)
+        return novos
+
+    def sortear(self, total=10, por_nivel=None, por_tema=None, status=STATUS_PADRAO, rng=None):
+        """
+        Ids sorteados sem repetição:
+          1. por_tema {categoria: qtd}   (qualquer nível)
+          2. por_nivel {dificuldade: qtd} (qualquer tema, sem repetir os já escolhidos)
+          3. completa até 'total' com qualquer questão do status.
+        """
+        rng = rng or random
+        escolhidos, ordem = set(), []
+        with self._lock:
+            for tema, qtd in (por_tema or {}).items():
+                ordem += self._sortear(lambda c, t=str(tema): c[0] == status and c[2] == t, int(qtd), escolhidos, rng)
+            for nivel, qtd in (por_nivel or {}).items():
+                ordem += self._sortear(lambda c, n=int(nivel): c[0] == status and c[1] == n, int(qtd), escolhidos, rng)
+            falta = int(total or 0) - len(ordem)
+            if falta > 0:
+                ordem += self._sortear(lambda c: c[0] == status, falta, escolhidos, rng)
+        rng.shuffle(ordem)
+        return ordem
@@ -0,0 +1,239 @@
+# main/uploads.py
+"""
+Envio de mídias ao Storage por sessões resumíveis, em chunks.
+
+Cada arquivo abre uma sessão de upload resumível (URL própria, sem precisar
+de credencial nos PUTs) e vai em pedaços de tamanho_chunk bytes. Se um PUT
+falha (rede, 5xx, 429), pergunta ao servidor quantos bytes já estão gravados
+e continua dali, com espera exponencial: uma queda não recomeça do zero.
+Arquivos independentes (vários blocos de uma aula) sobem em paralelo; o
+progresso é lido pela thread que chamou (a do Streamlit) enquanto as
+threads de envio trabalham.
+
+Mídias enviadas por enviar_enderecado são nomeadas pelo SHA-256 do
+conteúdo (midia/{sha256}.{ext}): se o objeto já existe, nada sobe; como o
+nome muda quando o conteúdo muda, o objeto leva Cache-Control imutável e o
+navegador não o baixa de novo.
+
+Funciona com qualquer servidor que fale o protocolo resumível do GCS: o
+Storage de verdade, o emulador (STORAGE_EMULATOR_HOST) ou o servidor falso
+de benchmarks/fake_gcs.py.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+GRANULARIDADE_CHUNK = 256 * 1024            # o GCS exige múltiplos de 256 KiB (menos no último)
+TAMANHO_CHUNK_PADRAO = 8 * 1024 * 1024
+PARALELOS_PADRAO = 4
+TENTATIVAS_POR_CHUNK = 5
+ESPERA_BASE_S = 0.5
+TIMEOUT_S = (10, 120)                       # (conexão, leitura) por requisição
+INTERVALO_PROGRESSO_S = 0.25
+PREFIXO_ENDERECADO = "midia"
+CACHE_CONTROL_IMUTAVEL = "public, max-age=31536000, immutable"
+BLOCO_HASH = 1024 * 1024
+
+class ErroUpload(Exception):
+    pass
+
+def _tamanho(arquivo):
+    tam = getattr(arquivo, "size", None)
+    if tam is None:
+        pos = arquivo.tell(); arquivo.seek(0, os.SEEK_END)
+        tam = arquivo.tell(); arquivo.seek(pos)
+    return int(tam)
+
+def hash_conteudo(arquivo):
+    """SHA-256 (hex) do conteúdo, lido em blocos; devolve o arquivo no início."""
+    h = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(BLOCO_HASH), b""): h.update(bloco)
+    arquivo.seek(0)
+    return h.hexdigest()
+
+def _extensao(arquivo):
+    ext = str(getattr(arquivo, "name", "") or "").rsplit(".", 1)
+    ext = ext[1].lower() if len(ext) == 2 else ""
+    return ext if re.fullmatch(r"[a-z0-9]{1,8}", ext) else "bin"
+
+# ==============================================================================
+# SESSÃO RESUMÍVEL (UM ARQUIVO)
+# ==============================================================================
+class SessaoResumivel:
+    def __init__(self, url, total, tamanho_chunk=TAMANHO_CHUNK_PADRAO, tentativas=TENTATIVAS_POR_CHUNK, http=None):
+        self.url = url
+        self.total = total
+        self.tamanho_chunk = tamanho_chunk
+        self.tentativas = tentativas
+        self.http = http or requests.Session()
+        self.enviados = 0           # bytes confirmados pelo servidor
+        self.resposta = None        # corpo da resposta final (metadados do objeto)
+
+    def _confirmados(self, r):
+        """Bytes gravados segundo o cabeçalho Range de um 308 ("bytes=0-N")."""
+        faixa = r.headers.get("Range")
+        return int(faixa.rsplit("-", 1)[1]) + 1 if faixa else 0
+
+    def _tratar(self, r):
+        """True se terminou; atualiza enviados num 308; erro nos demais."""
+        if r.status_code in (200, 201):
+            self.enviados = self.total
+            try: self.resposta = r.json()
+            except ValueError: self.resposta = {}
+            return True
+        if r.status_code == 308:
+            self.enviados = self._confirmados(r)
+            return False
+        if r.status_code == 429 or r.status_code >= 500:
+            raise requests.ConnectionError(f"HTTP {r.status_code}")
+        raise ErroUpload(f"HTTP {r.status_code}: {r.text[:200]}")
+
+    def consultar(self):
+        """Pergunta ao servidor quantos bytes já tem (retomada)."""
+        r = self.http.put(self.url, headers={"Content-Range": f"bytes */{self.total}", "Content-Length": "0"},
+                          timeout=TIMEOUT_S)
+        return self._tratar(r)
+
+    def enviar(self, arquivo, ao_avancar=None):
+        """Envia o arquivo todo (retomando de onde o servidor parou). Retorna a resposta final."""
+        falhas = 0
+        while True:
+            inicio = self.enviados
+            arquivo.seek(inicio)
+            pedaco = arquivo.read(self.tamanho_chunk)
+            # Chunk vazio (arquivo vazio / servidor já tem tudo) só fecha a sessão
+            faixa = f"bytes {inicio}-{inicio + len(pedaco) - 1}/{self.total}" if pedaco else f"bytes */{self.total}"
+            try:
+                terminou = self._tratar(self.http.put(self.url, data=pedaco, headers={"Content-Range": faixa}, timeout=TIMEOUT_S))
+                falhas = 0
+            except (requests.ConnectionError, requests.Timeout) as e:
+                falhas += 1
+                if falhas > self.tentativas:
+                    raise ErroUpload(f"chunk em {inicio}: {falhas} falhas seguidas ({e})")
+                time.sleep(ESPERA_BASE_S * 2 ** (falhas - 1))
+                try: terminou = self.consultar()
+                except (requests.ConnectionError, requests.Timeout): continue
+            if ao_avancar: ao_avancar(self.enviados)
+            if terminou: return self.resposta
+
+# ==============================================================================
+# MOTOR (VÁRIOS ARQUIVOS EM PARALELO)
+# ==============================================================================
+class MotorUpload:
+    """
+    iniciar_sessao(destino, content_type, total, cache_control) -> URL da sessão resumível.
+    publicar(destino, resposta_final) -> URL pública do objeto (resposta None: já existia).
+    existe(destino) -> bool.
+    Os padrões usam o bucket do projeto (database.obter_bucket).
+    """
+    def __init__(self, tamanho_chunk=TAMANHO_CHUNK_PADRAO, paralelos=PARALELOS_PADRAO,
+                 tentativas=TENTATIVAS_POR_CHUNK, iniciar_sessao=None, publicar=None, existe=None):
+        if tamanho_chunk <= 0 or tamanho_chunk % GRANULARIDADE_CHUNK:
+            raise ValueError(f"tamanho_chunk deve ser múltiplo de {GRANULARIDADE_CHUNK} bytes")
+        self.tamanho_chunk = tamanho_chunk
+        self.paralelos = paralelos
+        self.tentativas = tentativas
+        self.iniciar_sessao = iniciar_sessao or self._sessao_storage
+        self.publicar = publicar or self._publicar_storage
+        self.existe = existe or self._existe_storage
+
+    @staticmethod
+    def _sessao_storage(destino, content_type, total, cache_control=None):
+        from database import obter_bucket
+        blob = obter_bucket().blob(destino)
+        if cache_control: blob.cache_control = cache_control    # vai nos metadados da sessão
+        return blob.create_resumable_upload_session(content_type=content_type, size=total)
+
+    @staticmethod
+    def _publicar_storage(destino, resposta):
+        from database import obter_bucket
+        blob = obter_bucket().blob(destino)
+        if resposta is not None: blob.make_public()
+        return blob.public_url
+
+    @staticmethod
+    def _existe_storage(destino):
+        from database import obter_bucket
+        return obter_bucket().blob(destino).exists()
+
+    def enviar(self, arquivo, destino, content_type=None, ao_avancar=None, cache_control=None):
+        """Um arquivo (file-like com seek). Retorna a URL pública."""
+        total = _tamanho(arquivo)
+        content_type = content_type or getattr(arquivo, "type", None) or "application/octet-stream"
+        sessao = SessaoResumivel(self.iniciar_sessao(destino, content_type, total, cache_control), total,
+                                 self.tamanho_chunk, self.tentativas)
+        resposta = sessao.enviar(arquivo, ao_avancar)
+        return self.publicar(destino, resposta)
+
+    def enviar_enderecado(self, arquivo, content_type=None, ao_avancar=None, prefixo=PREFIXO_ENDERECADO):
+        """
+        Envia com nome = SHA-256 do conteúdo e Cache-Control imutável; se o objeto
+        já existe, não sobe nada. Retorna {url, sha256, caminho, tamanho, content_type, novo}.
+        """
+        total = _tamanho(arquivo)
+        content_type = content_type or getattr(arquivo, "type", None) or "application/octet-stream"
+        sha = hash_conteudo(arquivo)
+        destino = f"{prefixo}/{sha}.{_extensao(arquivo)}"
+        novo = not self.existe(destino)
+        if novo:
+            url = self.enviar(arquivo, destino, content_type, ao_avancar, CACHE_CONTROL_IMUTAVEL)
+        else:
+            url = self.publicar(destino, None)
+            if ao_avancar: ao_avancar(total)
+        return {"url": url, "sha256": sha, "caminho": destino, "tamanho": total,
+                "content_type": content_type, "novo": novo}
+
+    def enviar_varios(self, itens, progresso=None):
+        """
+        itens: [(arquivo, destino, content_type ou None), ...]. Sobe em paralelo
+        e chama progresso(enviados, total) na thread que chamou. Retorna, na mesma
+        ordem, a URL (ou, com destino None, o dict de enviar_enderecado); None no
+        que falhou.
+        """
+        itens = list(itens)
+        totais = [_tamanho(a) for a, _, _ in itens]
+        enviados = [0] * len(itens)
+        lock = threading.Lock()
+
+        def _um(i):
+            def avancou(n):
+                with lock: enviados[i] = n
+            arquivo, destino, ct = itens[i]
+            if destino is None: return self.enviar_enderecado(arquivo, ct, avancou)
+            return self.enviar(arquivo, destino, ct, avancou)
+
+        urls = [None] * len(itens)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.paralelos, len(itens)))) as pool:
+            futuros = {pool.submit(_um, i): i for i in range(len(itens))}
+            pendentes = set(futuros)
+            while pendentes:
+                _, pendentes = wait(pendentes, timeout=INTERVALO_PROGRESSO_S)
+                if progresso:
+                    with lock: feito = sum(enviados)
+                    progresso(feito, sum(totais))
+            for f, i in futuros.items():
+                try: urls[i] = f.result()
+                except Exception as e: print(f"[UPLOADS] {itens[i][1] or getattr(itens[i][0], 'name', i)}: {e}")
+        return urls
+
+# ==============================================================================
+# INSTÂNCIA DO PROCESSO
+# ==============================================================================
+_motor = None
+_lock = threading.Lock()
+
+def obter_motor():
+    """Motor padrão (Storage do projeto). Chunk: env BJJ_UPLOAD_CHUNK_MB (múltiplo de 0,25)."""
+    global _motor
+    if _motor is None:
+        with _lock:
+            if _motor is None:
+                mb = float(os.environ.get("BJJ_UPLOAD_CHUNK_MB", TAMANHO_CHUNK_PADRAO / 1024 / 1024))
+                _motor = MotorUpload(tamanho_chunk=int(mb * 1024 * 1024))
+    return _motor
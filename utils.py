@@ -6,20 +6,23 @@ import streamlit as st
 import smtplib
 import secrets
 import string
+import functools
 import unicodedata
-import random
 import uuid
 import json
+import threading
 import pandas as pd
 import time  # <--- ADICIONADO: Essencial para upload de fotos/vídeos
 import mercadopago
 from urllib.parse import quote
 from datetime import datetime
+from collections import Counter, OrderedDict
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from fpdf import FPDF
-from database import get_db
-from firebase_admin import firestore, storage 
+from database import get_db, obter_bucket, obter_carregador
+import duplicidade
+import uploads
+from firebase_admin import firestore
 
 # ==============================================================================
 # 1. CONFIGURAÇÃO GERAL E CORES
@@ -119,16 +122,14 @@ def listar_todos_usuarios_para_selecao():
     except: return []
 
 def obter_nomes_usuarios(lista_ids):
-    db = get_db()
     res = []
     if not lista_ids: return []
-    for uid in lista_ids:
-        try:
-            doc = db.collection('usuarios').document(uid).get()
-            if doc.exists:
-                d = doc.to_dict()
+    try:
+        usuarios = obter_carregador().obter_muitos('usuarios', lista_ids)
+        for uid, d in usuarios.items():
+            if d is not None:
                 res.append({'id': uid, 'nome': d.get('nome','-'), 'cpf': d.get('cpf','-')})
-        except: pass
+    except: pass
     return res
 
 # ==============================================================================
@@ -148,122 +149,222 @@ def normalizar_link_video(url):
         return url
     except: return url
 
+# ------------------------------------------------------------------------------
+# Mídias endereçadas por conteúdo: midia/{sha256}.{ext}, Cache-Control imutável.
+# midias/{sha256} conta as referências (refs); o mesmo arquivo enviado de novo
+# só incrementa. liberar_midia decrementa (questões ao trocar/apagar a mídia;
+# aulas ao trocar blocos e ao apagar o módulo; aula desativada mantém as suas).
+# O comando "limpar-midias" do manutencao.py apaga os objetos com refs <= 0:
+# marca o registro (apagando) numa transação e só apaga a geração do objeto
+# lida antes da marca. Quem registra uma mídia marcada (ou sem registro) que
+# não acabou de subir envia o arquivo de novo.
+# ------------------------------------------------------------------------------
+MIDIAS_COLLECTION = "midias"
+_URL_MIDIA = re.compile(r"/" + uploads.PREFIXO_ENDERECADO + r"/([0-9a-f]{64})\.[a-z0-9]+(?:\?|$)")
+
+def _registrar_midia(info, arquivo):
+    """Soma uma referência; reenvia o arquivo se o objeto visto no upload pode ter sido apagado."""
+    ref = get_db().collection(MIDIAS_COLLECTION).document(info["sha256"])
+
+    @firestore.transactional
+    def _tx(transaction):
+        snap = ref.get(transaction=transaction)
+        reenviar = not info["novo"] and (not snap.exists or bool((snap.to_dict() or {}).get("apagando")))
+        dados = {"caminho": info["caminho"], "tamanho": info["tamanho"], "content_type": info["content_type"],
+                 "url": info["url"], "refs": firestore.Increment(1), "ultimo_uso": firestore.SERVER_TIMESTAMP,
+                 "apagando": firestore.DELETE_FIELD}
+        if not snap.exists: dados["criado_em"] = firestore.SERVER_TIMESTAMP
+        transaction.set(ref, dados, merge=True)
+        return reenviar
+
+    if _tx(get_db().transaction()):
+        uploads.obter_motor().enviar(arquivo, info["caminho"], info["content_type"],
+                                     cache_control=uploads.CACHE_CONTROL_IMUTAVEL)
+
+def enviar_midia(arquivo, ao_avancar=None):
+    """Upload endereçado por conteúdo (pula se já existe) + referência. Retorna a URL."""
+    info = uploads.obter_motor().enviar_enderecado(arquivo, getattr(arquivo, "type", None), ao_avancar)
+    _registrar_midia(info, arquivo)
+    return info["url"]
+
+def liberar_midia(url):
+    """Tira uma referência da mídia da URL (links externos/antigos são ignorados)."""
+    m = _URL_MIDIA.search(str(url or ""))
+    if not m: return False
+    try:
+        get_db().collection(MIDIAS_COLLECTION).document(m.group(1)).update({"refs": firestore.Increment(-1)})
+        return True
+    except Exception as e:
+        print(f"[MIDIAS] liberar {m.group(1)}: {e}")
+        return False
+
+def liberar_midias_questao(questao):
+    """Tira as referências da imagem/vídeo de uma questão (ao apagá-la)."""
+    for campo in ('url_imagem', 'url_video'): liberar_midia((questao or {}).get(campo))
+
+def _midias_em(valor):
+    """URLs de mídias endereçadas dentro de um valor (dict/lista aninhados), com repetição."""
+    if isinstance(valor, dict): return [u for v in valor.values() for u in _midias_em(v)]
+    if isinstance(valor, (list, tuple)): return [u for v in valor for u in _midias_em(v)]
+    return [valor] if isinstance(valor, str) and _URL_MIDIA.search(valor) else []
+
+def _liberar_midias(antes, depois=None):
+    """Libera as mídias de `antes` que não continuam em `depois` (conta repetições)."""
+    for url in (Counter(_midias_em(antes)) - Counter(_midias_em(depois))).elements():
+        liberar_midia(url)
+
+def limpar_midias_orfas(aplicar=False):
+    """Apaga do Storage (e do registro) as mídias com refs <= 0. Retorna [(sha, caminho, tamanho)]."""
+    db = get_db()
+    orfas = [(d.id, d.to_dict() or {}) for d in db.collection(MIDIAS_COLLECTION).where('refs', '<=', 0).stream()]
+    if not aplicar:
+        return [(sha, d.get('caminho'), d.get('tamanho', 0)) for sha, d in orfas]
+
+    def _orfa(snap):
+        return snap.exists and int((snap.to_dict() or {}).get('refs', 0) or 0) <= 0
+
+    @firestore.transactional
+    def _marcar(transaction, ref):
+        if not _orfa(ref.get(transaction=transaction)): return False
+        transaction.update(ref, {"apagando": True, "apagando_em": firestore.SERVER_TIMESTAMP})
+        return True
+
+    @firestore.transactional
+    def _remover_registro(transaction, ref):
+        snap = ref.get(transaction=transaction)
+        if _orfa(snap) and (snap.to_dict() or {}).get("apagando"): transaction.delete(ref)
+
+    apagadas = []
+    for sha, d in orfas:
+        ref = db.collection(MIDIAS_COLLECTION).document(sha)
+        try:
+            # Geração lida antes da marca: um reenvio depois dela cria outra, que não é apagada
+            blob = obter_bucket().get_blob(d['caminho'])
+            if not _marcar(db.transaction(), ref): continue      # ganhou referência nesse meio-tempo
+            if blob is not None: blob.delete(if_generation_match=blob.generation)
+            _remover_registro(db.transaction(), ref)
+            apagadas.append((sha, d.get('caminho'), d.get('tamanho', 0)))
+        except Exception as e:
+            print(f"[MIDIAS] apagar {d.get('caminho')}: {e}")
+    return apagadas
+
 def fazer_upload_midia(arquivo):
     """Função legada para upload genérico."""
     if not arquivo: return None
     try:
-        bucket = storage.bucket()
-        if not bucket.name:
-            bucket_name = st.secrets.get("firebase", {}).get("storage_bucket")
-            if not bucket_name: bucket_name = st.secrets.get("storage_bucket")
-            if not bucket_name: return None
-        
-        ext = arquivo.name.split('.')[-1]
-        blob_name = f"questoes/{uuid.uuid4()}.{ext}"
-        blob = bucket.blob(blob_name)
-        
-        arquivo.seek(0)
-        blob.upload_from_file(arquivo, content_type=arquivo.type)
-        
-        blob.make_public()
-        return blob.public_url
+        if not obter_bucket().name: return None
+        return enviar_midia(arquivo)
     except Exception as e:
         st.error(f"Erro Upload: {e}")
         return None
 
 def upload_arquivo_simples(arquivo, caminho_destino):
-    """Função otimizada para aulas, aceitando caminho customizado."""
+    """Função otimizada para aulas, aceitando caminho customizado (upload resumível em chunks)."""
     if not arquivo: return None
     try:
-        bucket = storage.bucket()
-        blob = bucket.blob(caminho_destino)
-        # Importante: seek(0) garante leitura do inicio
-        arquivo.seek(0)
-        blob.upload_from_file(arquivo, content_type=arquivo.type)
-        blob.make_public()
-        return blob.public_url
+        return uploads.obter_motor().enviar(arquivo, caminho_destino, getattr(arquivo, "type", None))
     except Exception as e:
         print(f"Erro upload simples: {e}")
         return None
 
+def upload_arquivos_paralelo(arquivos, progresso=None):
+    """
+    Mídias endereçadas por conteúdo, enviadas em paralelo. progresso(enviados, total)
+    é chamado na thread do script. Retorna as URLs na mesma ordem (None no que falhou).
+    """
+    arquivos = [a for a in arquivos if a]
+    if not arquivos: return []
+    infos = uploads.obter_motor().enviar_varios([(a, None, getattr(a, "type", None)) for a in arquivos], progresso)
+    urls = []
+    for arquivo, info in zip(arquivos, infos):
+        if info:
+            try: _registrar_midia(info, arquivo)
+            except Exception as e:
+                print(f"[MIDIAS] registrar {info['sha256']}: {e}")
+                info = None
+        urls.append(info["url"] if info else None)
+    return urls
+
+def _enviar_arquivos_blocos(blocos, progresso=None):
+    """{idx: url} dos blocos de imagem/vídeo com arquivo, enviados juntos."""
+    itens = [(i, b["arquivo"]) for i, b in enumerate(blocos or [])
+             if isinstance(b, dict) and str(b.get("tipo", "")).lower().strip() in ("imagem", "video") and b.get("arquivo")]
+    urls = upload_arquivos_paralelo([a for _, a in itens], progresso)
+    return {i: u for (i, _), u in zip(itens, urls)}
+
 # ==============================================================================
 # 4. GERAÇÃO DE CERTIFICADOS E QR CODE (MANTIDO DO SEU CÓDIGO)
 # ==============================================================================
+# Sequência anual dos códigos: cada processo reserva um bloco de números numa
+# transação (sequencias/certificados_{ano}) e distribui localmente. Blocos são
+# disjuntos -> códigos únicos entre processos; números não usados de um bloco
+# (reinício do processo) viram lacunas, não duplicatas.
+SEQUENCIAS_COLLECTION = "sequencias"
+TAMANHO_BLOCO_CODIGOS = 20
+
+_lock_codigos = threading.Lock()
+_bloco_codigos = {"ano": None, "proximo": 0, "limite": 0}
+
+def _reservar_bloco_codigos(ano, tamanho=TAMANHO_BLOCO_CODIGOS):
+    """Reserva [inicio, inicio+tamanho) da sequência do ano. Retorna inicio."""
+    db = get_db()
+    ref = db.collection(SEQUENCIAS_COLLECTION).document(f"certificados_{ano}")
+
+    @firestore.transactional
+    def _tx(transaction, inicio_padrao):
+        snap = ref.get(transaction=transaction)
+        inicio = int((snap.to_dict() or {}).get("proximo", 1)) if snap.exists else inicio_padrao
+        transaction.set(ref, {"ano": ano, "proximo": inicio + tamanho,
+                              "atualizado_em": firestore.SERVER_TIMESTAMP})
+        return inicio
+
+    inicio_padrao = 1
+    if not ref.get().exists:
+        # 1ª reserva do ano: começa depois dos códigos já emitidos pelo contador antigo (count())
+        try: inicio_padrao = int(db.collection('resultados').count().get()[0][0].value) + 1
+        except: pass
+    return _tx(db.transaction(), inicio_padrao)
+
 def gerar_codigo_verificacao():
+    ano = datetime.now().year
     try:
-        db = get_db()
-        aggregate_query = db.collection('resultados').count()
-        snapshots = aggregate_query.get()
-        total = int(snapshots[0][0].value)
-        return f"BJJDIGITAL-{datetime.now().year}-{total+1:04d}"
-    except:
-        return f"BJJDIGITAL-{datetime.now().year}-{random.randint(1000,9999)}"
-
-def gerar_qrcode(codigo):
-    pasta = "qrcodes"
-    os.makedirs(pasta, exist_ok=True)
-    caminho = f"{pasta}/{codigo}.png"
-    url = f"https://bjjdigital.com.br/verificar.html?codigo={codigo}"
-    if not os.path.exists(caminho):
-        try:
-            import qrcode
-            img = qrcode.make(url)
-            img.save(caminho)
-        except ImportError: pass
-    return caminho
-
-@st.cache_data(show_spinner=False)
-def gerar_pdf(usuario_nome, faixa, pontuacao, total, codigo, professor="Professor(a) Responsavel"):
-    def limpa(txt):
-        if not txt: return ""
-        return unicodedata.normalize('NFKD', str(txt)).encode('ASCII', 'ignore').decode('ASCII')
-
-    pdf = FPDF("L", "mm", "A4")
-    pdf.set_auto_page_break(False)
-    pdf.add_page()
-    L, H = 297, 210
-    
-    bg_path = "assets/fundo_certificado_bjj.png" if os.path.exists("assets/fundo_certificado_bjj.png") else None
-    if bg_path: pdf.image(bg_path, x=0, y=0, w=L, h=H)
-    else: pdf.set_fill_color(252, 252, 252); pdf.rect(0, 0, L, H, "F")
-
-    titulo = "CERTIFICADO DE EXAME TEORICO"
-    pdf.set_y(28); pdf.set_font("Helvetica", "B", 32); pdf.set_text_color(200, 180, 100)
-    pdf.cell(0, 16, titulo, ln=False, align="C")
-    pdf.set_y(26.8); pdf.set_text_color(218, 165, 32)
-    pdf.cell(0, 16, titulo, ln=True, align="C")
-
-    pdf.set_y(90); pdf.set_font("Helvetica", "", 14); pdf.set_text_color(50, 50, 50)
-    pdf.cell(0, 8, "Certificamos que o aluno(a):", ln=True, align="C")
-
-    nome = limpa(usuario_nome.upper().strip())
-    pdf.set_font("Helvetica", "B", 42); pdf.set_text_color(218, 165, 32)
-    pdf.cell(0, 20, nome, ln=True, align="C")
-
-    pdf.ln(2); pdf.set_font("Helvetica", "", 14); pdf.set_text_color(50, 50, 50)
-    pdf.cell(0, 8, "foi aprovado(a) no exame teórico para a faixa:", ln=True, align="C")
+        with _lock_codigos:
+            b = _bloco_codigos
+            if b["ano"] != ano or b["proximo"] >= b["limite"]:
+                inicio = _reservar_bloco_codigos(ano)
+                b.update(ano=ano, proximo=inicio, limite=inicio + TAMANHO_BLOCO_CODIGOS)
+            numero = b["proximo"]
+            b["proximo"] += 1
+        return f"BJJDIGITAL-{ano}-{numero:04d}"
+    except Exception as e:
+        # Sem banco: código aleatório longo (não colide com a sequência numérica)
+        print(f"[CODIGO_CERTIFICADO] falha ao reservar bloco: {e}")
+        return f"BJJDIGITAL-{ano}-R{secrets.token_hex(4).upper()}"
 
-    pdf.ln(4); cor_fx = get_cor_faixa(faixa); pdf.set_font("Helvetica", "B", 38); pdf.set_text_color(*cor_fx)
-    pdf.cell(0, 18, limpa(faixa.upper()), ln=True, align="C")
+URL_VERIFICACAO = "https://bjjdigital.com.br/verificar.html?codigo={codigo}"
+QR_CACHE_MAX = 512
 
-    y_base = 151
-    pdf.set_xy(0, y_base + 4); pdf.set_font("Helvetica", "I", 20); pdf.set_text_color(218, 165, 32)
-    pdf.cell(0, 14, limpa(professor), ln=True, align="C")
-    
-    x_start = (L/2) - 40
-    pdf.set_draw_color(60, 60, 60)
-    pdf.line(x_start, pdf.get_y() + 1, x_start + 80, pdf.get_y() + 1)
-    
-    pdf.ln(4); pdf.set_font("Helvetica", "", 9); pdf.set_text_color(100, 100, 100)
-    pdf.cell(0, 5, "Professor(a) Responsavel", align="C")
+@functools.lru_cache(maxsize=QR_CACHE_MAX)
+def gerar_qrcode(codigo):
+    """QR de verificação em memória: (nome, info de imagem) para o PDF, ou None sem o pacote qrcode."""
+    import certificados
+    info = certificados.qrcode_imagem(URL_VERIFICACAO.format(codigo=codigo))
+    return (f"qr_{codigo}", info) if info else None
 
-    qr_path = gerar_qrcode(codigo)
-    if qr_path and os.path.exists(qr_path):
-        pdf.image(qr_path, x=L-56, y=y_base, w=32)
-        pdf.set_xy(L-64, y_base + 32); pdf.set_font("Courier", "", 8)
-        pdf.cell(45, 4, f"Ref: {codigo}", align="C")
+def nome_arquivo_certificado(usuario_nome):
+    """Nome do arquivo (só depende do aluno: não precisa renderizar o PDF)."""
+    import certificados
+    partes = certificados.limpa(str(usuario_nome or "").upper().strip()).split()
+    return f"Certificado_{partes[0] if partes else 'BJJ'}.pdf"
 
-    return pdf.output(dest="S").encode("latin-1"), f"Certificado_{nome.split()[0]}.pdf"
+def gerar_pdf(usuario_nome, faixa, pontuacao, total, codigo, professor="Professor(a) Responsavel"):
+    # PDF sai do cache por hash das entradas (memória -> disco -> Storage); só renderiza na 1ª vez.
+    # Fundo e textos fixos vêm do modelo pré-montado; aqui só entram os campos do aluno.
+    import certificados
+    chave = certificados.chave_artefato(nome=usuario_nome, faixa=faixa, professor=professor, codigo=codigo)
+    pdf_bytes = certificados.obter_cache().obter(chave, lambda: certificados.obter_renderizador().renderizar(
+        usuario_nome, faixa, get_cor_faixa(faixa), professor, codigo, qr=gerar_qrcode(codigo)))
+    return pdf_bytes, nome_arquivo_certificado(usuario_nome)
 
 # ==============================================================================
 # 5. MOTOR DE CURSOS E AULAS (AQUI ESTÃO AS CORREÇÕES CRÍTICAS)
@@ -277,7 +378,8 @@ def criar_curso(professor_id, nome_professor, professor_equipe, titulo, descrica
         "editores_ids": editores_ids, "titulo": titulo, "descricao": descricao, "modalidade": modalidade,
         "publico": publico, "equipe_destino": equipe_destino, "pago": pago, "preco": float(preco),
         "split_custom": split_custom, "certificado_automatico": certificado_automatico, "ativo": True,
-        "criado_em": datetime.now(), "duracao_estimada": duracao_estimada, "nivel": nivel
+        "criado_em": datetime.now(), "duracao_estimada": duracao_estimada, "nivel": nivel,
+        "total_aulas_ativas": 0
     }
     _, doc_ref = db.collection('cursos').add(novo_curso)
     return doc_ref.id
@@ -298,6 +400,7 @@ def excluir_curso(curso_id: str) -> bool:
             excluir_modulo(mod.id)
         inscricoes_ref = db.collection('inscricoes').where('curso_id', '==', curso_id).stream()
         for insc in inscricoes_ref: db.collection('inscricoes').document(insc.id).delete()
+        db.collection(ESTRUTURA_CURSO_COLLECTION).document(str(curso_id)).delete()
         db.collection('cursos').document(curso_id).delete()
         return True
     except: return False
@@ -333,23 +436,13 @@ def listar_cursos_disponiveis_para_usuario(usuario):
     return lista_cursos
 
 def listar_modulos_e_aulas(curso_id):
-    db = get_db()
+    """
+    Árvore do curso (módulos ordenados + resumo das aulas) lida da estrutura
+    materializada: 1 leitura. O corpo da aula vem de obter_aula() ao abrir.
+    """
     try:
-        modulos_ref = db.collection('modulos').where('curso_id', '==', str(curso_id)).stream()
-        estrutura = []
-
-        for m in modulos_ref:
-            mod_data = m.to_dict()
-            mod_data['id'] = m.id
-
-            # 🔁 NOVO: leitura unificada
-            aulas = obter_aulas_unificadas_por_modulo(m.id)
-
-            mod_data['aulas'] = aulas
-            estrutura.append(mod_data)
-
-        estrutura.sort(key=lambda x: int(x.get('ordem', 0) or 0))
-        return estrutura
+        estrutura = obter_estrutura_curso(curso_id)
+        return [dict(m, aulas=[dict(a) for a in m.get('aulas', [])]) for m in estrutura.get('modulos', [])]
     except Exception as e:
         print(f"[LISTAR_MODULOS] erro: {e}")
         return []
@@ -366,7 +459,17 @@ def criar_modulo(curso_id, titulo, descricao, ordem):
             "criado_em": datetime.now(),
             "aulas": [] # Array inicializado para aulas mistas
         }
-        _, doc_ref = db.collection('modulos').add(dados_modulo)
+        doc_ref = db.collection('modulos').document()
+
+        @firestore.transactional
+        def _tx(transaction):
+            est_ref, estrutura = _ler_estrutura_tx(transaction, curso_id)
+            transaction.set(doc_ref, dados_modulo)
+            if estrutura is not None:
+                estrutura['modulos'].append(_resumo_modulo(doc_ref.id, dados_modulo))
+                _gravar_estrutura_tx(transaction, est_ref, estrutura)
+
+        _tx(db.transaction())
         return doc_ref.id
     except Exception as e:
         print(f"Erro ao criar módulo: {e}")
@@ -393,6 +496,7 @@ def criar_aula(module_id, titulo, tipo, conteudo, duracao_min):
         if url: conteudo_safe['material_apoio'] = url
 
     db.collection('aulas').add({"modulo_id": module_id, "titulo": titulo, "tipo": tipo, "conteudo": conteudo_safe, "duracao_min": duracao_min, "criado_em": datetime.now()})
+    _invalidar_estrutura_do_modulo(module_id)
 
 def criar_aula_mista(modulo_id, titulo, lista_blocos, duracao_min):
     """
@@ -401,6 +505,8 @@ def criar_aula_mista(modulo_id, titulo, lista_blocos, duracao_min):
     """
     db = get_db()
     blocos_processados = []
+    # Arquivos de todos os blocos sobem juntos, em paralelo
+    enviados = _enviar_arquivos_blocos(lista_blocos)
     
     for i, bloco in enumerate(lista_blocos):
         novo_bloco = {"tipo": bloco['tipo']}
@@ -411,11 +517,7 @@ def criar_aula_mista(modulo_id, titulo, lista_blocos, duracao_min):
         elif bloco['tipo'] in ['imagem', 'video']:
             arquivo = bloco.get('arquivo')
             if arquivo:
-                ext = arquivo.name.split('.')[-1]
-                # Nome único usando time.time() (agora importado!)
-                nome_arq = f"aulas_mistas/{modulo_id}_{int(time.time())}_{i}.{ext}"
-                url = upload_arquivo_simples(arquivo, nome_arq)
-                novo_bloco['url'] = url
+                novo_bloco['url'] = enviados.get(i)
             else:
                 novo_bloco['url'] = bloco.get('url_link', '')
                 
@@ -438,9 +540,34 @@ def criar_aula_mista(modulo_id, titulo, lista_blocos, duracao_min):
 def excluir_modulo(modulo_id):
     db = get_db()
     try:
+        legadas = []
         aulas_ref = db.collection('aulas').where('modulo_id', '==', modulo_id).stream()
-        for aula in aulas_ref: db.collection('aulas').document(aula.id).delete()
-        db.collection('modulos').document(modulo_id).delete()
+        for aula in aulas_ref:
+            legadas.append(aula.to_dict() or {})
+            db.collection('aulas').document(aula.id).delete()
+
+        mod_ref = db.collection('modulos').document(modulo_id)
+
+        @firestore.transactional
+        def _tx(transaction):
+            snap = mod_ref.get(transaction=transaction)
+            curso_id = (snap.to_dict() or {}).get('curso_id') if snap.exists else None
+            est_ref, estrutura = _ler_estrutura_tx(transaction, curso_id) if curso_id else (None, None)
+            cur_ref, tem_contador = _ler_contador_aulas_tx(transaction, curso_id) if curso_id else (None, False)
+            ativas = list(db.collection(AULAS_V2_COLLECTION)
+                            .where('modulo_id', '==', str(modulo_id))
+                            .where('ativo', '==', True)
+                            .stream(transaction=transaction)) if tem_contador else []
+            transaction.delete(mod_ref)
+            _ajustar_contador_aulas_tx(transaction, cur_ref, tem_contador, -len(ativas))
+            if estrutura is not None:
+                estrutura['modulos'] = [m for m in estrutura['modulos'] if m.get('id') != str(modulo_id)]
+                _gravar_estrutura_tx(transaction, est_ref, estrutura)
+            return (snap.to_dict() or {}).get('aulas') or []
+
+        mistas = _tx(db.transaction())
+        # Mídias das aulas legadas e das mistas (dentro do módulo); as V2 continuam na coleção própria
+        _liberar_midias([legadas, mistas])
         return True
     except: return False
 
@@ -451,17 +578,18 @@ def listar_cursos_inscritos(usuario_id):
     db = get_db()
     lista_final = []
     try:
-        inscricoes = db.collection('inscricoes').where('usuario_id', '==', str(usuario_id)).stream()
+        inscricoes = list(db.collection('inscricoes').where('usuario_id', '==', str(usuario_id)).stream())
+        carregador = obter_carregador()
+        cursos = carregador.obter_muitos('cursos', [i.to_dict().get('curso_id') for i in inscricoes])
         for insc in inscricoes:
             dados_insc = insc.to_dict()
             curso_id = dados_insc.get('curso_id')
-            if curso_id:
-                curso_doc = db.collection('cursos').document(curso_id).get()
-                if curso_doc.exists:
-                    dados_curso = curso_doc.to_dict(); dados_curso['id'] = curso_id
-                    dados_curso['progresso'] = dados_insc.get('progresso', 0)
-                    dados_curso['inscricao_id'] = insc.id
-                    lista_final.append(dados_curso)
+            dados_curso = cursos.get(str(curso_id)) if curso_id else None
+            if dados_curso is not None:
+                dados_curso = dict(dados_curso); dados_curso['id'] = curso_id
+                dados_curso['progresso'] = dados_insc.get('progresso', 0)
+                dados_curso['inscricao_id'] = insc.id
+                lista_final.append(dados_curso)
     except: pass
     return lista_final
 
@@ -504,14 +632,12 @@ def inscrever_usuario_em_curso(usuario_id, curso_id):
 def listar_alunos_inscritos(curso_id):
     db = get_db()
     try:
-        inscricoes = db.collection('inscricoes').where('curso_id', '==', str(curso_id)).stream()
+        inscricoes = [i.to_dict() for i in db.collection('inscricoes').where('curso_id', '==', str(curso_id)).stream()]
+        usuarios = obter_carregador().obter_muitos('usuarios', [d.get('usuario_id') for d in inscricoes])
         lista = []
-        for i in inscricoes:
-            d = i.to_dict()
-            uid = d.get('usuario_id')
-            user = db.collection('usuarios').document(uid).get()
-            if user.exists:
-                ud = user.to_dict()
+        for d in inscricoes:
+            ud = usuarios.get(str(d.get('usuario_id')))
+            if ud is not None:
                 lista.append({
                     "Nome": ud.get('nome','-').upper(),
                     "Email": ud.get('email','-'),
@@ -535,22 +661,361 @@ def verificar_elegibilidade_exame(dados_usuario):
         except: pass
     return True, "Autorizado"
 
-def registrar_inicio_exame(uid):
-    try: get_db().collection('usuarios').document(uid).update({"status_exame": "em_andamento", "inicio_exame_temp": datetime.now().isoformat(), "status_exame_em_andamento": True})
-    except: pass
-
 def registrar_fim_exame(uid, aprovado):
     try:
         stt = "aprovado" if aprovado else "reprovado"
-        get_db().collection('usuarios').document(uid).update({"status_exame": stt, "exame_habilitado": False, "data_ultimo_exame": firestore.SERVER_TIMESTAMP, "status_exame_em_andamento": False})
+        batch = get_db().batch()
+        batch.update(get_db().collection('usuarios').document(uid), {"status_exame": stt, "exame_habilitado": False, "data_ultimo_exame": firestore.SERVER_TIMESTAMP, "status_exame_em_andamento": False})
+        _encerrar_sessao_exame(batch, uid, stt)
+        batch.commit()
         return True
     except: return False
 
 def bloquear_por_abandono(uid):
-    try: get_db().collection('usuarios').document(uid).update({"status_exame": "bloqueado", "exame_habilitado": False, "status_exame_em_andamento": False})
+    try:
+        batch = get_db().batch()
+        batch.update(get_db().collection('usuarios').document(uid), {"status_exame": "bloqueado", "exame_habilitado": False, "status_exame_em_andamento": False})
+        _encerrar_sessao_exame(batch, uid, "bloqueado")
+        batch.commit()
     except: pass
 
+# --- Sessão de exame congelada (sessoes_exame/{usuario_id}) ---
+# Criada uma vez ao iniciar: ids das questões já na ordem da prova, prazo e
+# regras. Durante a prova a tela só usa essa cópia (em st.session_state) e
+# as questões vêm do cache compartilhado: nenhum rerun lê o banco.
+SESSOES_EXAME_COLLECTION = "sessoes_exame"
+
+def _encerrar_sessao_exame(escritor, uid, status):
+    escritor.set(get_db().collection(SESSOES_EXAME_COLLECTION).document(uid),
+              {"status": status, "encerrada_em": firestore.SERVER_TIMESTAMP}, merge=True)
+
+def iniciar_sessao_exame(uid, faixa, questoes_ids, tempo_limite, aprovacao_minima):
+    """Grava a sessão e marca o início no usuário (um batch). Retorna a sessão (dict)."""
+    agora = time.time()
+    sessao = {
+        "usuario_id": uid, "faixa": faixa, "questoes_ids": [str(q) for q in questoes_ids],
+        "tempo_limite": int(tempo_limite), "aprovacao_minima": int(aprovacao_minima),
+        "inicio_ts": agora, "prazo_ts": agora + int(tempo_limite) * 60, "status": "em_andamento",
+    }
+    db = get_db()
+    batch = db.batch()
+    batch.set(db.collection(SESSOES_EXAME_COLLECTION).document(uid), {**sessao, "iniciada_em": firestore.SERVER_TIMESTAMP})
+    batch.update(db.collection('usuarios').document(uid), {"status_exame": "em_andamento", "inicio_exame_temp": datetime.now().isoformat(), "status_exame_em_andamento": True})
+    batch.commit()
+    return sessao
+
+def obter_sessao_exame(uid):
+    """Sessão gravada do usuário (dict) ou None."""
+    try:
+        snap = get_db().collection(SESSOES_EXAME_COLLECTION).document(uid).get()
+        return snap.to_dict() if snap.exists else None
+    except: return None
+
+# --- Finalização do exame e registro por questão ---
+# resultados/{usuario_id}_{início}: questoes_ids na ordem da prova,
+# acertos_mask (hex; bit i = questão i certa) e respostas (uma letra por
+# questão, "-" = em branco). Usuário, sessão, resultado e índice do código
+# vão numa só transação; as estatísticas das questões, num batch depois dela.
+def codificar_acertos(acertos):
+    """[bool, ...] -> hex (bit i = posição i)."""
+    return format(sum(1 << i for i, ok in enumerate(acertos) if ok), "x")
+
+def decodificar_acertos(mask, total):
+    n = int(mask or "0", 16)
+    return [bool(n >> i & 1) for i in range(int(total or 0))]
+
+def detalhes_resultado(resultado):
+    """[{questao_id, acertou}] de um resultado (formato compacto ou 'detalhes' antigo)."""
+    if resultado.get('questoes_ids'):
+        ids = resultado['questoes_ids']
+        return [{"questao_id": q, "acertou": ok}
+                for q, ok in zip(ids, decodificar_acertos(resultado.get('acertos_mask'), len(ids)))]
+    detalhes = resultado.get('detalhes')
+    return detalhes if isinstance(detalhes, list) else []
+
+def finalizar_exame(usuario, sessao, questoes, acertos, respostas):
+    """
+    Grava o exame concluído numa única transação: resultado (com o registro
+    por questão e o código do certificado, se aprovado), status do usuário e
+    sessão encerrada; depois soma as estatísticas das questões. questoes (dicts com 'id'),
+    acertos e respostas: alinhados, na ordem da prova. Retorna o resultado;
+    num envio repetido, o que já estava gravado (com o mesmo código).
+    """
+    uid = usuario['id']
+    total = len(acertos)
+    qtd_ok = sum(1 for ok in acertos if ok)
+    nota = (qtd_ok / total) * 100 if total else 0
+    aprovado = nota >= sessao['aprovacao_minima']
+    stt = "aprovado" if aprovado else "reprovado"
+    resultado = {
+        "usuario": usuario['nome'], "usuario_id": uid, "faixa": sessao['faixa'],
+        "pontuacao": nota, "acertos": qtd_ok, "total": total, "aprovado": aprovado,
+        "codigo_verificacao": None,
+        "questoes_ids": [str(q['id']) for q in questoes],
+        "acertos_mask": codificar_acertos(acertos),
+        "respostas": "".join(r or "-" for r in respostas),
+        "duracao_s": int(time.time() - sessao.get('inicio_ts', time.time())),
+    }
+    db = get_db()
+    res_ref = db.collection('resultados').document(f"{uid}_{int(sessao.get('inicio_ts', 0))}")
+
+    @firestore.transactional
+    def _tx(transaction):
+        existente = res_ref.get(transaction=transaction)
+        if existente.exists: return existente.to_dict()  # envio repetido
+        # Código só para o resultado que vai ser gravado (o mesmo se a transação repetir)
+        if aprovado and not resultado['codigo_verificacao']:
+            resultado['codigo_verificacao'] = gerar_codigo_verificacao()
+        transaction.set(res_ref, {**resultado, "data": firestore.SERVER_TIMESTAMP, "atualizado_em": firestore.SERVER_TIMESTAMP})
+        transaction.update(db.collection('usuarios').document(uid), {"status_exame": stt, "exame_habilitado": False, "data_ultimo_exame": firestore.SERVER_TIMESTAMP, "status_exame_em_andamento": False})
+        _encerrar_sessao_exame(transaction, uid, stt)
+        if aprovado:
+            transaction.set(db.collection(CODIGOS_CERTIFICADO_COLLECTION).document(resultado['codigo_verificacao']),
+                            _dados_indice_certificado(resultado, res_ref.id, firestore.SERVER_TIMESTAMP))
+        return resultado
+
+    gravado = _tx(db.transaction())
+    if gravado is resultado: registrar_estatisticas_exame(questoes, acertos)
+    if gravado.get('codigo_verificacao'): _descartar_verificacao(gravado['codigo_verificacao'])
+    return gravado
+
 def carregar_todas_questoes(): return [] # Placeholder se necessário
+
+# ==============================================================================
+# 7B. DUPLICIDADE DE QUESTÕES (TF-IDF LOCAL, SEM API)
+# ==============================================================================
+IA_ATIVADA = duplicidade.DISPONIVEL
+
+def _detector_questoes():
+    det = duplicidade.obter_detector()
+    if det.total == 0 and not os.path.exists(det.arquivo):
+        reconstruir_indice_duplicidade()
+    return det
+
+def obter_detector_duplicidade():
+    """Detector do processo (ou None sem scikit-learn)."""
+    if not IA_ATIVADA: return None
+    try: return _detector_questoes()
+    except Exception as e:
+        print(f"[DUPLICIDADE] indisponível: {e}")
+        return None
+
+def reconstruir_indice_duplicidade():
+    """Lê todas as questões e regrava a matriz em disco. Retorna o total."""
+    docs = get_db().collection('questoes').stream()
+    det = duplicidade.obter_detector()
+    det.reconstruir((d.id, (d.to_dict() or {}).get('pergunta', '')) for d in docs)
+    return det.total
+
+def buscar_questoes_similares(texto, k=5):
+    """Top-k [(id, score, pergunta)] mais parecidas com o texto."""
+    if not IA_ATIVADA: return []
+    try: return _detector_questoes().similares(texto, k)
+    except Exception as e:
+        print(f"[DUPLICIDADE] erro na consulta: {e}")
+        return []
+
+def verificar_duplicidade_ia(nova_pergunta, threshold=0.85):
+    """
+    (True, "pergunta existente (score)") se algum enunciado tiver similaridade
+    >= threshold; senão (False, None).
+    """
+    similares = buscar_questoes_similares(nova_pergunta, k=1)
+    if similares and similares[0][1] >= threshold:
+        _, score, texto = similares[0]
+        return True, f"{texto} ({score:.0%})"
+    return False, None
+
+def indexar_questao_duplicidade(doc_id, pergunta):
+    if not IA_ATIVADA: return
+    try: _detector_questoes().adicionar(doc_id, pergunta)
+    except Exception as e: print(f"[DUPLICIDADE] erro ao indexar {doc_id}: {e}")
+
+def remover_questao_duplicidade(doc_id):
+    if not IA_ATIVADA: return
+    try: _detector_questoes().remover(doc_id)
+    except Exception as e: print(f"[DUPLICIDADE] erro ao remover {doc_id}: {e}")
+
+# ==============================================================================
+# 7C. ESTATÍSTICAS POR QUESTÃO (MATERIALIZADAS)
+# ------------------------------------------------------------------------------
+# estatisticas_questoes/{questao_id}: vezes_usada, acertos, taxa_acerto e
+# ultimo_uso, com pergunta/autor/dificuldade copiados da questão. Somados com
+# Increment num batch logo depois da transação que finaliza o exame (sem
+# leitura: exames simultâneos com as mesmas questões não disputam os
+# documentos); em seguida a taxa_acerto é regravada a partir das contagens
+# lidas em lote, para o ranking sair de uma consulta indexada. O histórico é
+# refeito pelo comando "reconstruir-estatisticas" do manutencao.py.
+# ==============================================================================
+ESTATISTICAS_QUESTOES_COLLECTION = "estatisticas_questoes"
+
+def _metadados_estatistica(questao_id, questao):
+    return {
+        "questao_id": str(questao_id),
+        "pergunta": str(questao.get('pergunta', ''))[:300],
+        "criado_por": questao.get('criado_por', '-'),
+        "dificuldade": questao.get('dificuldade', 1),
+        "categoria": questao.get('categoria', 'Geral'),
+    }
+
+def _taxa_acerto(vezes, acertos):
+    return (acertos / vezes) * 100 if vezes else 0.0
+
+def _com_taxa_acerto(dados):
+    vezes, certos = int(dados.get('vezes_usada', 0) or 0), int(dados.get('acertos', 0) or 0)
+    return {**dados, "taxa_acerto": _taxa_acerto(vezes, certos)}
+
+def registrar_estatisticas_exame(questoes, acertos):
+    """
+    Soma um uso (e o acerto) em cada questão do exame (escritas cegas, em
+    batch) e depois regrava a taxa_acerto com as contagens já somadas.
+    """
+    db = get_db()
+    col = db.collection(ESTATISTICAS_QUESTOES_COLLECTION)
+    itens = list(zip(questoes, acertos))
+    try:
+        for i in range(0, len(itens), 450):
+            batch = db.batch()
+            for q, ok in itens[i:i + 450]:
+                batch.set(col.document(str(q['id'])), {
+                    **_metadados_estatistica(q['id'], q),
+                    "vezes_usada": firestore.Increment(1),
+                    "acertos": firestore.Increment(1 if ok else 0),
+                    "ultimo_uso": firestore.SERVER_TIMESTAMP,
+                }, merge=True)
+            batch.commit()
+        # Exame concorrente pode regravar com uma contagem um pouco anterior;
+        # o próximo uso da questão (ou a reconstrução) corrige
+        refs = [col.document(str(q['id'])) for q, _ in itens]
+        snaps = [snap for snap in db.get_all(refs) if snap.exists]
+        for i in range(0, len(snaps), 450):
+            batch = db.batch()
+            for snap in snaps[i:i + 450]:
+                d = snap.to_dict() or {}
+                batch.update(snap.reference, {"taxa_acerto": _taxa_acerto(int(d.get('vezes_usada', 0) or 0),
+                                                                         int(d.get('acertos', 0) or 0))})
+            batch.commit()
+    except Exception as e:
+        # O resultado já está gravado; "reconstruir-estatisticas" recupera a contagem
+        print(f"[ESTATISTICAS] falha ao somar exame: {e}")
+
+def listar_questoes_mais_dificeis(limite=7):
+    """Questões com menor taxa de acerto (uma consulta indexada nos agregados)."""
+    try:
+        docs = get_db().collection(ESTATISTICAS_QUESTOES_COLLECTION)\
+                       .where('vezes_usada', '>', 0).order_by('taxa_acerto').limit(limite).stream()
+        return [_com_taxa_acerto(d.to_dict() or {}) for d in docs]
+    except Exception as e:
+        print(f"Erro ao listar questões difíceis: {e}")
+        return []
+
+def listar_estatisticas_autor(nome_autor):
+    """Agregados das questões de um autor, mais usadas primeiro."""
+    try:
+        docs = get_db().collection(ESTATISTICAS_QUESTOES_COLLECTION).where('criado_por', '==', nome_autor).stream()
+        return sorted((_com_taxa_acerto(d.to_dict() or {}) for d in docs), key=lambda d: d.get('vezes_usada', 0), reverse=True)
+    except Exception as e:
+        print(f"Erro ao listar estatísticas do autor: {e}")
+        return []
+
+def reconstruir_estatisticas_questoes():
+    """Refaz todos os agregados a partir de resultados (idempotente). Retorna o nº de questões."""
+    db = get_db()
+    contagem = {}
+    ultimo = {}
+    for snap in db.collection('resultados').stream():
+        r = snap.to_dict() or {}
+        if r.get('faixa') == 'Modo Rola': continue
+        for item in detalhes_resultado(r):
+            q_id = str(item.get('questao_id'))
+            vezes, certos = contagem.get(q_id, (0, 0))
+            contagem[q_id] = (vezes + 1, certos + (1 if item.get('acertou') else 0))
+            data = r.get('data')
+            if hasattr(data, 'timestamp') and (q_id not in ultimo or data > ultimo[q_id]): ultimo[q_id] = data
+
+    col = db.collection(ESTATISTICAS_QUESTOES_COLLECTION)
+    questoes = obter_carregador().obter_muitos('questoes', list(contagem))
+    existentes = {d.id for d in col.select([]).stream()}
+    escritas = [("set", q_id) for q_id in contagem] + [("del", q_id) for q_id in existentes - set(contagem)]
+    for i in range(0, len(escritas), 450):
+        batch = db.batch()
+        for op, q_id in escritas[i:i + 450]:
+            if op == "del": batch.delete(col.document(q_id)); continue
+            vezes, certos = contagem[q_id]
+            dados = _metadados_estatistica(q_id, questoes.get(q_id) or {"pergunta": "Questão Deletada"})
+            batch.set(col.document(q_id), {**dados, "vezes_usada": vezes, "acertos": certos,
+                                           "taxa_acerto": _taxa_acerto(vezes, certos), "ultimo_uso": ultimo.get(q_id)})
+        batch.commit()
+    return len(contagem)
+# ==============================================================================
+# 7D. VERIFICAÇÃO PÚBLICA DE CERTIFICADOS
+# ------------------------------------------------------------------------------
+# codigos_certificado/{codigo}: só o que a página pública mostra (nome, faixa,
+# data) + o id do resultado. Gravado na transação que finaliza o exame; o
+# histórico é indexado pelo comando "indexar-certificados" do manutencao.py.
+# Uma verificação custa no máximo uma leitura; códigos já vistos (válidos ou
+# não) saem de um LRU do processo.
+# ==============================================================================
+CODIGOS_CERTIFICADO_COLLECTION = "codigos_certificado"
+VERIFICACAO_CACHE_MAX = 4096
+VERIFICACAO_TTL_S = 3600            # código válido
+VERIFICACAO_TTL_NEGATIVO_S = 60     # código inexistente (pode ter acabado de ser emitido)
+_FORMATO_CODIGO = re.compile(r"^[A-Z0-9][A-Z0-9-]{5,39}$")
+
+_cache_verificacao = OrderedDict()  # codigo -> (expira_em, dados públicos ou None)
+_lock_verificacao = threading.Lock()
+
+def _dados_indice_certificado(resultado, resultado_id, data):
+    return {"nome": resultado.get('usuario', ''), "faixa": resultado.get('faixa', ''),
+            "data": data, "resultado_id": resultado_id}
+
+def _publico(codigo, d):
+    data = d.get('data')
+    if hasattr(data, 'date'): data = data.date().isoformat()
+    elif isinstance(data, str): data = data[:10]
+    else: data = None
+    return {"codigo": codigo, "nome": d.get('nome', ''), "faixa": d.get('faixa', ''), "data": data}
+
+def _descartar_verificacao(codigo):
+    with _lock_verificacao:
+        _cache_verificacao.pop(codigo, None)
+
+def verificar_certificado(codigo):
+    """
+    Dados públicos do certificado (codigo, nome, faixa, data) ou None se o
+    código não existe. Lê no máximo um documento; nenhum se estiver no cache.
+    """
+    codigo = str(codigo or "").strip().upper()
+    if not _FORMATO_CODIGO.match(codigo): return None
+    agora = time.monotonic()
+    with _lock_verificacao:
+        achado = _cache_verificacao.get(codigo)
+        if achado and achado[0] > agora:
+            _cache_verificacao.move_to_end(codigo)
+            return achado[1]
+    snap = get_db().collection(CODIGOS_CERTIFICADO_COLLECTION).document(codigo).get()
+    dados = _publico(codigo, snap.to_dict() or {}) if snap.exists else None
+    with _lock_verificacao:
+        _cache_verificacao[codigo] = (agora + (VERIFICACAO_TTL_S if dados else VERIFICACAO_TTL_NEGATIVO_S), dados)
+        _cache_verificacao.move_to_end(codigo)
+        while len(_cache_verificacao) > VERIFICACAO_CACHE_MAX: _cache_verificacao.popitem(last=False)
+    return dados
+
+def reconstruir_indice_certificados():
+    """Indexa os certificados de todos os resultados aprovados (idempotente). Retorna o nº de códigos."""
+    db = get_db()
+    col = db.collection(CODIGOS_CERTIFICADO_COLLECTION)
+    campos = ['usuario', 'faixa', 'data', 'codigo_verificacao']
+    itens = [(snap.id, snap.to_dict() or {}) for snap in
+             db.collection('resultados').where('aprovado', '==', True).select(campos).stream()]
+    itens = [(rid, r) for rid, r in itens if r.get('codigo_verificacao')]
+    for i in range(0, len(itens), 450):
+        batch = db.batch()
+        for rid, r in itens[i:i + 450]:
+            batch.set(col.document(str(r['codigo_verificacao'])), _dados_indice_certificado(r, rid, r.get('data')))
+        batch.commit()
+    with _lock_verificacao: _cache_verificacao.clear()
+    return len(itens)
 # ==============================================================================
 # 5B. AULAS V2 (BASE PROFISSIONAL - SEM QUEBRAR LEGADO)
 # ------------------------------------------------------------------------------
@@ -571,13 +1036,14 @@ def _validar_tipo_aula(tipo: str) -> str:
         return "texto"
     return t
 
-def _normalizar_bloco_v2(bloco: dict, modulo_id: str, idx: int):
+def _normalizar_bloco_v2(bloco: dict, modulo_id: str, idx: int, enviados: dict = None):
     """
     Converte blocos recebidos da UI (arquivos/link/texto) para o padrão V2.
     Aceita:
       - {"tipo":"texto","conteudo":"..."}
       - {"tipo":"imagem","arquivo": <UploadedFile>} ou {"tipo":"imagem","url_link":"..."}
       - {"tipo":"video","arquivo": <UploadedFile>} ou {"tipo":"video","url_link":"..."}
+    enviados: {idx: url} dos arquivos já enviados em lote; fora dele o arquivo sobe aqui.
     Retorna bloco V2:
       - texto:  {"tipo":"texto","conteudo":"..."}
       - imagem: {"tipo":"imagem","url":"...","nome":"...","origem":"upload|link"}
@@ -600,13 +1066,13 @@ def _normalizar_bloco_v2(bloco: dict, modulo_id: str, idx: int):
 
         # Upload (preferência se veio arquivo)
         if arquivo:
-            try:
-                ext = arquivo.name.split(".")[-1]
-            except Exception:
-                ext = "bin"
-
-            nome_arq = f"aulas_v2/{modulo_id}_{int(time.time())}_{idx}.{ext}"
-            url = upload_arquivo_simples(arquivo, nome_arq)
+            if enviados and idx in enviados:
+                url = enviados[idx]
+            else:
+                try: url = enviar_midia(arquivo)
+                except Exception as e:
+                    print(f"Erro upload bloco: {e}")
+                    url = None
 
             return {
                 "tipo": tipo,
@@ -664,13 +1130,15 @@ def criar_aula_v2(
     duracao_min: int,
     ordem: int = None,
     autor_id: str = None,
-    autor_nome: str = None
+    autor_nome: str = None,
+    progresso=None
 ) -> str:
     """
     Cria aula no padrão profissional (V2), em coleção separada: aulas_v2.
 
     - Não mexe no legado.
-    - Já suporta uploads e links nos blocos.
+    - Já suporta uploads e links nos blocos (arquivos sobem em paralelo;
+      progresso(enviados, total) opcional).
     - Retorna o ID do documento criado.
     """
     db = get_db()
@@ -685,11 +1153,13 @@ def criar_aula_v2(
         dur = 1
 
     if ordem is None:
-        ordem = obter_proxima_ordem_aula_v2(modulo_id)
+        ordem = _proxima_ordem_pela_estrutura(curso_id, modulo_id)
+
+    enviados = _enviar_arquivos_blocos(blocos, progresso)
 
     blocos_processados = []
     for idx, b in enumerate(blocos or []):
-        nb = _normalizar_bloco_v2(b, str(modulo_id), idx)
+        nb = _normalizar_bloco_v2(b, str(modulo_id), idx, enviados)
         if nb:
             # Evita bloco texto vazio demais
             if nb["tipo"] == "texto" and not str(nb.get("conteudo", "")).strip():
@@ -721,7 +1191,22 @@ def criar_aula_v2(
         "atualizado_em": firestore.SERVER_TIMESTAMP,
     }
 
-    _, ref = db.collection(AULAS_V2_COLLECTION).add(doc)
+    ref = db.collection(AULAS_V2_COLLECTION).document()
+
+    # Aula e estrutura do curso na mesma transação (uploads já foram feitos acima)
+    @firestore.transactional
+    def _tx(transaction):
+        est_ref, estrutura = _ler_estrutura_tx(transaction, curso_id)
+        cur_ref, tem_contador = _ler_contador_aulas_tx(transaction, curso_id)
+        transaction.set(ref, doc)
+        _ajustar_contador_aulas_tx(transaction, cur_ref, tem_contador, 1)
+        if estrutura is not None:
+            if _estrutura_upsert_aula(estrutura, modulo_id, ref.id, doc):
+                _gravar_estrutura_tx(transaction, est_ref, estrutura)
+            else:
+                transaction.delete(est_ref)
+
+    _tx(db.transaction())
     return ref.id
 
 
@@ -788,12 +1273,34 @@ def editar_aula_v2(aula_id: str, dados_atualizados: dict) -> bool:
             payload["ordem"] = 1
 
     payload["atualizado_em"] = firestore.SERVER_TIMESTAMP
+    aula_ref = db.collection(AULAS_V2_COLLECTION).document(str(aula_id))
+
+    # Aula e estrutura do curso na mesma transação
+    @firestore.transactional
+    def _tx(transaction):
+        snap = aula_ref.get(transaction=transaction)
+        if not snap.exists:
+            raise ValueError("Aula não encontrada.")
+        atual = snap.to_dict() or {}
+        est_ref, estrutura = _ler_estrutura_tx(transaction, atual.get("curso_id"))
+        cur_ref, tem_contador = _ler_contador_aulas_tx(transaction, atual.get("curso_id"))
+        transaction.update(aula_ref, payload)
+        if "ativo" in payload:
+            delta = int(bool(payload["ativo"])) - int(bool(atual.get("ativo", True)))
+            _ajustar_contador_aulas_tx(transaction, cur_ref, tem_contador, delta)
+        if estrutura is not None:
+            if _estrutura_upsert_aula(estrutura, atual.get("modulo_id"), snap.id, {**atual, **payload}):
+                _gravar_estrutura_tx(transaction, est_ref, estrutura)
+            else:
+                transaction.delete(est_ref)
+        return atual.get("blocos") or []
 
     try:
-        db.collection(AULAS_V2_COLLECTION).document(str(aula_id)).update(payload)
-        return True
+        blocos_antes = _tx(db.transaction())
     except:
         return False
+    if "blocos" in payload: _liberar_midias(blocos_antes, payload["blocos"])
+    return True
 
 
 def desativar_aula_v2(aula_id: str) -> bool:
@@ -839,80 +1346,283 @@ def obter_aulas_unificadas_por_modulo(modulo_id: str) -> list:
         return []
 
 # ==============================================================================
-# 6B. PROGRESSO DO ALUNO (BASE PROFISSIONAL)
+# 5D. ESTRUTURA MATERIALIZADA DO CURSO
+# ------------------------------------------------------------------------------
+# Um documento por curso (cursos_estrutura/{curso_id}) com os módulos ordenados
+# e o resumo de cada aula (sem blocos). Mantido nas mesmas transações que
+# escrevem módulos/aulas; se faltar ou ficar inconsistente, é apagado e
+# reconstruído na próxima leitura a partir das coleções de origem.
 # ==============================================================================
 
-PROGRESSO_COLLECTION = "progresso_curso"
+ESTRUTURA_CURSO_COLLECTION = "cursos_estrutura"
+ESTRUTURA_CURSO_VERSAO = 1
+
+def _resumo_aula(aula_id, dados, origem="v2"):
+    if origem == "v2":
+        qtd_blocos = len(dados.get("blocos") or [])
+    else:
+        conteudo = dados.get("conteudo")
+        blocos = conteudo.get("blocos") if isinstance(conteudo, dict) else None
+        qtd_blocos = len(blocos or [])
+    return {
+        "id": str(aula_id),
+        "titulo": dados.get("titulo", ""),
+        "tipo": dados.get("tipo", ""),
+        "duracao_min": dados.get("duracao_min", 0),
+        "ordem": int(dados.get("ordem", 0) or 0),
+        "qtd_blocos": qtd_blocos,
+        "origem": origem,
+    }
 
-def _get_or_create_progresso(usuario_id: str, curso_id: str) -> dict:
+def _resumo_modulo(modulo_id, dados, aulas=None):
+    return {
+        "id": str(modulo_id),
+        "titulo": dados.get("titulo", ""),
+        "descricao": dados.get("descricao", ""),
+        "ordem": int(dados.get("ordem", 0) or 0),
+        "aulas": aulas or [],
+    }
+
+def _ler_estrutura_tx(transaction, curso_id):
+    """Lê a estrutura dentro da transação. (ref, dict) ou (ref, None) se não existir."""
+    ref = get_db().collection(ESTRUTURA_CURSO_COLLECTION).document(str(curso_id))
+    snap = ref.get(transaction=transaction)
+    if not snap.exists: return ref, None
+    dados = snap.to_dict() or {}
+    if dados.get("versao") != ESTRUTURA_CURSO_VERSAO: return ref, None
+    dados.setdefault("modulos", [])
+    return ref, dados
+
+def _gravar_estrutura_tx(transaction, ref, estrutura):
+    estrutura["modulos"].sort(key=lambda m: int(m.get("ordem", 0) or 0))
+    estrutura["versao"] = ESTRUTURA_CURSO_VERSAO
+    estrutura["atualizado_em"] = firestore.SERVER_TIMESTAMP
+    transaction.set(ref, estrutura)
+    obter_carregador().esquecer(ESTRUTURA_CURSO_COLLECTION, ref.id)
+
+def _estrutura_upsert_aula(estrutura, modulo_id, aula_id, dados):
     """
-    Busca o progresso do aluno no curso.
-    Se não existir, cria.
+    Insere/atualiza (ou remove, se inativa) o resumo da aula V2 no módulo.
+    Retorna False quando a estrutura não dá conta do caso e deve ser reconstruída.
     """
+    modulo = next((m for m in estrutura["modulos"] if m.get("id") == str(modulo_id)), None)
+    if modulo is None: return False
+    aulas = [a for a in modulo.get("aulas", []) if a.get("id") != str(aula_id) and a.get("origem") == "v2"]
+    if dados.get("ativo", True):
+        aulas.append(_resumo_aula(aula_id, dados))
+    elif not aulas:
+        # Sem V2 ativa o módulo volta a mostrar o legado -> reconstrói
+        return False
+    aulas.sort(key=lambda a: int(a.get("ordem", 0) or 0))
+    modulo["aulas"] = aulas
+    return True
+
+def _proxima_ordem_pela_estrutura(curso_id, modulo_id):
+    estrutura = obter_estrutura_curso(curso_id)
+    for m in estrutura.get("modulos", []):
+        if m.get("id") == str(modulo_id):
+            ordens = [int(a.get("ordem", 0) or 0) for a in m.get("aulas", []) if a.get("origem") == "v2"]
+            return (max(ordens) + 1) if ordens else 1
+    return obter_proxima_ordem_aula_v2(modulo_id)
+
+def _montar_estrutura(curso_id, transaction=None):
+    """Estrutura a partir de modulos/aulas_v2/aulas (leituras na transação, se houver)."""
     db = get_db()
+    modulos = []
+    for m in db.collection("modulos").where("curso_id", "==", str(curso_id)).stream(transaction=transaction):
+        aulas_v2 = [dict(d.to_dict() or {}, id=d.id) for d in db.collection(AULAS_V2_COLLECTION)
+                    .where("modulo_id", "==", m.id).where("ativo", "==", True).stream(transaction=transaction)]
+        if aulas_v2:
+            aulas = sorted((_resumo_aula(a["id"], a) for a in aulas_v2), key=lambda a: a["ordem"])
+        else:
+            aulas = [_resumo_aula(d.id, d.to_dict() or {}, origem="legado")
+                     for d in db.collection("aulas").where("modulo_id", "==", m.id).stream(transaction=transaction)]
+        modulos.append(_resumo_modulo(m.id, m.to_dict() or {}, aulas))
+    modulos.sort(key=lambda x: x["ordem"])
+    return {"curso_id": str(curso_id), "versao": ESTRUTURA_CURSO_VERSAO, "modulos": modulos}
+
+def reconstruir_estrutura_curso(curso_id):
+    """
+    Monta a estrutura a partir de modulos/aulas_v2/aulas e grava. Retorna o dict.
+    Numa transação que lê a própria estrutura: se outra escrita (upsert de aula,
+    exclusão de módulo ou outra reconstrução) acontece no meio, a transação
+    repete; se alguém já gravou uma estrutura válida, usa a dela.
+    """
+    db = get_db()
+    ref = db.collection(ESTRUTURA_CURSO_COLLECTION).document(str(curso_id))
+
+    @firestore.transactional
+    def _tx(transaction):
+        _, atual = _ler_estrutura_tx(transaction, curso_id)
+        if atual is not None: return atual
+        estrutura = _montar_estrutura(curso_id, transaction)
+        transaction.set(ref, {**estrutura, "atualizado_em": firestore.SERVER_TIMESTAMP})
+        return estrutura
+
     try:
-        q = (
-            db.collection(PROGRESSO_COLLECTION)
-            .where("usuario_id", "==", str(usuario_id))
-            .where("curso_id", "==", str(curso_id))
-            .limit(1)
-            .stream()
-        )
-        for d in q:
-            data = d.to_dict()
-            data["id"] = d.id
-            return data
-    except:
-        pass
+        estrutura = _tx(db.transaction())
+    except Exception as e:
+        # Sem gravar: a próxima leitura tenta de novo
+        print(f"[ESTRUTURA] erro ao gravar {curso_id}: {e}")
+        estrutura = _montar_estrutura(curso_id)
+    obter_carregador().esquecer(ESTRUTURA_CURSO_COLLECTION, curso_id)
+    return estrutura
+
+def obter_estrutura_curso(curso_id):
+    """Estrutura do curso em 1 leitura; reconstrói se ainda não existir."""
+    dados = obter_carregador().obter(ESTRUTURA_CURSO_COLLECTION, curso_id)
+    if dados and dados.get("versao") == ESTRUTURA_CURSO_VERSAO:
+        return dados
+    return reconstruir_estrutura_curso(curso_id)
+
+def invalidar_estrutura_curso(curso_id):
+    try: get_db().collection(ESTRUTURA_CURSO_COLLECTION).document(str(curso_id)).delete()
+    except: pass
+    obter_carregador().esquecer(ESTRUTURA_CURSO_COLLECTION, curso_id)
+
+def _invalidar_estrutura_do_modulo(modulo_id):
+    mod = obter_carregador().obter("modulos", modulo_id)
+    if mod and mod.get("curso_id"): invalidar_estrutura_curso(mod["curso_id"])
+
+def obter_aula(aula_id):
+    """Aula completa (com blocos) no formato da UI. Tenta V2 e depois o legado."""
+    if not aula_id: return None
+    carregador = obter_carregador()
+    dados = carregador.obter(AULAS_V2_COLLECTION, aula_id)
+    if dados is not None:
+        return {
+            "id": str(aula_id),
+            "titulo": dados.get("titulo"),
+            "tipo": dados.get("tipo"),
+            "duracao_min": dados.get("duracao_min", 0),
+            "conteudo": {"blocos": dados.get("blocos", [])},
+        }
+    dados = carregador.obter("aulas", aula_id)
+    if dados is not None:
+        return {"id": str(aula_id), **dados}
+    return None
 
-    # cria se não existir
-    doc = {
+# ==============================================================================
+# 6B. PROGRESSO DO ALUNO (BASE PROFISSIONAL)
+# ==============================================================================
+
+PROGRESSO_COLLECTION = "progresso_curso"
+
+def progresso_doc_id(usuario_id: str, curso_id: str) -> str:
+    """ID determinístico do progresso: 1 documento por (aluno, curso)."""
+    return f"{usuario_id}_{curso_id}"
+
+def _progresso_inicial(usuario_id: str, curso_id: str) -> dict:
+    return {
         "usuario_id": str(usuario_id),
         "curso_id": str(curso_id),
         "aulas_concluidas": [],
         "progresso_percentual": 0,
         "ultima_aula_id": "",
         "concluido": False,
-        "criado_em": firestore.SERVER_TIMESTAMP,
-        "atualizado_em": firestore.SERVER_TIMESTAMP,
     }
 
-    _, ref = db.collection(PROGRESSO_COLLECTION).add(doc)
-    doc["id"] = ref.id
-    return doc
-
-
 def marcar_aula_concluida(usuario_id: str, curso_id: str, aula_id: str):
     """
     Marca uma aula como concluída e recalcula o progresso.
+    1 leitura + 1 escrita no documento de progresso (cria se não existir).
     """
     db = get_db()
-    prog = _get_or_create_progresso(usuario_id, curso_id)
+    ref = db.collection(PROGRESSO_COLLECTION).document(progresso_doc_id(usuario_id, curso_id))
 
-    aulas_concluidas = set(prog.get("aulas_concluidas", []))
-    aulas_concluidas.add(str(aula_id))
+    # total de aulas do curso (V2) - contador mantido no doc do curso
+    total_aulas = obter_total_aulas_ativas(curso_id)
 
-    # total de aulas do curso (V2)
-    total_aulas = contar_total_aulas_curso_v2(curso_id)
-    concluidas = len(aulas_concluidas)
+    @firestore.transactional
+    def _tx(transaction):
+        snap = ref.get(transaction=transaction)
+        prog = snap.to_dict() if snap.exists else None
 
-    progresso = int((concluidas / total_aulas) * 100) if total_aulas > 0 else 0
-    concluido = progresso >= 100
+        aulas_concluidas = set((prog or {}).get("aulas_concluidas", []))
+        aulas_concluidas.add(str(aula_id))
+        concluidas = len(aulas_concluidas)
 
-    db.collection(PROGRESSO_COLLECTION).document(prog["id"]).update({
-        "aulas_concluidas": list(aulas_concluidas),
-        "progresso_percentual": progresso,
-        "ultima_aula_id": str(aula_id),
-        "concluido": concluido,
-        "atualizado_em": firestore.SERVER_TIMESTAMP,
-    })
+        progresso = int((concluidas / total_aulas) * 100) if total_aulas > 0 else 0
+        concluido = progresso >= 100
 
-    return progresso, concluido
+        dados = {
+            "aulas_concluidas": list(aulas_concluidas),
+            "progresso_percentual": progresso,
+            "ultima_aula_id": str(aula_id),
+            "concluido": concluido,
+            "atualizado_em": firestore.SERVER_TIMESTAMP,
+        }
+        if prog is None:
+            dados = {**_progresso_inicial(usuario_id, curso_id), **dados,
+                     "criado_em": firestore.SERVER_TIMESTAMP}
+        transaction.set(ref, dados, merge=True)
+        return progresso, concluido
+
+    resultado = _tx(db.transaction())
+    obter_carregador().esquecer(PROGRESSO_COLLECTION, ref.id)
+    return resultado
+
+
+def _ler_contador_aulas_tx(transaction, curso_id):
+    """(ref do curso, True se o curso já tem o contador total_aulas_ativas)."""
+    ref = get_db().collection('cursos').document(str(curso_id))
+    snap = ref.get(transaction=transaction)
+    return ref, snap.exists and "total_aulas_ativas" in (snap.to_dict() or {})
+
+def _ajustar_contador_aulas_tx(transaction, ref, tem_contador, delta):
+    # Sem contador ainda: não inventa valor, obter_total_aulas_ativas reconcilia
+    if not tem_contador or not delta: return
+    transaction.update(ref, {"total_aulas_ativas": firestore.Increment(delta)})
+    obter_carregador().esquecer('cursos', ref.id)
+
+def reconciliar_total_aulas_curso(curso_id: str, forcar: bool = False) -> int:
+    """
+    Recalcula total_aulas_ativas pela contagem completa e grava no curso.
+    Numa transação que lê o curso: uma aula criada/desativada durante a
+    contagem faz a transação repetir. Sem forcar, só grava se o contador
+    ainda não existe (outro processo pode ter reconciliado antes).
+    """
+    db = get_db()
+    cur_ref = db.collection('cursos').document(str(curso_id))
+
+    @firestore.transactional
+    def _tx(transaction):
+        snap = cur_ref.get(transaction=transaction)
+        atual = (snap.to_dict() or {}).get("total_aulas_ativas") if snap.exists else None
+        if not snap.exists or (atual is not None and not forcar):
+            return max(int(atual or 0), 0)
+        total = 0
+        for m in db.collection("modulos").where("curso_id", "==", str(curso_id)).stream(transaction=transaction):
+            total += sum(1 for _ in db.collection(AULAS_V2_COLLECTION)
+                                      .where("modulo_id", "==", m.id)
+                                      .where("ativo", "==", True)
+                                      .stream(transaction=transaction))
+        transaction.update(cur_ref, {"total_aulas_ativas": total})
+        return total
+
+    try:
+        total = _tx(db.transaction())
+        obter_carregador().esquecer('cursos', curso_id)
+        return total
+    except Exception as e:
+        print(f"[CONTADOR_AULAS] erro ao reconciliar {curso_id}: {e}")
+        return contar_total_aulas_curso_v2(curso_id)
+
+def obter_total_aulas_ativas(curso_id: str) -> int:
+    """
+    Total de aulas V2 ativas do curso (1 leitura). Reconcilia se o contador não existir.
+    """
+    curso = obter_carregador().obter('cursos', curso_id) or {}
+    total = curso.get("total_aulas_ativas")
+    if total is None:
+        return reconciliar_total_aulas_curso(curso_id)
+    return max(int(total or 0), 0)
 
 
 def contar_total_aulas_curso_v2(curso_id: str) -> int:
     """
-    Conta todas as aulas V2 ativas do curso.
+    Conta todas as aulas V2 ativas do curso (varredura completa).
+    Uso normal: obter_total_aulas_ativas (contador mantido).
     """
     db = get_db()
     try:
@@ -928,9 +1638,10 @@ def contar_total_aulas_curso_v2(curso_id: str) -> int:
 
 def obter_progresso_curso(usuario_id: str, curso_id: str) -> dict:
     """
-    Retorna o progresso atual do aluno no curso.
+    Retorna o progresso atual do aluno no curso (leitura direta, sem criar).
     """
-    prog = _get_or_create_progresso(usuario_id, curso_id)
+    prog = obter_carregador().obter(PROGRESSO_COLLECTION, progresso_doc_id(usuario_id, curso_id)) \
+        or _progresso_inicial(usuario_id, curso_id)
     return {
         "progresso_percentual": prog.get("progresso_percentual", 0),
         "concluido": prog.get("concluido", False),
@@ -953,6 +1664,50 @@ def calcular_split_pagamento(valor_total):
     
     return round(parte_plataforma, 2), round(parte_professor, 2)
 
+def _escrever_compra_curso(escritor, usuario_id, curso_id, dados_curso, valor_total, dados_pagamento=None, saldo=None):
+    """
+    Adiciona inscrição + lançamento financeiro + saldo do professor à transação.
+    saldo: retorno de _ler_saldo_professor_tx (lido antes das escritas).
+    Quem chama faz o commit.
+    """
+    db = get_db()
+    professor_id = dados_curso.get('professor_id')
+
+    # Calcula o Split
+    v_app, v_prof = calcular_split_pagamento(valor_total)
+
+    # A. Criar Inscrição
+    inscricao_ref = db.collection('inscricoes').document()
+    escritor.set(inscricao_ref, {
+        "usuario_id": str(usuario_id),
+        "curso_id": str(curso_id),
+        "data_inscricao": firestore.SERVER_TIMESTAMP,
+        "progresso": 0,
+        "status": "ativo",
+        "valor_pago": float(valor_total),
+        "aulas_concluidas": []
+    })
+
+    # B. Registrar Transação Financeira (Para seu controle de saque depois)
+    transacao_ref = db.collection('financeiro').document()
+    escritor.set(transacao_ref, {
+        "tipo": "venda_curso",
+        "curso_id": str(curso_id),
+        "curso_titulo": dados_curso.get('titulo'),
+        "comprador_id": str(usuario_id),
+        "professor_id": str(professor_id),
+        "valor_total": float(valor_total),
+        "receita_plataforma": v_app,      # Os 10%
+        "receita_professor": v_prof,      # Os 90%
+        "data_venda": firestore.SERVER_TIMESTAMP,
+        "status_pagamento": "aprovado",
+        **(dados_pagamento or {})
+    })
+
+    # C. Saldo do professor + balde do mês (mesma escrita)
+    if saldo:
+        _lancar_saldo_professor(escritor, *saldo, receita=v_prof, vendas=1)
+
 def processar_compra_curso(usuario_id, curso_id, valor_total):
     """
     Registra a inscrição E a transação financeira separada.
@@ -961,75 +1716,147 @@ def processar_compra_curso(usuario_id, curso_id, valor_total):
     
     # 1. Busca dados do curso para saber quem é o professor
     curso_ref = db.collection('cursos').document(curso_id)
-    curso_doc = curso_ref.get()
-    
-    if not curso_doc.exists:
-        return False, "Curso não encontrado."
+
+    @firestore.transactional
+    def _tx(transaction):
+        curso_doc = curso_ref.get(transaction=transaction)
+        if not curso_doc.exists:
+            return None
+        dados_curso = curso_doc.to_dict()
+        professor_id = dados_curso.get('professor_id')
+        saldo = _ler_saldo_professor_tx(transaction, professor_id) if professor_id else None
+        _escrever_compra_curso(transaction, usuario_id, curso_id, dados_curso, valor_total, saldo=saldo)
+        return dados_curso
         
-    dados_curso = curso_doc.to_dict()
-    professor_id = dados_curso.get('professor_id')
-    
-    # 2. Calcula o Split
-    v_app, v_prof = calcular_split_pagamento(valor_total)
-    
     try:
-        batch = db.batch()
-        
-        # A. Criar Inscrição
-        inscricao_ref = db.collection('inscricoes').document()
-        batch.set(inscricao_ref, {
-            "usuario_id": str(usuario_id),
-            "curso_id": str(curso_id),
-            "data_inscricao": firestore.SERVER_TIMESTAMP,
-            "progresso": 0,
-            "status": "ativo",
-            "valor_pago": float(valor_total),
-            "aulas_concluidas": []
-        })
-        
-        # B. Registrar Transação Financeira (Para seu controle de saque depois)
-        transacao_ref = db.collection('financeiro').document()
-        batch.set(transacao_ref, {
-            "tipo": "venda_curso",
-            "curso_id": str(curso_id),
-            "curso_titulo": dados_curso.get('titulo'),
-            "comprador_id": str(usuario_id),
-            "professor_id": str(professor_id),
-            "valor_total": float(valor_total),
-            "receita_plataforma": v_app,      # Os 10%
-            "receita_professor": v_prof,      # Os 90%
-            "data_venda": firestore.SERVER_TIMESTAMP,
-            "status_pagamento": "aprovado"    # Em prod, viria do Webhook
-        })
-        
-        batch.commit()
+        dados_curso = _tx(db.transaction())
+        if dados_curso is None:
+            return False, "Curso não encontrado."
+        if dados_curso.get('professor_id'):
+            obter_carregador().esquecer(SALDOS_COLLECTION, dados_curso['professor_id'])
         return True, "Pagamento aprovado e inscrição realizada!"
         
     except Exception as e:
         print(f"Erro financeiro: {e}")
         return False, f"Erro ao processar: {e}"
 
+# Saldo agregado por professor (saldos_professores/{professor_id}) com baldes
+# mensais em saldos_professores/{professor_id}/meses/{AAAA-MM}. Atualizados com
+# Increment na mesma transação da venda/saque: ler o saldo custa 1 documento.
+# Só recebe incrementos depois de reconciliado (reconciliado=True) com o
+# histórico; antes disso a venda/saque só grava o lançamento e a reconciliação
+# soma tudo.
+SALDOS_COLLECTION = "saldos_professores"
+TAMANHO_PAGINA_EXTRATO = 20
+
+def _chave_mes(data=None):
+    return (data or datetime.now()).strftime("%Y-%m")
+
+def _ler_saldo_professor_tx(transaction, professor_id):
+    """(ref do saldo, True se o agregado já foi reconciliado com o histórico)."""
+    ref = get_db().collection(SALDOS_COLLECTION).document(str(professor_id))
+    snap = ref.get(transaction=transaction)
+    return ref, snap.exists and bool((snap.to_dict() or {}).get("reconciliado"))
+
+def _lancar_saldo_professor(transaction, ref, reconciliado, receita=0.0, vendas=0, saque=0.0):
+    """Adiciona à transação os incrementos do saldo e do balde do mês."""
+    # Sem agregado ainda (ou parcial): não inventa valor, a reconciliação soma o histórico
+    if not reconciliado: return
+    inc = {
+        "receita_total": firestore.Increment(float(receita)),
+        "qtd_vendas": firestore.Increment(int(vendas)),
+        "total_sacado": firestore.Increment(float(saque)),
+        "saldo": firestore.Increment(float(receita) - float(saque)),
+    }
+    transaction.update(ref, {**inc, "atualizado_em": firestore.SERVER_TIMESTAMP})
+    mes = _chave_mes()
+    transaction.set(ref.collection("meses").document(mes), {**inc, "mes": mes}, merge=True)
+
+def reconciliar_saldo_professor(professor_id):
+    """
+    Recalcula saldo e baldes mensais a partir de financeiro + saques e grava
+    (com reconciliado=True). Numa transação: uma venda/saque concorrente faz
+    uma das duas repetir, e nenhum lançamento fica de fora do total.
+    Usado na primeira leitura de quem ainda não tem o agregado (e na manutenção).
+    """
+    db = get_db()
+    ref = db.collection(SALDOS_COLLECTION).document(str(professor_id))
+
+    @firestore.transactional
+    def _tx(transaction):
+        ref.get(transaction=transaction)
+        meses = {}
+        def _balde(data):
+            mes = _chave_mes(data.replace(tzinfo=None)) if hasattr(data, "strftime") else _chave_mes()
+            return meses.setdefault(mes, {"receita_total": 0.0, "qtd_vendas": 0, "total_sacado": 0.0})
+
+        for v in db.collection('financeiro').where('professor_id', '==', str(professor_id)).stream(transaction=transaction):
+            d = v.to_dict() or {}
+            b = _balde(d.get('data_venda'))
+            b["receita_total"] += float(d.get('receita_professor', 0) or 0)
+            b["qtd_vendas"] += 1
+        for sq in db.collection('saques').where('professor_id', '==', str(professor_id)).stream(transaction=transaction):
+            d = sq.to_dict() or {}
+            _balde(d.get('data_solicitacao'))["total_sacado"] += float(d.get('valor_solicitado', 0) or 0)
+
+        total = {"receita_total": 0.0, "qtd_vendas": 0, "total_sacado": 0.0}
+        for mes, b in meses.items():
+            b["saldo"] = b["receita_total"] - b["total_sacado"]
+            transaction.set(ref.collection("meses").document(mes), {**b, "mes": mes})
+            for k in total: total[k] += b[k]
+        total["saldo"] = total["receita_total"] - total["total_sacado"]
+        transaction.set(ref, {**total, "professor_id": str(professor_id), "reconciliado": True,
+                              "atualizado_em": firestore.SERVER_TIMESTAMP})
+        return total
+
+    total = _tx(db.transaction())
+    obter_carregador().esquecer(SALDOS_COLLECTION, professor_id)
+    return total
+
 def obter_resumo_financeiro(professor_id):
     """
-    Retorna o saldo total e o histórico de vendas do professor.
+    Retorna o agregado do professor: saldo, receita_total, total_sacado, qtd_vendas.
+    """
+    try:
+        dados = obter_carregador().obter(SALDOS_COLLECTION, professor_id)
+        if dados is None or not dados.get("reconciliado"):
+            dados = reconciliar_saldo_professor(professor_id)
+        return {
+            "saldo": float(dados.get("saldo", 0) or 0),
+            "receita_total": float(dados.get("receita_total", 0) or 0),
+            "total_sacado": float(dados.get("total_sacado", 0) or 0),
+            "qtd_vendas": int(dados.get("qtd_vendas", 0) or 0),
+        }
+    except Exception as e:
+        print(f"Erro ao buscar financeiro: {e}")
+        return {"saldo": 0.0, "receita_total": 0.0, "total_sacado": 0.0, "qtd_vendas": 0}
+
+def listar_saldos_mensais(professor_id, limite=12):
+    """Baldes mensais mais recentes (lista de dicts com 'mes')."""
+    try:
+        ref = get_db().collection(SALDOS_COLLECTION).document(str(professor_id)).collection("meses")
+        docs = ref.order_by("mes", direction=firestore.Query.DESCENDING).limit(limite).stream()
+        return [d.to_dict() for d in docs]
+    except: return []
+
+def listar_extrato_vendas(professor_id, cursor=None, limite=TAMANHO_PAGINA_EXTRATO):
+    """
+    Uma página do extrato (mais recentes primeiro).
+    Retorna (linhas, proximo_cursor); proximo_cursor é None na última página.
     """
     db = get_db()
     try:
-        # Busca apenas as transações deste professor
-        vendas = db.collection('financeiro')\
-                   .where('professor_id', '==', professor_id)\
-                   .order_by('data_venda', direction=firestore.Query.DESCENDING)\
-                   .stream()
-        
+        q = db.collection('financeiro')\
+              .where('professor_id', '==', professor_id)\
+              .order_by('data_venda', direction=firestore.Query.DESCENDING)
+        if cursor is not None:
+            q = q.start_after(cursor)
+        docs = list(q.limit(limite).stream())
+
         historico = []
-        saldo_total = 0.0
-        
-        for v in vendas:
+        for v in docs:
             dado = v.to_dict()
-            # Soma apenas a parte que cabe ao professor (90%)
             receita = float(dado.get('receita_professor', 0))
-            saldo_total += receita
-            
             # Formata para exibir na tabela
             historico.append({
                 "Data": dado.get('data_venda').strftime("%d/%m/%Y %H:%M") if dado.get('data_venda') else "-",
@@ -1038,24 +1865,33 @@ def obter_resumo_financeiro(professor_id):
                 "Valor Venda": f"R$ {dado.get('valor_total', 0):.2f}",
                 "Sua Parte (90%)": f"R$ {receita:.2f}"
             })
-            
-        return saldo_total, historico
-        
+
+        proximo = docs[-1] if len(docs) == limite else None
+        return historico, proximo
+
     except Exception as e:
-        print(f"Erro ao buscar financeiro: {e}")
-        return 0.0, []
+        print(f"Erro ao buscar extrato: {e}")
+        return [], None
 
 def solicitar_saque(professor_id, valor):
     """
-    Simula uma solicitação de saque (apenas registro)
+    Simula uma solicitação de saque (apenas registro) e debita o saldo.
     """
     db = get_db()
-    db.collection('saques').add({
-        "professor_id": professor_id,
-        "valor_solicitado": valor,
-        "data_solicitacao": firestore.SERVER_TIMESTAMP,
-        "status": "pendente"
-    })
+
+    @firestore.transactional
+    def _tx(transaction):
+        saldo = _ler_saldo_professor_tx(transaction, professor_id)
+        transaction.set(db.collection('saques').document(), {
+            "professor_id": professor_id,
+            "valor_solicitado": valor,
+            "data_solicitacao": firestore.SERVER_TIMESTAMP,
+            "status": "pendente"
+        })
+        _lancar_saldo_professor(transaction, *saldo, saque=valor)
+
+    _tx(db.transaction())
+    obter_carregador().esquecer(SALDOS_COLLECTION, professor_id)
     return True
 # ==============================================================================
 # 9. INTEGRAÇÃO MERCADO PAGO (REAL)
@@ -1066,14 +1902,23 @@ def inicializar_sdk_mp():
     token = st.secrets["mercadopago"]["access_token"] if "mercadopago" in st.secrets else ""
     return mercadopago.SDK(token)
 
+# Pagamentos são confirmados pelo receptor de notificações (webhook_mp.py), que
+# grava o status em pagamentos_mp/{referencia}. A tela só lê esse documento.
+PAGAMENTOS_MP_COLLECTION = "pagamentos_mp"
+PAGAMENTOS_MP_PROCESSADOS = "pagamentos_mp_processados"  # 1 doc por payment_id
+
 def gerar_preferencia_pagamento(curso, usuario):
     """
     Cria a intenção de pagamento no Mercado Pago.
+    Retorna (init_point, referencia) - referencia é o id do doc local do pagamento.
     """
     sdk = inicializar_sdk_mp()
+    db = get_db()
+    referencia = uuid.uuid4().hex
     
     # Configurações da Preferência
     preference_data = {
+        "external_reference": referencia,
         "items": [
             {
                 "id": str(curso['id']),
@@ -1101,44 +1946,111 @@ def gerar_preferencia_pagamento(curso, usuario):
         "statement_descriptor": "BJJ DIGITAL",
         "expires": False
     }
+    if "mercadopago" in st.secrets and st.secrets["mercadopago"].get("webhook_url"):
+        preference_data["notification_url"] = st.secrets["mercadopago"]["webhook_url"]
 
     try:
         preference_response = sdk.preference().create(preference_data)
         preference = preference_response["response"]
+
+        db.collection(PAGAMENTOS_MP_COLLECTION).document(referencia).set({
+            "usuario_id": str(usuario['id']),
+            "curso_id": str(curso['id']),
+            "valor": float(curso['preco']),
+            "preference_id": preference["id"],
+            "status": "pendente",
+            "criado_em": firestore.SERVER_TIMESTAMP,
+        })
         
-        return preference["init_point"], preference["id"]
+        return preference["init_point"], referencia
         
     except Exception as e:
         print(f"Erro MP: {e}")
         return None, None
 
-def verificar_status_pagamento_mp(preference_id):
+def obter_status_pagamento_local(referencia):
     """
-    Verifica na API se alguém pagou essa preferência.
-    Nota: Em produção ideal, usaria Webhook. Aqui usamos busca ativa.
+    Status do pagamento gravado pelo webhook (1 leitura, sem chamar a API).
+    Retorna (aprovado, mensagem).
     """
-    sdk = inicializar_sdk_mp()
-    
     try:
-        # Busca pagamentos associados a essa preferência
-        filters = {"preference_id": preference_id}
-        search_result = sdk.payment().search(filters)
-        
-        results = search_result["response"]["results"]
-        
-        if results:
-            ultimo_pagamento = results[0] # Pega o mais recente
-            status = ultimo_pagamento["status"]
-            status_detail = ultimo_pagamento["status_detail"]
-            
-            if status == "approved":
-                return True, "Pagamento Aprovado!"
-            elif status == "pending":
-                return False, "Pagamento ainda está pendente. Aguarde uns instantes."
-            else:
-                return False, f"Status: {status} - {status_detail}"
-        else:
-            return False, "Nenhum pagamento encontrado ainda para este pedido."
-            
+        snap = get_db().collection(PAGAMENTOS_MP_COLLECTION).document(str(referencia)).get()
     except Exception as e:
         return False, f"Erro ao verificar: {e}"
+    if not snap.exists:
+        return False, "Pedido não encontrado."
+    dados = snap.to_dict() or {}
+    status = dados.get("status", "pendente")
+    if status == "aprovado":
+        return True, "Pagamento Aprovado!"
+    if status == "pendente":
+        return False, "Pagamento ainda não confirmado. Aguarde uns instantes."
+    return False, f"Status: {status} - {dados.get('status_detalhe', '')}"
+
+def consultar_pagamento_mp(payment_id):
+    """Busca o pagamento na API (fonte da verdade para o webhook)."""
+    resposta = inicializar_sdk_mp().payment().get(payment_id)
+    if resposta.get("status") != 200:
+        raise RuntimeError(f"MP respondeu {resposta.get('status')} para pagamento {payment_id}")
+    return resposta["response"]
+
+def registrar_pagamento_mp(pagamento):
+    """
+    Aplica um pagamento do MP (dict da API) exatamente uma vez.
+    Aprovado -> inscrição + financeiro + saldo + status local, numa transação
+    que também marca o payment_id como processado. Retorna o resultado (str).
+    """
+    db = get_db()
+    payment_id = str(pagamento.get("id") or "")
+    referencia = str(pagamento.get("external_reference") or "")
+    status_mp = pagamento.get("status")
+    if not payment_id or not referencia:
+        return "ignorado"
+
+    pag_ref = db.collection(PAGAMENTOS_MP_COLLECTION).document(referencia)
+    proc_ref = db.collection(PAGAMENTOS_MP_PROCESSADOS).document(payment_id)
+
+    @firestore.transactional
+    def _tx(transaction):
+        proc = proc_ref.get(transaction=transaction)
+        if proc.exists and (proc.to_dict() or {}).get("status") == "approved":
+            return "duplicado"
+        pag = pag_ref.get(transaction=transaction)
+        if not pag.exists:
+            return "ignorado"
+        local = pag.to_dict() or {}
+        if local.get("status") == "aprovado":
+            return "duplicado"
+
+        base = {"payment_id": payment_id, "status_detalhe": pagamento.get("status_detail", ""),
+                "atualizado_em": firestore.SERVER_TIMESTAMP}
+        if status_mp != "approved":
+            novo = "pendente" if status_mp in ("pending", "in_process", "authorized") else str(status_mp)
+            transaction.update(pag_ref, {**base, "status": novo})
+            transaction.set(proc_ref, {"status": status_mp, "referencia": referencia,
+                                       "processado_em": firestore.SERVER_TIMESTAMP})
+            return novo
+
+        # Valor pago tem que bater com o pedido
+        valor_pago = float(pagamento.get("transaction_amount") or 0)
+        if valor_pago + 0.01 < float(local.get("valor", 0) or 0):
+            transaction.update(pag_ref, {**base, "status": "divergente", "valor_pago": valor_pago})
+            return "divergente"
+
+        curso = db.collection('cursos').document(local["curso_id"]).get(transaction=transaction)
+        if not curso.exists:
+            transaction.update(pag_ref, {**base, "status": "erro", "status_detalhe": "curso não encontrado"})
+            return "erro"
+        professor_id = (curso.to_dict() or {}).get('professor_id')
+        saldo = _ler_saldo_professor_tx(transaction, professor_id) if professor_id else None
+
+        _escrever_compra_curso(transaction, local["usuario_id"], local["curso_id"], curso.to_dict(),
+                               local.get("valor", valor_pago),
+                               {"mp_payment_id": payment_id, "mp_referencia": referencia}, saldo=saldo)
+        transaction.update(pag_ref, {**base, "status": "aprovado", "valor_pago": valor_pago,
+                                     "aprovado_em": firestore.SERVER_TIMESTAMP})
+        transaction.set(proc_ref, {"status": "approved", "referencia": referencia,
+                                   "processado_em": firestore.SERVER_TIMESTAMP})
+        return "aprovado"
+
+    return _tx(db.transaction())
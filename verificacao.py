@@ -0,0 +1,77 @@
+# main/verificacao.py
+"""
+Endpoint HTTP público de verificação de certificados (processo separado do
+Streamlit), consultado pela página verificar.html do QR code.
+
+    GET /verificar?codigo=BJJDIGITAL-2025-0001
+    200 {"valido": true, "codigo": ..., "nome": ..., "faixa": ..., "data": "AAAA-MM-DD"}
+    404 {"valido": false, "codigo": ...}
+
+Só os campos públicos saem do índice codigos_certificado (utils.verificar_certificado:
+no máximo uma leitura, LRU com cache negativo). As respostas levam
+Cache-Control para o navegador/CDN não repetirem a consulta.
+
+Uso (na raiz do projeto, com .streamlit/secrets.toml):
+    python verificacao.py [--porta 8082]
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO_VERIFICACAO = "/verificar"
+PORTA_PADRAO = 8082
+MAX_AGE_VALIDO = 3600
+MAX_AGE_INVALIDO = 60
+ORIGEM_PERMITIDA = "*"      # a página de verificação é estática, em outro domínio
+
+def criar_handler(verificar):
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, codigo, corpo, max_age):
+            dados = json.dumps(corpo, ensure_ascii=False).encode()
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            self.send_header("Cache-Control", f"public, max-age={max_age}" if max_age else "no-store")
+            self.send_header("Access-Control-Allow-Origin", ORIGEM_PERMITIDA)
+            self.end_headers()
+            if self.command != "HEAD": self.wfile.write(dados)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != CAMINHO_VERIFICACAO:
+                return self._responder(404, {"erro": "nao encontrado"}, 0)
+            codigo = (parse_qs(url.query).get("codigo") or [""])[0].strip().upper()
+            if not codigo:
+                return self._responder(400, {"erro": "informe o codigo"}, 0)
+            try:
+                dados = verificar(codigo)
+            except Exception as e:
+                print(f"[VERIFICACAO] {codigo}: erro {e}")
+                return self._responder(503, {"erro": "indisponivel"}, 0)
+            if dados is None:
+                return self._responder(404, {"valido": False, "codigo": codigo}, MAX_AGE_INVALIDO)
+            self._responder(200, {"valido": True, **dados}, MAX_AGE_VALIDO)
+
+        do_HEAD = do_GET
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verificação pública de certificados")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    args = parser.parse_args(argv)
+
+    import utils
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_handler(utils.verificar_certificado))
+    print(f"Ouvindo em http://{args.host}:{args.porta}{CAMINHO_VERIFICACAO}?codigo=...")
+    try: servidor.serve_forever()
+    except KeyboardInterrupt: pass
+
+if __name__ == "__main__":
+    sys.exit(main())
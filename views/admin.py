@@ -5,8 +5,9 @@ import bcrypt
 import time 
 import io 
 from datetime import datetime, date, time as dtime 
-from database import get_db, OPCOES_SEXO
+from database import get_db, obter_carregador, OPCOES_SEXO
 from firebase_admin import firestore
+import replica
 
 # Tenta importar o dashboard
 try:
@@ -14,25 +15,23 @@ try:
 except ImportError:
     def render_dashboard_geral(): st.warning("Dashboard não encontrado.")
 
-# Importa utils com tratamento de erro
+from utils import (
+    fazer_upload_midia, 
+    normalizar_link_video, 
+    verificar_duplicidade_ia,
+    indexar_questao_duplicidade,
+    remover_questao_duplicidade,
+    obter_detector_duplicidade,
+    liberar_midia,
+    liberar_midias_questao,
+    IA_ATIVADA 
+)
+from importacao import importar_questoes
+
+# Auditoria por IA externa (opcional)
 try:
-    from utils import (
-        carregar_todas_questoes, 
-        salvar_questoes, 
-        fazer_upload_midia, 
-        normalizar_link_video, 
-        verificar_duplicidade_ia,
-        auditoria_ia_questao,   
-        auditoria_ia_openai,    
-        IA_ATIVADA 
-    )
+    from utils import auditoria_ia_questao, auditoria_ia_openai
 except ImportError:
-    IA_ATIVADA = False
-    def carregar_todas_questoes(): return []
-    def salvar_questoes(t, q): pass
-    def fazer_upload_midia(f): return None
-    def normalizar_link_video(u): return u
-    def verificar_duplicidade_ia(n, l, t=0.85): return False, None
     def auditoria_ia_questao(p, a, c): return "Indisponível"
     def auditoria_ia_openai(p, a, c): return "Indisponível"
 
@@ -66,8 +65,7 @@ def gestao_usuarios_tab():
     users_ref = list(db.collection('usuarios').stream())
     users = [d.to_dict() | {"id": d.id} for d in users_ref]
     
-    equipes_ref = list(db.collection('equipes').stream())
-    mapa_equipes = {d.id: d.to_dict().get('nome', 'Sem Nome') for d in equipes_ref} 
+    mapa_equipes = {d['id']: d.get('nome', 'Sem Nome') for d in replica.listar('equipes')} 
     mapa_equipes_inv = {v: k for k, v in mapa_equipes.items()} 
     lista_equipes = ["Sem Equipe"] + sorted(list(mapa_equipes.values()))
 
@@ -75,10 +73,8 @@ def gestao_usuarios_tab():
     mapa_nomes_profs = {u.id: u.to_dict().get('nome', 'Sem Nome') for u in profs_users}
     mapa_nomes_profs_inv = {v: k for k, v in mapa_nomes_profs.items()}
 
-    vincs_profs = list(db.collection('professores').where('status_vinculo', '==', 'ativo').stream())
     profs_por_equipe = {}
-    for v in vincs_profs:
-        d = v.to_dict()
+    for d in replica.listar('professores_ativos'):
         eid = d.get('equipe_id')
         uid = d.get('usuario_id')
         if eid and uid and uid in mapa_nomes_profs:
@@ -280,15 +276,14 @@ def gestao_questoes_tab():
 
     # --- ABA 1: LISTAR ---
     with tabs[0]:
-        q_ref = list(db.collection('questoes').where('status', '==', 'aprovada').stream())
         c1, c2 = st.columns(2)
         termo = c1.text_input("🔍 Buscar (Aprovadas):")
         filt_n = c2.multiselect("Nível:", NIVEIS_DIFICULDADE)
+        # Índice invertido da réplica: enunciado, alternativas e tema, sem acento, por prefixo
+        q_ref = replica.buscar('questoes_aprovadas', termo)
         
         q_filtro = []
-        for doc in q_ref:
-            d = doc.to_dict(); d['id'] = doc.id
-            if termo and termo.lower() not in d.get('pergunta','').lower(): continue
+        for d in q_ref:
             if filt_n and d.get('dificuldade',1) not in filt_n: continue
             q_filtro.append(d)
             
@@ -356,10 +351,10 @@ def gestao_questoes_tab():
                                 else:
                                     fin_img = url_i_at
                                     if up_img:
-                                        with st.spinner("Subindo imagem..."): fin_img = fazer_upload_midia(up_img)
+                                        with st.spinner("Subindo imagem..."): fin_img = fazer_upload_midia(up_img) or url_i_at
                                     fin_vid = url_v_manual
                                     if up_vid:
-                                        with st.spinner("Subindo vídeo..."): fin_vid = fazer_upload_midia(up_vid)
+                                        with st.spinner("Subindo vídeo..."): fin_vid = fazer_upload_midia(up_vid) or url_v_manual
                                     
                                     novo_status = "aprovada" if user_tipo == "admin" else "pendente"
                                     
@@ -376,6 +371,10 @@ def gestao_questoes_tab():
                                         dados_upd["ultima_justificativa"] = justificativa_edicao
 
                                     db.collection('questoes').document(q['id']).update(dados_upd)
+                                    # Mídias substituídas (já gravadas) perdem a referência desta questão
+                                    for antiga, nova in ((q.get('url_imagem'), fin_img), (q.get('url_video'), fin_vid)):
+                                        if antiga and nova and antiga != nova: liberar_midia(antiga)
+                                    indexar_questao_duplicidade(q['id'], perg)
                                     st.session_state['edit_q'] = None
                                     if novo_status == "pendente": st.info("✏️ Edição enviada para análise!")
                                     else: st.success("✅ Salvo!")
@@ -385,6 +384,7 @@ def gestao_questoes_tab():
                                 st.session_state['edit_q'] = None; st.rerun()
                         if st.button("🗑️ Deletar", key=f"del_q_{q['id']}", type="primary"):
                             db.collection('questoes').document(q['id']).delete()
+                            remover_questao_duplicidade(q['id']); liberar_midias_questao(q)
                             st.session_state['edit_q'] = None; st.success("Deletado."); st.rerun()
 
     # --- ABA 2: ADICIONAR ---
@@ -414,9 +414,7 @@ def gestao_questoes_tab():
                         if IA_ATIVADA:
                             try:
                                 with st.spinner("Verificando duplicidade..."):
-                                    all_qs_snap = list(db.collection('questoes').stream())
-                                    lista_qs = [d.to_dict() for d in all_qs_snap]
-                                    res_ia = verificar_duplicidade_ia(perg, lista_qs, threshold=0.75)
+                                    res_ia = verificar_duplicidade_ia(perg, threshold=0.75)
                                     if res_ia and isinstance(res_ia, tuple) and res_ia[0]:
                                         st.error("⚠️ Questão similar detectada!")
                                         st.warning(f"Existente: {res_ia[1]}")
@@ -430,13 +428,14 @@ def gestao_questoes_tab():
                             status_ini = "aprovada" if user_tipo == "admin" else "pendente"
                             msg_sucesso = "✅ Cadastrada!" if user_tipo == "admin" else "⏳ Enviada para aprovação!"
                             
-                            db.collection('questoes').add({
+                            _, ref_q = db.collection('questoes').add({
                                 "pergunta": perg, "dificuldade": dif, "categoria": cat,
                                 "url_imagem": f_img, "url_video": f_vid,
                                 "alternativas": {"A":alt_a, "B":alt_b, "C":alt_c, "D":alt_d},
                                 "resposta_correta": correta, "status": status_ini,
                                 "criado_por": user.get('nome', 'Admin'), "data_criacao": firestore.SERVER_TIMESTAMP
                             })
+                            indexar_questao_duplicidade(ref_q.id, perg)
                             st.success(msg_sucesso); time.sleep(1.5); st.rerun()
                         else: st.stop()
                     else: st.warning("Preencha dados básicos.")
@@ -455,24 +454,28 @@ def gestao_questoes_tab():
                 col_btn.download_button("⬇️ Modelo", data=csv_buffer.getvalue(), file_name="modelo.csv", mime="text/csv")
                 
                 arquivo = st.file_uploader("Arquivo:", type=["csv", "xlsx"])
+                checar_similares = st.checkbox("Descartar também questões muito parecidas (IA local)", value=False, disabled=not IA_ATIVADA)
                 if arquivo and st.button("🚀 Importar"):
-                     # Lógica real de importação
+                     # Lotes de 500 com checkpoint: reenviar o mesmo arquivo retoma de onde parou
                      try:
-                         if arquivo.name.endswith('.csv'):
-                             try: df = pd.read_csv(arquivo, sep=';')
-                             except: df = pd.read_csv(arquivo, sep=',')
-                         else: df = pd.read_excel(arquivo)
-                         
-                         prog = st.progress(0)
-                         for i, row in df.iterrows():
-                             db.collection('questoes').add({
-                                 "pergunta": str(row['pergunta']), "status": "aprovada",
-                                 "alternativas": {"A": str(row['alt_a']), "B": str(row['alt_b']), "C": str(row.get('alt_c','')), "D": str(row.get('alt_d',''))},
-                                 "resposta_correta": str(row['correta']), "dificuldade": int(row.get('dificuldade',1)),
-                                 "categoria": str(row.get('categoria','Geral')), "criado_por": f"{user.get('nome')} (Import)"
-                             })
-                             prog.progress((i+1)/len(df))
-                         st.success("Importado!"); time.sleep(2); st.rerun()
+                         prog = st.progress(0.0); status_txt = st.empty()
+                         def _progresso(rel):
+                             prog.progress(min(rel['gravadas'] / max(rel['lidas'], 1), 1.0))
+                             status_txt.caption(f"{rel['lidas']} linhas lidas · {rel['gravadas']} gravadas · {rel['linhas_por_s']:.0f} linhas/s")
+                         rel = importar_questoes(arquivo.getvalue(), arquivo.name, user.get('nome'),
+                                                 ao_progresso=_progresso, verificar_similares=checar_similares,
+                                                 detector=obter_detector_duplicidade())
+                         prog.progress(1.0)
+                         st.success(f"Importado! {rel['gravadas']} questões gravadas em {rel['segundos']:.1f}s ({rel['linhas_por_s']:.0f} linhas/s).")
+                         if rel['retomadas']: st.info(f"Retomada: linhas até {rel['retomadas']} já tinham sido importadas.")
+                         if rel['duplicadas']:
+                             with st.expander(f"♻️ {len(rel['duplicadas'])} duplicadas ignoradas"):
+                                 st.dataframe(pd.DataFrame(rel['duplicadas'], columns=["Linha", "Motivo"]), hide_index=True, use_container_width=True)
+                         if rel['erros']:
+                             df_erros = pd.DataFrame(rel['erros'], columns=["Linha", "Erro"])
+                             st.warning(f"{len(rel['erros'])} linhas com erro (não importadas).")
+                             st.dataframe(df_erros, hide_index=True, use_container_width=True)
+                             st.download_button("⬇️ Relatório de erros", df_erros.to_csv(index=False, sep=';'), file_name="erros_importacao.csv", mime="text/csv")
                      except Exception as e: st.error(f"Erro: {e}")
             else: st.warning("Restrito a Admin.")
 
@@ -503,7 +506,8 @@ def gestao_questoes_tab():
                             st.session_state['edit_my_mode'] = doc.id
                     if stt != 'aprovada':
                          if c2.button("🗑️", key=f"del_my_{doc.id}"):
-                            db.collection('questoes').document(doc.id).delete(); st.rerun()
+                            db.collection('questoes').document(doc.id).delete()
+                            remover_questao_duplicidade(doc.id); liberar_midias_questao(q); st.rerun()
                 
                 if st.session_state.get('edit_my_mode') == doc.id:
                     with st.form(f"fix_form_{doc.id}"):
@@ -514,6 +518,7 @@ def gestao_questoes_tab():
                             db.collection('questoes').document(doc.id).update({
                                 "pergunta": n_perg, "categoria": n_cat, "status": "pendente", "feedback_admin": firestore.DELETE_FIELD
                             })
+                            indexar_questao_duplicidade(doc.id, n_perg)
                             st.session_state['edit_my_mode'] = None; st.success("Enviado!"); st.rerun()
 
     # --- ABA 4: APROVAÇÕES (SÓ ADMIN) ---
@@ -569,7 +574,8 @@ def gestao_questoes_tab():
                                     st.toast("Enviado!"); time.sleep(1); st.rerun()
                             
                             if st.button("🗑️ Rejeitar Definitivamente", key=f"kill_{doc.id}"):
-                                db.collection('questoes').document(doc.id).delete(); st.rerun()
+                                db.collection('questoes').document(doc.id).delete()
+                                remover_questao_duplicidade(doc.id); liberar_midias_questao(q); st.rerun()
 
 # =========================================
 # GESTÃO DE EXAMES
@@ -583,33 +589,35 @@ def gestao_exame_de_faixa_route():
         st.subheader("1. Selecione a Faixa")
         faixa_sel = st.selectbox("Prova de Faixa:", FAIXAS_COMPLETAS)
         if 'last_faixa_sel' not in st.session_state or st.session_state.last_faixa_sel != faixa_sel:
-            configs = list(db.collection('config_exames').where('faixa', '==', faixa_sel).limit(1).stream())
-            conf_atual = configs[0].to_dict() if configs else {}
-            doc_id = configs[0].id if configs else None
+            configs = replica.filtrar('config_exames', faixa=faixa_sel)
+            conf_atual = configs[0] if configs else {}
+            doc_id = conf_atual.pop('id', None)
             st.session_state.conf_atual = conf_atual; st.session_state.doc_id = doc_id
             st.session_state.selected_ids = set(conf_atual.get('questoes_ids', []))
             st.session_state.last_faixa_sel = faixa_sel
         conf_atual = st.session_state.conf_atual
-        todas_questoes = list(db.collection('questoes').where('status', '==', 'aprovada').stream())
+        todas_questoes = replica.listar('questoes_aprovadas')
         
         st.markdown("### 2. Selecione as Questões")
         c_f1, c_f2 = st.columns(2)
         filtro_nivel = c_f1.multiselect("Filtrar Nível:", NIVEIS_DIFICULDADE, default=[1,2,3,4], format_func=lambda x: MAPA_NIVEIS.get(x, str(x)))
-        cats = sorted(list(set([d.to_dict().get('categoria', 'Geral') for d in todas_questoes])))
+        cats = sorted(list(set([d.get('categoria', 'Geral') for d in todas_questoes])))
         filtro_tema = c_f2.multiselect("Filtrar Tema:", cats, default=cats)
+        termo_q = st.text_input("🔍 Buscar questão:", key="busca_montador")
+        if termo_q: todas_questoes = replica.buscar('questoes_aprovadas', termo_q)
         
         with st.container(height=500, border=True):
             count_visible = 0
-            for doc in todas_questoes:
-                d = doc.to_dict(); niv = d.get('dificuldade', 1); cat = d.get('categoria', 'Geral')
+            for d in todas_questoes:
+                niv = d.get('dificuldade', 1); cat = d.get('categoria', 'Geral')
                 if niv in filtro_nivel and cat in filtro_tema:
                     count_visible += 1
                     c_chk, c_content = st.columns([1, 15])
-                    is_checked = doc.id in st.session_state.selected_ids
-                    def update_selection(qid=doc.id):
+                    is_checked = d['id'] in st.session_state.selected_ids
+                    def update_selection(qid=d['id']):
                         if st.session_state[f"chk_{qid}"]: st.session_state.selected_ids.add(qid)
                         else: st.session_state.selected_ids.discard(qid)
-                    c_chk.checkbox("", value=is_checked, key=f"chk_{doc.id}", on_change=update_selection)
+                    c_chk.checkbox("", value=is_checked, key=f"chk_{d['id']}", on_change=update_selection)
                     with c_content:
                         badge = get_badge_nivel(niv); autor = d.get('criado_por', '?')
                         st.markdown(f"**{badge}** | {cat} | ✍️ {autor}")
@@ -636,15 +644,35 @@ def gestao_exame_de_faixa_route():
             if c_res2.button("🗑️ Limpar", key="clean_sel"): st.session_state.selected_ids = set(); st.rerun()
         
         st.markdown("### 3. Regras")
+        modos = ["Manual", "Sorteio"]
+        modo = st.radio("Seleção das questões:", modos, horizontal=True,
+                        index=modos.index(conf_atual.get('modo_selecao', 'Manual')) if conf_atual.get('modo_selecao') in modos else 0,
+                        format_func=lambda m: "✋ Manual (selecionadas acima)" if m == "Manual" else "🎲 Sorteio por nível/tema (novo a cada prova)")
         with st.form("save_conf"):
             c1, c2 = st.columns(2)
             tempo = c1.number_input("Tempo (min):", 10, 180, int(conf_atual.get('tempo_limite', 45)))
             nota = c2.number_input("Aprovação (%):", 10, 100, int(conf_atual.get('aprovacao_minima', 70)))
+            if modo == "Sorteio":
+                qtd_total = st.number_input("Total de questões:", 1, 200, int(conf_atual.get('qtd_questoes', 10)))
+                st.caption("Cotas mínimas por nível (o restante é sorteado entre todas as aprovadas):")
+                cotas_niv = conf_atual.get('qtd_por_nivel') or {}
+                cols_niv = st.columns(len(NIVEIS_DIFICULDADE))
+                por_nivel = {str(n): cols_niv[i].number_input(MAPA_NIVEIS.get(n, str(n)), 0, 200, int(cotas_niv.get(str(n), 0)), key=f"cota_niv_{n}")
+                             for i, n in enumerate(NIVEIS_DIFICULDADE)}
+                cotas_tema = conf_atual.get('qtd_por_tema') or {}
+                c3, c4 = st.columns([3, 1])
+                temas = c3.multiselect("Temas obrigatórios:", cats, default=[t for t in cotas_tema if t in cats])
+                qtd_tema = c4.number_input("Questões por tema:", 1, 50, int(max(cotas_tema.values(), default=1)))
             if st.form_submit_button("💾 Salvar Prova"):
-                if total_sel == 0: st.error("Selecione questões.")
+                if modo == "Manual" and total_sel == 0: st.error("Selecione questões.")
                 else:
                     try:
-                        dados = {"faixa": faixa_sel, "questoes_ids": list(st.session_state.selected_ids), "qtd_questoes": total_sel, "tempo_limite": tempo, "aprovacao_minima": nota, "modo_selecao": "Manual", "atualizado_em": firestore.SERVER_TIMESTAMP}
+                        if modo == "Manual":
+                            dados = {"faixa": faixa_sel, "questoes_ids": list(st.session_state.selected_ids), "qtd_questoes": total_sel, "tempo_limite": tempo, "aprovacao_minima": nota, "modo_selecao": "Manual", "atualizado_em": firestore.SERVER_TIMESTAMP}
+                        else:
+                            dados = {"faixa": faixa_sel, "questoes_ids": [], "qtd_questoes": int(qtd_total), "tempo_limite": tempo, "aprovacao_minima": nota, "modo_selecao": "Sorteio",
+                                     "qtd_por_nivel": {k: int(v) for k, v in por_nivel.items() if v}, "qtd_por_tema": {t: int(qtd_tema) for t in temas},
+                                     "atualizado_em": firestore.SERVER_TIMESTAMP}
                         if st.session_state.doc_id:
                             try: db.collection('config_exames').document(st.session_state.doc_id).update(dados)
                             except: db.collection('config_exames').add(dados)
@@ -654,8 +682,7 @@ def gestao_exame_de_faixa_route():
 
     with tab2:
         st.subheader("Status das Provas")
-        configs_stream = db.collection('config_exames').stream()
-        mapa_configs = {d.to_dict().get('faixa'): d.to_dict() | {'id': d.id} for d in configs_stream}
+        mapa_configs = {d.get('faixa'): d for d in replica.listar('config_exames')}
         grupos = {"🔘 Cinza": ["Cinza e Branca", "Cinza", "Cinza e Preta"], "🟡 Amarela": ["Amarela e Branca", "Amarela", "Amarela e Preta"], "🟠 Laranja": ["Laranja e Branca", "Laranja", "Laranja e Preta"], "🟢 Verde": ["Verde e Branca", "Verde", "Verde e Preta"], "🔵 Azul": ["Azul"], "🟣 Roxa": ["Roxa"], "🟤 Marrom": ["Marrom"], "⚫ Preta": ["Preta"]}
         sub_tabs = st.tabs(list(grupos.keys()))
         for i, (g, fxs) in enumerate(grupos.items()):
@@ -667,13 +694,13 @@ def gestao_exame_de_faixa_route():
                         with st.container(border=True):
                             if conf:
                                 st.markdown(f"**{fx}**")
-                                st.caption(f"✅ {conf.get('qtd_questoes')} questões")
+                                st.caption(f"✅ {conf.get('qtd_questoes')} questões" + (" (🎲 sorteio)" if conf.get('modo_selecao') == "Sorteio" else ""))
                                 if st.toggle("👁️ Simular", key=f"sim_{conf['id']}"):
                                     ids = conf.get('questoes_ids', [])
+                                    questoes_sim = obter_carregador().obter_muitos('questoes', ids)
                                     for q_idx, qid in enumerate(ids): 
-                                        qdoc = db.collection('questoes').document(qid).get()
-                                        if qdoc.exists:
-                                            qd = qdoc.to_dict()
+                                        qd = questoes_sim.get(str(qid))
+                                        if qd is not None:
                                             st.markdown(f"**{q_idx+1}. {qd.get('pergunta')}**")
                                             if qd.get('url_imagem'): st.image(qd.get('url_imagem'), use_container_width=True)
                                             if qd.get('url_video'):
@@ -717,8 +744,8 @@ def gestao_exame_de_faixa_route():
                 if vinculos:
                     eq_id = vinculos[0].to_dict().get('equipe_id')
                     if eq_id:
-                        eq_doc = db.collection('equipes').document(eq_id).get()
-                        if eq_doc.exists: nome_eq = eq_doc.to_dict().get('nome', 'Sem Nome')
+                        eq_dados = replica.documento('equipes', eq_id)
+                        if eq_dados is not None: nome_eq = eq_dados.get('nome', 'Sem Nome')
             except: pass
             
             # Renderiza linha
@@ -7,41 +7,65 @@ import json
 import pandas as pd
 from datetime import datetime, timedelta
 import streamlit.components.v1 as components 
-from database import get_db
+from database import get_db, obter_carregador
 from firebase_admin import firestore  # Mantemos a importação
 
 # ===============================
 # NOVOS IMPORTS (SEM REMOVER NADA)
 # ===============================
 import utils as ce
+import replica
 import views.aulas_aluno as aulas_aluno_view
 
 # --- IMPORTAÇÃO DIRETA (PARA DIAGNÓSTICO DE ERROS) ---
 from utils import (
-    registrar_inicio_exame, 
     registrar_fim_exame, 
     bloquear_por_abandono,
     verificar_elegibilidade_exame,
     carregar_todas_questoes,
-    gerar_codigo_verificacao,
     gerar_pdf,
     normalizar_link_video 
 )
 
 # =========================================
-# CARREGADOR DE EXAME (Inalterado)
+# CARREGADOR DE EXAME
 # =========================================
+def _com_alternativas(d):
+    """Questões antigas guardam 'opcoes' (lista); a prova usa 'alternativas' (A-D)."""
+    if 'alternativas' not in d and 'opcoes' in d:
+        ops = d['opcoes']
+        d['alternativas'] = {
+            "A": ops[0], "B": ops[1], "C": ops[2], "D": ops[3]
+        } if len(ops) >= 4 else {}
+    return d
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _questoes_fora_da_replica(ids):
+    """Questões de exame que não estão na réplica de aprovadas (cache do processo)."""
+    return {q_id: d for q_id, d in obter_carregador().obter_muitos('questoes', list(ids)).items() if d is not None}
+
+def questoes_da_sessao(ids):
+    """Questões da sessão de exame, na ordem dos ids, a partir da memória compartilhada."""
+    questoes = replica.documentos('questoes_aprovadas', ids)
+    faltando = tuple(q_id for q_id, d in questoes.items() if d is None)
+    if faltando: questoes.update(_questoes_fora_da_replica(faltando))
+    return [_com_alternativas(dict(questoes[q_id], id=q_id)) for q_id in ids if questoes.get(q_id) is not None]
+
+def parametros_exame(faixa_alvo):
+    """(qtd_questoes, tempo, nota mínima) da prova, sem carregar as questões."""
+    configs = replica.filtrar('config_exames', faixa=faixa_alvo)
+    conf = configs[0] if configs else {}
+    qtd = len(conf['questoes_ids']) if conf.get('questoes_ids') else int(conf.get('qtd_questoes', 10))
+    return qtd, int(conf.get('tempo_limite', 45)), int(conf.get('aprovacao_minima', 70))
+
 def carregar_exame_especifico(faixa_alvo):
-    db = get_db()
     questoes_finais = []
     tempo = 45; nota = 70; qtd_alvo = 10
+    por_nivel = {}; por_tema = {}
     
     try:
-        configs = db.collection('config_exames').where('faixa', '==', faixa_alvo).limit(1).stream()
-        config_doc = None
-        for doc in configs: 
-            config_doc = doc.to_dict()
-            break
+        configs = replica.filtrar('config_exames', faixa=faixa_alvo)
+        config_doc = configs[0] if configs else None
         
         if config_doc:
             tempo = int(config_doc.get('tempo_limite', 45))
@@ -50,38 +74,28 @@ def carregar_exame_especifico(faixa_alvo):
             # MODO MANUAL
             if config_doc.get('questoes_ids'):
                 ids = config_doc['questoes_ids']
-                for q_id in ids:
-                    q_snap = db.collection('questoes').document(q_id).get()
-                    if q_snap.exists:
-                        d = q_snap.to_dict()
-                        if 'alternativas' not in d and 'opcoes' in d:
-                            ops = d['opcoes']
-                            d['alternativas'] = {
-                                "A": ops[0], "B": ops[1], "C": ops[2], "D": ops[3]
-                            } if len(ops) >= 4 else {}
-                        questoes_finais.append(d)
+                # Aprovadas saem da réplica; o resto (se houver) vem em lote do banco
+                questoes = replica.documentos('questoes_aprovadas', ids)
+                faltando = [q_id for q_id, d in questoes.items() if d is None]
+                if faltando: questoes.update(obter_carregador().obter_muitos('questoes', faltando))
+                for q_id, d in questoes.items():
+                    if d is not None:
+                        d['id'] = q_id
+                        questoes_finais.append(_com_alternativas(d))
                 random.shuffle(questoes_finais)
                 return questoes_finais, tempo, nota
             
             qtd_alvo = int(config_doc.get('qtd_questoes', 10))
+            por_nivel = config_doc.get('qtd_por_nivel') or {}
+            por_tema = config_doc.get('qtd_por_tema') or {}
     except:
         pass
 
-    # FALLBACK
+    # SORTEIO (pools pré-separados por nível/tema: só as k escolhidas são copiadas)
     if not questoes_finais:
         try:
-            q_ref = list(db.collection('questoes').where('status', '==', 'aprovada').stream())
-            pool = []
-            for doc in q_ref:
-                d = doc.to_dict()
-                if 'alternativas' not in d and 'opcoes' in d:
-                    ops = d['opcoes']
-                    d['alternativas'] = {
-                        "A": ops[0], "B": ops[1], "C": ops[2], "D": ops[3]
-                    } if len(ops) >= 4 else {}
-                pool.append(d)
-            if pool:
-                questoes_finais = random.sample(pool, min(len(pool), qtd_alvo))
+            for d in replica.sortear('questoes_aprovadas', qtd_alvo, por_nivel, por_tema):
+                questoes_finais.append(_com_alternativas(d))
         except:
             pass
 
@@ -156,22 +170,21 @@ def meus_certificados(usuario):
                     f"Ref: {cert.get('codigo_verificacao')}"
                 )
 
-                def generate_certificate(cert, user_name):
-                    pdf_bytes, pdf_name = gerar_pdf(
+                # Nada é renderizado ao listar: o PDF só é gerado (ou buscado no cache) no clique
+                def generate_certificate(cert=cert, user_name=usuario['nome']):
+                    pdf_bytes, _ = gerar_pdf(
                         user_name,
                         cert.get('faixa'),
                         cert.get('pontuacao', 0),
                         cert.get('total', 10),
                         cert.get('codigo_verificacao')
                     )
-                    if pdf_bytes:
-                        return pdf_bytes, pdf_name
-                    return b"", f"Erro_{cert.get('codigo_verificacao')}.pdf"
+                    return pdf_bytes or b""
 
                 c2.download_button(
                     label="📄 Baixar PDF",
-                    data=lambda: generate_certificate(cert, usuario['nome'])[0],
-                    file_name=lambda: generate_certificate(cert, usuario['nome'])[1],
+                    data=generate_certificate,
+                    file_name=ce.nome_arquivo_certificado(usuario['nome']),
                     mime="application/pdf",
                     key=f"cert_{i}"
                 )
@@ -192,12 +205,6 @@ def exame_de_faixa(usuario):
     if "exame_iniciado" not in st.session_state: st.session_state.exame_iniciado = False
     if "resultado_prova" not in st.session_state: st.session_state.resultado_prova = None
 
-    db = get_db()
-    doc_ref = db.collection('usuarios').document(usuario['id'])
-    doc = doc_ref.get()
-    if not doc.exists: st.error("Erro perfil."); return
-    dados = doc.to_dict()
-    
     # === TELA DE RESULTADO ===
     if st.session_state.resultado_prova:
         res = st.session_state.resultado_prova
@@ -231,20 +238,35 @@ def exame_de_faixa(usuario):
             st.rerun()
         return
 
+    # === TELA DA PROVA (tudo vem da sessão congelada: nenhuma leitura no banco) ===
+    if st.session_state.exame_iniciado and st.session_state.get('sessao_exame'):
+        tela_prova(usuario, st.session_state.sessao_exame)
+        return
+
+    db = get_db()
+    doc_ref = db.collection('usuarios').document(usuario['id'])
+    doc = doc_ref.get()
+    if not doc.exists: st.error("Erro perfil."); return
+    dados = doc.to_dict()
+
     # CHECAGEM DE ABANDONO
-    if dados.get("status_exame") == "em_andamento" and not st.session_state.exame_iniciado:
+    if dados.get("status_exame") == "em_andamento":
         is_timeout = False
         try:
-            start_str = dados.get("inicio_exame_temp")
-            if start_str:
-                if isinstance(start_str, str):
-                    start_dt = datetime.fromisoformat(start_str.replace('Z', ''))
-                else:
-                    start_dt = start_str
-                
-                _, t_lim, _ = carregar_exame_especifico(dados.get('faixa_exame'))
-                limit_dt = start_dt + timedelta(minutes=t_lim)
-                if datetime.utcnow() > limit_dt.replace(tzinfo=None): is_timeout = True
+            sessao = ce.obter_sessao_exame(usuario['id'])
+            if sessao and sessao.get('prazo_ts'):
+                is_timeout = time.time() > sessao['prazo_ts']
+            else:
+                # Exame iniciado antes das sessões gravadas: prazo pelo início + config
+                start_str = dados.get("inicio_exame_temp")
+                if start_str:
+                    if isinstance(start_str, str):
+                        start_dt = datetime.fromisoformat(start_str.replace('Z', ''))
+                    else:
+                        start_dt = start_str
+                    _, t_lim, _ = parametros_exame(dados.get('faixa_exame'))
+                    limit_dt = start_dt + timedelta(minutes=t_lim)
+                    if datetime.utcnow() > limit_dt.replace(tzinfo=None): is_timeout = True
         except: pass
 
         if is_timeout:
@@ -271,17 +293,15 @@ def exame_de_faixa(usuario):
     elegivel, motivo = verificar_elegibilidade_exame(dados)
     if not elegivel: st.error(f"🚫 {motivo}"); return
 
-    # CARREGAMENTO
-    qs, tempo_limite, min_aprovacao = carregar_exame_especifico(dados.get('faixa_exame'))
-    qtd = len(qs)
+    # PARÂMETROS (as questões só são sorteadas/carregadas ao iniciar)
+    qtd, tempo_limite, min_aprovacao = parametros_exame(dados.get('faixa_exame'))
 
     # === TELA DE INÍCIO ===
-    if not st.session_state.exame_iniciado:
-        st.markdown(f"### 📋 Exame de Faixa **{dados.get('faixa_exame')}**")
-        
-        with st.container(border=True):
-            st.markdown("#### 📜 Instruções para a realização do Exame")
-            st.markdown("""
+    st.markdown(f"### 📋 Exame de Faixa **{dados.get('faixa_exame')}**")
+    
+    with st.container(border=True):
+        st.markdown("#### 📜 Instruções para a realização do Exame")
+        st.markdown("""
 * Após clicar em **✅ Iniciar exame**, não será possível pausar ou interromper o cronômetro.
 * Se o tempo acabar antes de você finalizar, você será considerado **reprovado**.
 * **Não é permitido** consultar materiais externos de qualquer tipo.
@@ -294,133 +314,120 @@ def exame_de_faixa(usuario):
 * Se aprovado, você poderá baixar seu certificado na aba *Meus Certificados*.
 
 **Boa prova!** 🥋
-            """)
+        """)
+        
+        st.markdown("---")
+        
+        # PAINEL DE MÉTRICAS (VISUAL LIMPO)
+        st.markdown(f"""
+        <div style="display: flex; justify-content: space-between; align-items: center; background-color: rgba(255,255,255,0.05); padding: 15px; border-radius: 10px;">
+            <div style="text-align: left;">
+                <span style="font-size: 0.9em; color: #aaa;">Questões</span><br>
+                <span style="font-size: 1.5em; font-weight: bold; color: white;">{qtd}</span>
+            </div>
+            <div style="text-align: center;">
+                <span style="font-size: 0.9em; color: #aaa;">Tempo</span><br>
+                <span style="font-size: 1.5em; font-weight: bold; color: white;">{tempo_limite} min</span>
+            </div>
+            <div style="text-align: right;">
+                <span style="font-size: 0.9em; color: #aaa;">Mínimo</span><br>
+                <span style="font-size: 1.5em; font-weight: bold; color: white;">{min_aprovacao}%</span>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        st.write("") 
+    
+    if qtd > 0:
+        if st.button("✅ (estou ciente) INICIAR EXAME", type="primary", use_container_width=True):
+            qs, tempo_limite, min_aprovacao = carregar_exame_especifico(dados.get('faixa_exame'))
+            if not qs: st.warning("Sem questões disponíveis."); return
+            st.session_state.sessao_exame = ce.iniciar_sessao_exame(
+                usuario['id'], dados.get('faixa_exame'), [q['id'] for q in qs], tempo_limite, min_aprovacao)
+            st.session_state.exame_iniciado = True
+            st.rerun()
+    else: st.warning("Sem questões disponíveis.")
+
+def tela_prova(usuario, sessao):
+    """Prova em andamento, a partir da sessão congelada em st.session_state."""
+    qs = questoes_da_sessao(sessao['questoes_ids'])
+    restante = int(sessao['prazo_ts'] - time.time())
+    
+    if restante <= 0:
+        st.error("⌛ Tempo ESGOTADO!")
+        registrar_fim_exame(usuario['id'], False)
+        st.session_state.exame_iniciado = False
+        st.session_state.sessao_exame = None
+        time.sleep(2)
+        st.rerun()
+
+    # Timer Visual
+    cor = "#FFD770" if restante > 300 else "#FF4B4B"
+    components.html(f"""
+    <div style="border:2px solid {cor};border-radius:10px;padding:10px;text-align:center;background:rgba(0,0,0,0.3);font-family:sans-serif;color:white;">
+        TEMPO RESTANTE<br>
+        <span id="t" style="color:{cor};font-size:30px;font-weight:bold;">--:--</span>
+    </div>
+    <script>
+        var t={restante};
+        setInterval(function(){{
+            var m=Math.floor(t/60),s=t%60;
+            document.getElementById('t').innerHTML=m+":"+(s<10?"0"+s:s);
+            if(t--<=0)window.parent.location.reload();
+        }},1000);
+    </script>
+    """, height=100)
+
+    with st.form("prova"):
+        resps = {}
+        for i, q in enumerate(qs):
+            st.markdown(f"**{i+1}. {q.get('pergunta')}**")
             
+            if q.get('url_imagem'):
+                st.image(q.get('url_imagem'), use_container_width=True)
+            
+            if q.get('url_video'):
+                vid = normalizar_link_video(q.get('url_video'))
+                try: st.video(vid)
+                except: st.markdown(f"[Ver Vídeo]({vid})")
+
+            opts = []
+            if 'alternativas' in q:
+                opts = [q['alternativas'].get(k) for k in ["A","B","C","D"]]
+            elif 'opcoes' in q:
+                opts = q['opcoes']
+            
+            resps[i] = st.radio("R:", opts, key=f"q{i}", index=None, label_visibility="collapsed")
             st.markdown("---")
             
-            # PAINEL DE MÉTRICAS (VISUAL LIMPO)
-            st.markdown(f"""
-            <div style="display: flex; justify-content: space-between; align-items: center; background-color: rgba(255,255,255,0.05); padding: 15px; border-radius: 10px;">
-                <div style="text-align: left;">
-                    <span style="font-size: 0.9em; color: #aaa;">Questões</span><br>
-                    <span style="font-size: 1.5em; font-weight: bold; color: white;">{qtd}</span>
-                </div>
-                <div style="text-align: center;">
-                    <span style="font-size: 0.9em; color: #aaa;">Tempo</span><br>
-                    <span style="font-size: 1.5em; font-weight: bold; color: white;">{tempo_limite} min</span>
-                </div>
-                <div style="text-align: right;">
-                    <span style="font-size: 0.9em; color: #aaa;">Mínimo</span><br>
-                    <span style="font-size: 1.5em; font-weight: bold; color: white;">{min_aprovacao}%</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            st.write("") 
-        
-        if qtd > 0:
-            if st.button("✅ (estou ciente) INICIAR EXAME", type="primary", use_container_width=True):
-                registrar_inicio_exame(usuario['id'])
-                st.session_state.exame_iniciado = True
-                st.session_state.fim_prova_ts = time.time() + (tempo_limite * 60)
-                st.session_state.questoes_prova = qs
-                st.session_state.params_prova = {"tempo": tempo_limite, "min": min_aprovacao}
-                st.rerun()
-        else: st.warning("Sem questões disponíveis.")
+        if st.form_submit_button("Finalizar Exame", type="primary"):
+            acertos = []; respostas = []
+            for i, q in enumerate(qs):
+                resp = str(resps.get(i) or "").strip().lower()
+                certa = q.get('resposta_correta', 'A')
+                txt_certo = q.get('alternativas', {}).get(certa, "").strip().lower()
+                acertos.append(resp == txt_certo)
+                letra = next((k for k, v in q.get('alternativas', {}).items() if resps.get(i) is not None and str(v).strip().lower() == resp), None)
+                respostas.append(letra)
 
-    # === TELA DA PROVA ===
-    else:
-        qs = st.session_state.get('questoes_prova', [])
-        restante = int(st.session_state.fim_prova_ts - time.time())
-        
-        if restante <= 0:
-            st.error("⌛ Tempo ESGOTADO!")
-            registrar_fim_exame(usuario['id'], False)
+            try:
+                res = ce.finalizar_exame(usuario, sessao, qs, acertos, respostas)
+            except Exception as e:
+                st.error(f"Erro ao registrar o exame: {e}"); return
             st.session_state.exame_iniciado = False
-            time.sleep(2)
+            st.session_state.sessao_exame = None
+            
+            if res['aprovado']:
+                st.session_state.resultado_prova = {
+                    "nota": res['pontuacao'], "aprovado": True, 
+                    "faixa": res['faixa'], "acertos": res['acertos'], 
+                    "total": res['total'], "codigo": res['codigo_verificacao']
+                }
+            else:
+                st.error(f"Reprovado. Nota: {res['pontuacao']:.0f}%")
+                time.sleep(3)
+            
             st.rerun()
 
-        # Timer Visual
-        cor = "#FFD770" if restante > 300 else "#FF4B4B"
-        components.html(f"""
-        <div style="border:2px solid {cor};border-radius:10px;padding:10px;text-align:center;background:rgba(0,0,0,0.3);font-family:sans-serif;color:white;">
-            TEMPO RESTANTE<br>
-            <span id="t" style="color:{cor};font-size:30px;font-weight:bold;">--:--</span>
-        </div>
-        <script>
-            var t={restante};
-            setInterval(function(){{
-                var m=Math.floor(t/60),s=t%60;
-                document.getElementById('t').innerHTML=m+":"+(s<10?"0"+s:s);
-                if(t--<=0)window.parent.location.reload();
-            }},1000);
-        </script>
-        """, height=100)
-
-        with st.form("prova"):
-            resps = {}
-            for i, q in enumerate(qs):
-                st.markdown(f"**{i+1}. {q.get('pergunta')}**")
-                
-                if q.get('url_imagem'):
-                    st.image(q.get('url_imagem'), use_container_width=True)
-                
-                if q.get('url_video'):
-                    vid = normalizar_link_video(q.get('url_video'))
-                    try: st.video(vid)
-                    except: st.markdown(f"[Ver Vídeo]({vid})")
-
-                opts = []
-                if 'alternativas' in q:
-                    opts = [q['alternativas'].get(k) for k in ["A","B","C","D"]]
-                elif 'opcoes' in q:
-                    opts = q['opcoes']
-                
-                resps[i] = st.radio("R:", opts, key=f"q{i}", index=None, label_visibility="collapsed")
-                st.markdown("---")
-                
-            if st.form_submit_button("Finalizar Exame", type="primary"):
-                acertos = 0
-                for i, q in enumerate(qs):
-                    resp = str(resps.get(i) or "").strip().lower()
-                    certa = q.get('resposta_correta', 'A')
-                    txt_certo = q.get('alternativas', {}).get(certa, "").strip().lower()
-                    
-                    if resp == txt_certo:
-                        acertos += 1
-
-                nota = (acertos/len(qs))*100
-                aprovado = nota >= st.session_state.params_prova['min']
-                
-                registrar_fim_exame(usuario['id'], aprovado)
-                st.session_state.exame_iniciado = False
-                
-                cod = None
-                if aprovado:
-                    cod = gerar_codigo_verificacao()
-                    st.session_state.resultado_prova = {
-                        "nota": nota, "aprovado": True, 
-                        "faixa": dados.get('faixa_exame'), "acertos": acertos, 
-                        "total": len(qs), "codigo": cod
-                    }
-                    
-                    try:
-                        db.collection('resultados').add({
-                            "usuario": usuario['nome'],
-                            "faixa": dados.get('faixa_exame'),
-                            "pontuacao": nota,
-                            "acertos": acertos,
-                            "total": len(qs),
-                            "aprovado": aprovado,
-                            "codigo_verificacao": cod,
-                            "data": firestore.SERVER_TIMESTAMP
-                        })
-                    except: pass
-                
-                else:
-                    st.error(f"Reprovado. Nota: {nota:.0f}%")
-                    time.sleep(3)
-                
-                st.rerun()
 # =========================================
 # FLUXO DE CURSOS DO ALUNO (NOVO)
 # =========================================
@@ -126,11 +126,24 @@ def pagina_aulas_aluno(curso, usuario):
                 st.markdown(f"### {aula.get('titulo', 'Aula')}")
                 st.caption(f"⏱ {aula.get('duracao_min', 0)} min")
 
-                conteudo = aula.get("conteudo", {})
+                # A estrutura só traz o resumo; o corpo é lido ao abrir a aula
+                aberta = st.session_state.get("aula_aberta_id") == aula_id
+                if not aberta:
+                    if st.button("▶ Abrir aula", key=f"abrir_{aula_id}"):
+                        st.session_state["aula_aberta_id"] = aula_id
+                        st.rerun()
+                    aula_completa = None
+                else:
+                    aula_completa = ce.obter_aula(aula_id) or {}
+
+                conteudo = (aula_completa or {}).get("conteudo", {})
+                if not isinstance(conteudo, dict): conteudo = {}
                 blocos = conteudo.get("blocos", [])
 
                 # ===== AULAS V2 (BLOCOS) =====
-                if blocos:
+                if aula_completa is None:
+                    pass
+                elif blocos:
                     for bloco in blocos:
                         tipo = bloco.get("tipo")
 
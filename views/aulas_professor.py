@@ -86,6 +86,16 @@ def dialog_criar_aula(curso_id, modulos, usuario):
 # ======================================================
 # 3. O EDITOR COMPLETO (LEGO + PREVIEW + UPLOAD)
 # ======================================================
+def _enviar_com_progresso(arquivos):
+    """Sobe os arquivos em paralelo (endereçados por conteúdo) com barra de progresso. URLs na ordem."""
+    barra = st.progress(0.0, text="Enviando para nuvem...")
+    def _progresso(feito, total):
+        barra.progress(min(feito / total, 1.0) if total else 1.0,
+                       text=f"Enviando para nuvem... {feito / 1024 / 1024:.1f} de {total / 1024 / 1024:.1f} MB")
+    urls = ce.upload_arquivos_paralelo(arquivos, _progresso)
+    barra.empty()
+    return urls
+
 def editor_de_aula(aula, curso_id):
     
     # --- A. GESTÃO DE ESTADO (MEMÓRIA TEMPORÁRIA) ---
@@ -199,23 +209,22 @@ def editor_de_aula(aula, curso_id):
 
         # ABA 2: IMAGEM
         with tab_img:
-            arquivo_img = st.file_uploader("Upload Imagem", type=['png', 'jpg', 'jpeg'])
-            if arquivo_img and st.button("Enviar Imagem"):
-                with st.spinner("Enviando para nuvem..."):
-                    caminho = f"midia_cursos/{curso_id}/{aula['id']}/{int(time.time())}_{arquivo_img.name}"
-                    url = ce.upload_arquivo_simples(arquivo_img, caminho)
-                    
+            arquivos_img = st.file_uploader("Upload Imagem", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True)
+            if arquivos_img and st.button("Enviar Imagem"):
+                urls = _enviar_com_progresso(arquivos_img)
+                for arq, url in zip(arquivos_img, urls):
                     if url:
                         blocos.append({
                             "tipo": "imagem",
                             "url": url,
                             "origem": "upload",
-                            "nome": arquivo_img.name
+                            "nome": arq.name
                         })
-                        st.success("Imagem adicionada!")
-                        st.rerun()
-                    else:
-                        st.error("Falha no upload.")
+                if all(urls):
+                    st.success("Imagem adicionada!")
+                    st.rerun()
+                else:
+                    st.error("Falha no upload de parte das imagens.")
             
             st.markdown("---")
             url_ext_img = st.text_input("Ou URL da imagem")
@@ -225,25 +234,24 @@ def editor_de_aula(aula, curso_id):
 
         # ABA 3: VÍDEO
         with tab_vid:
-            arquivo_vid = st.file_uploader("Upload Vídeo (MP4)", type=['mp4', 'mov'])
-            if arquivo_vid:
-                st.caption(f"Tamanho: {arquivo_vid.size / 1024 / 1024:.1f} MB")
+            arquivos_vid = st.file_uploader("Upload Vídeo (MP4)", type=['mp4', 'mov'], accept_multiple_files=True)
+            if arquivos_vid:
+                st.caption(f"Tamanho: {sum(a.size for a in arquivos_vid) / 1024 / 1024:.1f} MB")
                 if st.button("Enviar Vídeo"):
-                    with st.spinner("Enviando vídeo..."):
-                        caminho = f"midia_cursos/{curso_id}/{aula['id']}/{int(time.time())}_{arquivo_vid.name}"
-                        url = ce.upload_arquivo_simples(arquivo_vid, caminho)
-                        
+                    urls = _enviar_com_progresso(arquivos_vid)
+                    for arq, url in zip(arquivos_vid, urls):
                         if url:
                             blocos.append({
                                 "tipo": "video",
                                 "url": url,
                                 "origem": "upload",
-                                "nome": arquivo_vid.name
+                                "nome": arq.name
                             })
-                            st.success("Vídeo adicionado!")
-                            st.rerun()
-                        else:
-                            st.error("Falha no upload.")
+                    if all(urls):
+                        st.success("Vídeo adicionado!")
+                        st.rerun()
+                    else:
+                        st.error("Falha no upload de parte dos vídeos.")
             
             st.markdown("---")
             url_yt = st.text_input("Ou YouTube/Vimeo")
@@ -284,14 +292,8 @@ def gerenciar_conteudo_curso(curso: dict, usuario: dict):
     
     # 1. Verifica se estamos editando uma aula específica
     if st.session_state.get("aula_editando_id"):
-        # Recupera dados da aula (simulação rápida buscando na lista local para evitar query extra)
-        aula_alvo = None
-        estrutura = ce.listar_modulos_e_aulas(curso.get("id"))
-        for m in estrutura:
-            for a in m['aulas']:
-                if a['id'] == st.session_state["aula_editando_id"]:
-                    aula_alvo = a
-                    break
+        # A estrutura do curso só tem o resumo; o editor precisa dos blocos
+        aula_alvo = ce.obter_aula(st.session_state["aula_editando_id"])
         
         if aula_alvo:
             editor_de_aula(aula_alvo, curso.get("id"))
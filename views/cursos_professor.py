@@ -65,15 +65,17 @@ def pagina_cursos_professor(usuario):
         st.write("Acompanhe seus ganhos (90% do valor das vendas).")
         st.write("")
         
-        # 1. Busca os dados no backend
-        saldo, historico = ce.obter_resumo_financeiro(usuario["id"])
+        # 1. Busca o saldo agregado (1 leitura)
+        resumo = ce.obter_resumo_financeiro(usuario["id"])
+        saldo = resumo["saldo"]
         
         # 2. Mostra Big Numbers (Métricas)
         col_metric1, col_metric2, col_metric3 = st.columns(3)
         with col_metric1:
-            st.metric("Saldo Total Acumulado", f"R$ {saldo:.2f}")
+            st.metric("Saldo Disponível", f"R$ {saldo:.2f}",
+                      help=f"Receita total R$ {resumo['receita_total']:.2f} - saques R$ {resumo['total_sacado']:.2f}")
         with col_metric2:
-            st.metric("Vendas Realizadas", len(historico))
+            st.metric("Vendas Realizadas", resumo["qtd_vendas"])
         with col_metric3:
             # Botão de Saque Simulado
             if saldo > 0:
@@ -81,13 +83,21 @@ def pagina_cursos_professor(usuario):
                     ce.solicitar_saque(usuario["id"], saldo)
                     st.toast("Solicitação enviada ao admin!")
                     time.sleep(2)
+                    st.rerun()
             else:
                 st.button("💸 Solicitar Saque", disabled=True, use_container_width=True)
 
         st.divider()
         
-        # 3. Tabela de Extrato
+        # 3. Tabela de Extrato (paginada por cursor)
         st.subheader("📜 Extrato de Vendas")
+        chave_ext = f"extrato_{usuario['id']}"
+        if chave_ext not in st.session_state:
+            linhas, cursor = ce.listar_extrato_vendas(usuario["id"])
+            st.session_state[chave_ext] = {"linhas": linhas, "cursor": cursor}
+        extrato = st.session_state[chave_ext]
+
+        historico = extrato["linhas"]
         if historico:
             df = pd.DataFrame(historico)
             st.dataframe(
@@ -101,6 +111,15 @@ def pagina_cursos_professor(usuario):
                     )
                 }
             )
+            c_mais, c_atual = st.columns(2)
+            if extrato["cursor"] is not None and c_mais.button("Carregar mais", use_container_width=True):
+                linhas, cursor = ce.listar_extrato_vendas(usuario["id"], cursor=extrato["cursor"])
+                extrato["linhas"] = historico + linhas
+                extrato["cursor"] = cursor
+                st.rerun()
+            if c_atual.button("🔄 Atualizar extrato", use_container_width=True):
+                del st.session_state[chave_ext]
+                st.rerun()
         else:
             st.info("Nenhuma venda registrada ainda.")
 
@@ -2,7 +2,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from database import get_db
+import espelho
+from utils import listar_questoes_mais_dificeis, listar_estatisticas_autor
 
 # =========================================
 # FUNÇÃO AUXILIAR DE ESTILO
@@ -40,20 +41,11 @@ def dashboard_professor():
         if st.button("🏠 Voltar ao Início", key="btn_voltar_dash"):
             st.session_state.menu_selection = "Início"; st.rerun()
 
-    db = get_db()
     user = st.session_state.usuario
 
-    # 1. Carregar Dados
+    # 1. Carregar Dados (espelho Parquet local, sincronizado por atualizado_em)
     with st.spinner("Analisando dados do dojo..."):
-        docs_res = list(db.collection('resultados').stream())
-        dados_res = [d.to_dict() for d in docs_res]
-        df_res = pd.DataFrame(dados_res)
-
-        docs_quest = list(db.collection('questoes').stream())
-        dados_quest = []
-        for d in docs_quest:
-            dic = d.to_dict(); dic['id'] = d.id; dados_quest.append(dic)
-        df_quest = pd.DataFrame(dados_quest)
+        df_res = espelho.dataframe('resultados')
 
     if df_res.empty:
         st.info("Nenhum exame realizado ainda para gerar estatísticas.")
@@ -62,11 +54,16 @@ def dashboard_professor():
     # Filtro Modo Rola
     if 'faixa' in df_res.columns:
         df_res = df_res[df_res['faixa'] != 'Modo Rola']
+        df_res = df_res.apply(lambda c: c.cat.remove_unused_categories() if isinstance(c.dtype, pd.CategoricalDtype) else c)
 
     if df_res.empty:
         st.warning("Existem dados de 'Modo Rola', mas nenhum 'Exame de Faixa' oficial foi realizado ainda.")
         return
 
+    # No espelho 'aprovado' é booleano anulável: sem valor conta como reprovado
+    if 'aprovado' in df_res.columns:
+        df_res = df_res.assign(aprovado=df_res['aprovado'].fillna(False))
+
     # =========================================
     # KPI's
     # =========================================
@@ -131,7 +128,7 @@ def dashboard_professor():
 
         # Loop para criar os cards
         for idx, row in ultimos.iterrows():
-            aprovado = row.get('aprovado', False)
+            aprovado = bool(row.get('aprovado', False))
             nota = float(row.get('pontuacao', 0))
             faixa = row.get('faixa', 'Desconhecida')
             nome = row.get('usuario', 'Aluno').split()[0].title() # Só o primeiro nome
@@ -164,65 +161,44 @@ def dashboard_professor():
     # ABA 2: INTELIGÊNCIA
     # =========================================
     with tab2:
-        tem_detalhes = 'detalhes' in df_res.columns and df_res['detalhes'].notna().any()
+        # Agregados por questão (estatisticas_questoes), atualizados ao finalizar cada exame
+        df_top_erros = pd.DataFrame(listar_questoes_mais_dificeis(7))
         
-        if not tem_detalhes:
+        if df_top_erros.empty:
             st.warning("⚠️ Realize novos exames oficiais para alimentar os gráficos de inteligência.")
         else:
-            todas_respostas = []
-            for idx, row in df_res.iterrows():
-                detalhes = row.get('detalhes')
-                if isinstance(detalhes, list):
-                    for item in detalhes: todas_respostas.append(item)
-            
-            if todas_respostas:
-                df_analise = pd.DataFrame(todas_respostas)
-                stats_quest = df_analise.groupby('questao_id').agg(
-                    vezes_usada=('questao_id', 'count'), acertos=('acertou', 'sum')
-                ).reset_index()
-                stats_quest['taxa_acerto'] = (stats_quest['acertos'] / stats_quest['vezes_usada']) * 100
-
-                if not df_quest.empty:
-                    stats_completo = pd.merge(stats_quest, df_quest[['id', 'pergunta', 'criado_por', 'dificuldade']], left_on='questao_id', right_on='id', how='left')
-                else:
-                    stats_completo = stats_quest; stats_completo['pergunta'] = 'Questão Deletada'; stats_completo['criado_por'] = '-'
-
-                st.subheader("🚨 Onde os alunos mais erram? (Apenas Exames)")
-                df_top_erros = stats_completo.sort_values(by='taxa_acerto', ascending=True).head(7)
-                df_top_erros['pergunta_curta'] = df_top_erros['pergunta'].apply(lambda x: x[:40] + "..." if len(str(x)) > 40 else x)
-
-                fig_err = px.bar(
-                    df_top_erros, x='taxa_acerto', y='pergunta_curta', orientation='h', text='taxa_acerto',
-                    title="Questões com Menor Taxa de Acerto", color='taxa_acerto',
-                    color_continuous_scale=['#EF553B', '#FFD770', '#078B6C'] 
-                )
-                fig_err.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-                st.plotly_chart(estilizar_grafico(fig_err), use_container_width=True)
+            st.subheader("🚨 Onde os alunos mais erram? (Apenas Exames)")
+            df_top_erros['pergunta_curta'] = df_top_erros['pergunta'].apply(lambda x: x[:40] + "..." if len(str(x)) > 40 else x)
 
-                st.markdown("---")
+            fig_err = px.bar(
+                df_top_erros, x='taxa_acerto', y='pergunta_curta', orientation='h', text='taxa_acerto',
+                title="Questões com Menor Taxa de Acerto", color='taxa_acerto',
+                color_continuous_scale=['#EF553B', '#FFD770', '#078B6C'] 
+            )
+            fig_err.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+            st.plotly_chart(estilizar_grafico(fig_err), use_container_width=True)
 
-                st.subheader(f"👨‍🏫 Estatísticas das Questões de: {user.get('nome', 'Mim')}")
-                meus_stats = stats_completo[stats_completo['criado_por'] == user.get('nome')]
-                
-                if meus_stats.empty:
-                    st.info("Você ainda não tem questões cadastradas que foram utilizadas em exames oficiais.")
-                else:
-                    c_m1, c_m2, c_m3 = st.columns(3)
-                    c_m1.metric("Minhas Questões Usadas", len(meus_stats))
-                    c_m2.metric("Total de Aplicações", meus_stats['vezes_usada'].sum())
-                    c_m3.metric("Média de Acerto Global", f"{meus_stats['taxa_acerto'].mean():.1f}%")
-                    
-                    st.dataframe(
-                        meus_stats[['pergunta', 'vezes_usada', 'taxa_acerto', 'dificuldade']]
-                        .sort_values(by='vezes_usada', ascending=False),
-                        column_config={
-                            "pergunta": "Pergunta",
-                            "vezes_usada": st.column_config.NumberColumn("Aplicações", format="%d"),
-                            "taxa_acerto": st.column_config.ProgressColumn("Taxa de Acerto", format="%.1f%%", min_value=0, max_value=100),
-                            "dificuldade": "Nível"
-                        },
-                        hide_index=True,
-                        use_container_width=True
-                    )
+            st.markdown("---")
+
+            st.subheader(f"👨‍🏫 Estatísticas das Questões de: {user.get('nome', 'Mim')}")
+            meus_stats = pd.DataFrame(listar_estatisticas_autor(user.get('nome')))
+            
+            if meus_stats.empty:
+                st.info("Você ainda não tem questões cadastradas que foram utilizadas em exames oficiais.")
             else:
-                st.info("Aguardando dados...")
+                c_m1, c_m2, c_m3 = st.columns(3)
+                c_m1.metric("Minhas Questões Usadas", len(meus_stats))
+                c_m2.metric("Total de Aplicações", meus_stats['vezes_usada'].sum())
+                c_m3.metric("Média de Acerto Global", f"{meus_stats['taxa_acerto'].mean():.1f}%")
+                
+                st.dataframe(
+                    meus_stats[['pergunta', 'vezes_usada', 'taxa_acerto', 'dificuldade']],
+                    column_config={
+                        "pergunta": "Pergunta",
+                        "vezes_usada": st.column_config.NumberColumn("Aplicações", format="%d"),
+                        "taxa_acerto": st.column_config.ProgressColumn("Taxa de Acerto", format="%.1f%%", min_value=0, max_value=100),
+                        "dificuldade": "Nível"
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
@@ -4,7 +4,8 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from database import get_db
+import kpis
+import rollups
 
 # =========================================
 # FUNÇÕES AUXILIARES DE ESTILO
@@ -27,60 +28,44 @@ def estilizar_grafico(fig):
 # =========================================
 def render_dashboard_geral():
     st.markdown("### 📊 Inteligência do Projeto")
-    db = get_db()
     
-    # 1. Coleta de Dados
-    with st.spinner("Compilando estatísticas globais..."):
-        users_docs = list(db.collection('usuarios').stream())
-        df_users = pd.DataFrame([d.to_dict() for d in users_docs])
-        
-        res_docs = list(db.collection('resultados').stream())
-        df_res = pd.DataFrame([d.to_dict() for d in res_docs])
-        
-        q_docs = list(db.collection('questoes').stream())
-        df_q = pd.DataFrame([d.to_dict() | {'id': d.id} for d in q_docs])
-
-        eq_docs = list(db.collection('equipes').stream())
-        df_equipes = pd.DataFrame([d.to_dict() | {'id': d.id} for d in eq_docs])
-        
-        alunos_vinc = list(db.collection('alunos').stream())
-        df_alunos_vinc = pd.DataFrame([d.to_dict() for d in alunos_vinc])
-        
-        profs_vinc = list(db.collection('professores').stream())
-        df_profs_vinc = pd.DataFrame([d.to_dict() for d in profs_vinc])
-
-    # 2. KPIs
-    total_users = len(df_users)
-    total_alunos = len(df_users[df_users['tipo_usuario'] == 'aluno']) if not df_users.empty else 0
-    total_profs = len(df_users[df_users['tipo_usuario'] == 'professor']) if not df_users.empty else 0
-    total_questoes = len(df_q)
-    total_equipes = len(df_equipes)
+    # 1. KPIs (agregações count()/sum() no servidor, cache curto)
+    try:
+        k = kpis.kpis_topo()
+    except Exception as e:
+        st.error(f"Erro ao carregar indicadores: {e}"); return
+    total_exames = k['exames']
+    aprovados = k['aprovados']
     
     col1, col2, col3, col4, col5 = st.columns(5)
-    col1.metric("👥 Usuários", total_users)
-    col2.metric("🥋 Professores(as)", total_profs)
-    col3.metric("🧠 Questões", total_questoes)
-    col4.metric("🏛️ Equipes", total_equipes)
-    
-    total_exames = len(df_res)
-    aprovados = len(df_res[df_res['aprovado'] == True]) if not df_res.empty else 0
-    taxa_aprovacao = (aprovados / total_exames * 100) if total_exames > 0 else 0
-    col5.metric("🏆 Aprovação", f"{taxa_aprovacao:.1f}%")
+    col1.metric("👥 Usuários", k['usuarios'])
+    col2.metric("🥋 Professores(as)", k['professores'])
+    col3.metric("🧠 Questões", k['questoes'])
+    col4.metric("🏛️ Equipes", k['equipes'])
+    col5.metric("🏆 Aprovação", f"{k['taxa_aprovacao']:.1f}%", help=f"Nota média: {k['nota_media']:.1f}% em {total_exames} exames")
+
+    # 2. Coleta de Dados dos gráficos (último snapshot diário + o que foi criado depois)
+    with st.spinner("Compilando estatísticas globais..."):
+        try:
+            painel, data_snapshot = rollups.obter_painel()
+        except Exception as e:
+            st.error(f"Erro ao carregar indicadores: {e}"); return
+    st.caption(f"Gráficos: consolidado até {data_snapshot} + movimento desde então.")
+    df_cadastros = pd.DataFrame(painel['cadastros_mensais'])
+    df_sexo = pd.DataFrame(painel['sexo'])
+    df_faixas = pd.DataFrame(painel['faixas_alunos'])
+    df_contrib = pd.DataFrame(painel['contribuidores'])
+    df_equipes = pd.DataFrame(painel['equipes_top'])
     
     st.markdown("---")
 
     # 3. Evolução Temporal de CADASTROS
     st.markdown("##### 📅 Evolução de Cadastros (Mensal)")
-    if not df_users.empty and 'data_criacao' in df_users.columns:
+    if not df_cadastros.empty:
         try:
-            df_ev = df_users.copy()
-            df_ev['data_criacao'] = pd.to_datetime(df_ev['data_criacao'], errors='coerce', utc=True)
-            df_ev = df_ev.dropna(subset=['data_criacao'])
-            df_ev = df_ev[df_ev['tipo_usuario'].isin(['aluno', 'professor'])]
-            df_ev['Tipo'] = df_ev['tipo_usuario'].str.capitalize()
-            df_ev['mes_dt'] = df_ev['data_criacao'].dt.to_period('M').dt.to_timestamp()
-            
-            df_counts = df_ev.groupby(['mes_dt', 'Tipo']).size().reset_index(name='Qtd')
+            df_counts = df_cadastros.rename(columns={'qtd': 'Qtd'})
+            df_counts['Tipo'] = df_counts['tipo'].str.capitalize()
+            df_counts['mes_dt'] = pd.to_datetime(df_counts['mes'] + '-01')
             df_counts = df_counts.sort_values('mes_dt')
             
             fig_line = px.line(df_counts, x='mes_dt', y='Qtd', color='Tipo', markers=True,
@@ -95,11 +80,9 @@ def render_dashboard_geral():
 
     # 4. Resultados Consolidados (ALTERADO PARA PIE CHART)
     st.markdown("##### 🎯 Resultados Consolidados (Total)")
-    if not df_res.empty:
+    if total_exames > 0:
         try:
-            df_status = df_res['aprovado'].value_counts().reset_index()
-            df_status.columns = ['Status', 'Qtd']
-            df_status['Status'] = df_status['Status'].map({True: 'Aprovado', False: 'Reprovado'})
+            df_status = pd.DataFrame({'Status': ['Aprovado', 'Reprovado'], 'Qtd': [aprovados, total_exames - aprovados]})
             
             # Gráfico de Pizza (Donut)
             fig_res = px.pie(df_status, values='Qtd', names='Status', color='Status',
@@ -121,8 +104,8 @@ def render_dashboard_geral():
     
     with c1:
         st.markdown("##### 👫 Distribuição por Sexo")
-        if not df_users.empty and 'sexo' in df_users.columns:
-            df_sexo = df_users.groupby(['tipo_usuario', 'sexo']).size().reset_index(name='Qtd')
+        if not df_sexo.empty:
+            df_sexo = df_sexo.rename(columns={'tipo': 'tipo_usuario', 'qtd': 'Qtd'})
             df_sexo['tipo_usuario'] = df_sexo['tipo_usuario'].str.capitalize()
             fig_sexo = px.bar(df_sexo, x='tipo_usuario', y='Qtd', color='sexo', barmode='group',
                               text='Qtd', color_discrete_map={'Masculino': '#078B6C', 'Feminino': '#FFD770'},
@@ -134,24 +117,11 @@ def render_dashboard_geral():
     with c2:
         st.markdown("##### 🏛️ Tamanho das Equipes")
         if not df_equipes.empty:
-            if not df_alunos_vinc.empty:
-                count_alunos = df_alunos_vinc['equipe_id'].value_counts().reset_index()
-                count_alunos.columns = ['id', 'Alunos']
-            else: count_alunos = pd.DataFrame(columns=['id', 'Alunos'])
-            
-            if not df_profs_vinc.empty:
-                count_profs = df_profs_vinc['equipe_id'].value_counts().reset_index()
-                count_profs.columns = ['id', 'Professores']
-            else: count_profs = pd.DataFrame(columns=['id', 'Professores'])
-            
-            df_merged = pd.merge(df_equipes[['id', 'nome']], count_alunos, on='id', how='left').fillna(0)
-            df_merged = pd.merge(df_merged, count_profs, on='id', how='left').fillna(0)
-            df_merged['Total'] = df_merged['Alunos'] + df_merged['Professores']
-            df_top_eq = df_merged.sort_values(by='Total', ascending=False).head(5)
+            df_top_eq = df_equipes.head(5)
             
             fig_eq = go.Figure(data=[
-                go.Bar(name='Alunos(as)', x=df_top_eq['nome'], y=df_top_eq['Alunos'], marker_color='#078B6C'),
-                go.Bar(name='Professores(as)', x=df_top_eq['nome'], y=df_top_eq['Professores'], marker_color='#FFD770')
+                go.Bar(name='Alunos(as)', x=df_top_eq['nome'], y=df_top_eq['alunos'], marker_color='#078B6C'),
+                go.Bar(name='Professores(as)', x=df_top_eq['nome'], y=df_top_eq['professores'], marker_color='#FFD770')
             ])
             fig_eq.update_layout(barmode='stack', title="Top 5 Equipes (Membros)")
             st.plotly_chart(estilizar_grafico(fig_eq), use_container_width=True)
@@ -163,9 +133,8 @@ def render_dashboard_geral():
     
     with c3:
         st.markdown("##### ✍️ Top Contribuidores (Questões)")
-        if not df_q.empty and 'criado_por' in df_q.columns:
-            df_q['autor_limpo'] = df_q['criado_por'].apply(lambda x: x.split('(')[0].strip() if x else "Desconhecido")
-            df_contrib = df_q['autor_limpo'].value_counts().reset_index().head(7)
+        if not df_contrib.empty:
+            df_contrib = df_contrib.sort_values('qtd', ascending=False).head(7)
             df_contrib.columns = ['Autor', 'Qtd']
             fig_contrib = px.bar(df_contrib, x='Qtd', y='Autor', orientation='h', text='Qtd',
                                  color='Qtd', color_continuous_scale='Greens')
@@ -175,8 +144,7 @@ def render_dashboard_geral():
 
     with c4:
         st.markdown("##### 🥋 Distribuição de Alunos(as) por Faixa")
-        if not df_users.empty and 'faixa_atual' in df_users.columns:
-            df_faixas = df_users[df_users['tipo_usuario'] == 'aluno']['faixa_atual'].value_counts().reset_index()
+        if not df_faixas.empty:
             df_faixas.columns = ['Faixa', 'Qtd']
             fig_f = px.pie(df_faixas, values='Qtd', names='Faixa', hole=0.4, 
                            color_discrete_sequence=px.colors.sequential.RdBu)
@@ -13,6 +13,7 @@ from auth import autenticar_local, criar_usuario_parcial_google, buscar_usuario_
 from utils import formatar_e_validar_cpf, formatar_cep, buscar_cep, gerar_senha_temporaria, enviar_email_recuperacao
 from database import get_db, OPCOES_SEXO
 from firebase_admin import firestore
+import replica
 
 # Configuração Google
 GOOGLE_CLIENT_ID = st.secrets.get("GOOGLE_CLIENT_ID")
@@ -42,27 +43,24 @@ def get_logo_path():
 def carregar_listas_equipes_profs(db):
     """Carrega listas de equipes e professores do banco."""
     try:
-        equipes_ref = db.collection('equipes').stream()
         lista_equipes = ["Nenhuma (Vínculo Pendente)"]
         mapa_equipes = {} 
         info_equipes = {} 
         
-        for doc in equipes_ref:
-            d = doc.to_dict()
+        for d in replica.listar('equipes'):
+            eq_id = d.pop('id')
             nm = d.get('nome', 'Sem Nome')
             lista_equipes.append(nm)
-            mapa_equipes[nm] = doc.id
-            info_equipes[doc.id] = d
+            mapa_equipes[nm] = eq_id
+            info_equipes[eq_id] = d
         
         profs_users_ref = db.collection('usuarios').where('tipo_usuario', '==', 'professor').stream()
         mapa_nomes_profs = {} 
         for doc in profs_users_ref:
             mapa_nomes_profs[doc.id] = doc.to_dict().get('nome', 'Sem Nome')
 
-        vincs_ref = db.collection('professores').where('status_vinculo', '==', 'ativo').stream()
         profs_por_equipe = {} 
-        for doc in vincs_ref:
-            d = doc.to_dict()
+        for d in replica.listar('professores_ativos'):
             eid = d.get('equipe_id')
             uid = d.get('usuario_id')
             if eid and uid and uid in mapa_nomes_profs:
@@ -206,16 +206,16 @@ def mostrar_modal_pagamento(curso, usuario):
     st.divider()
 
     # Gerar link de pagamento
-    if "mp_preference_id" not in st.session_state:
-        st.session_state.mp_preference_id = None
+    if "mp_referencia" not in st.session_state:
+        st.session_state.mp_referencia = None
         st.session_state.mp_link = None
 
-    if not st.session_state.mp_preference_id:
+    if not st.session_state.mp_referencia:
         with st.spinner("Conectando ao Mercado Pago..."):
-            link, pref_id = ce.gerar_preferencia_pagamento(curso, usuario)
+            link, referencia = ce.gerar_preferencia_pagamento(curso, usuario)
             if link:
                 st.session_state.mp_link = link
-                st.session_state.mp_preference_id = pref_id
+                st.session_state.mp_referencia = referencia
             else:
                 st.error("Erro ao conectar com o banco.")
                 return
@@ -246,28 +246,24 @@ def mostrar_modal_pagamento(curso, usuario):
         with col1:
             if st.button("🔄 Verificar Pagamento", use_container_width=True):
                 with st.spinner("Verificando..."):
-                    time.sleep(1)
-                    aprovado, msg = ce.verificar_status_pagamento_mp(st.session_state.mp_preference_id)
+                    # Inscrição e financeiro são gravados pelo webhook; aqui só lemos o status local
+                    aprovado, msg = ce.obter_status_pagamento_local(st.session_state.mp_referencia)
                     
                     if aprovado:
-                        ok_db, msg_db = ce.processar_compra_curso(usuario['id'], curso['id'], valor)
-                        if ok_db:
-                            st.balloons()
-                            st.success("Sucesso! Curso liberado.")
-                            st.session_state.mp_preference_id = None
-                            st.session_state.mp_link = None
-                            st.session_state.show_pagamento_modal = False
-                            st.session_state.curso_para_compra = None
-                            time.sleep(2)
-                            st.rerun()
-                        else:
-                            st.error(f"Erro no sistema: {msg_db}")
+                        st.balloons()
+                        st.success("Sucesso! Curso liberado.")
+                        st.session_state.mp_referencia = None
+                        st.session_state.mp_link = None
+                        st.session_state.show_pagamento_modal = False
+                        st.session_state.curso_para_compra = None
+                        time.sleep(2)
+                        st.rerun()
                     else:
                         st.warning(f"Status: {msg}")
         
         with col2:
             if st.button("❌ Cancelar", use_container_width=True):
-                st.session_state.mp_preference_id = None
+                st.session_state.mp_referencia = None
                 st.session_state.mp_link = None
                 st.session_state.show_pagamento_modal = False
                 st.session_state.curso_para_compra = None
@@ -311,7 +307,7 @@ def render_modulos_aulas(curso):
                     
                     with col_aula2:
                         # Verificar se aula tem conteúdo
-                        tem_conteudo = aula.get('conteudo') and len(aula.get('conteudo', {}).get('blocos', [])) > 0
+                        tem_conteudo = aula.get('qtd_blocos', 0) > 0
                         if tem_conteudo:
                             st.markdown("✅ Disponível")
                         else:
@@ -320,7 +316,7 @@ def render_modulos_aulas(curso):
                     with col_aula3:
                         if tem_conteudo:
                             if st.button("▶ Assistir", key=f"assistir_{aula['id']}", use_container_width=True):
-                                st.session_state["aula_selecionada"] = aula
+                                st.session_state["aula_selecionada"] = ce.obter_aula(aula['id']) or aula
                                 st.session_state["view_aluno"] = "player"
                                 st.rerun()
                         else:
@@ -3,8 +3,9 @@
 import streamlit as st
 import pandas as pd
 import time
-from database import get_db
+from database import get_db, obter_carregador
 from firebase_admin import firestore
+import replica
 # Importamos o dashboard para usar dentro da aba
 from views import dashboard 
 
@@ -52,6 +53,7 @@ def get_cargo_decorado(cargo):
 # =========================================
 def gestao_equipes():
     db = get_db()
+    carregador = obter_carregador()
     user = st.session_state.usuario
     user_id = user['id']
 
@@ -70,9 +72,9 @@ def gestao_equipes():
     # Busca nome da equipe
     nome_equipe = "Minha Equipe"
     if meu_equipe_id:
-        eq_doc = db.collection('equipes').document(meu_equipe_id).get()
-        if eq_doc.exists:
-            nome_equipe = eq_doc.to_dict().get('nome', 'Minha Equipe')
+        eq_dados = replica.documento('equipes', meu_equipe_id)
+        if eq_dados is not None:
+            nome_equipe = eq_dados.get('nome', 'Minha Equipe')
 
     # --- 2. DEFINIR NÍVEL DE PODER ---
     nivel_poder = 1
@@ -96,26 +98,39 @@ def gestao_equipes():
     
     tabs = st.tabs(abas)
 
+    # --- 4. BUSCAS DAS ABAS ---
+    # Todas as consultas saem antes das abas para que os nomes de usuários
+    # de todas elas sejam lidos juntos, num único lote.
+    q_alunos = db.collection('alunos').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'pendente')
+    if nivel_poder == 1:
+        q_alunos = q_alunos.where('professor_id', '==', user_id)
+        msg_filtro = "Seus alunos diretos"
+    else:
+        msg_filtro = "Todos da equipe"
+    alunos_pend = list(q_alunos.stream())
+
+    profs_pend = []
+    if nivel_poder >= 2:
+        q_profs = db.collection('professores').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'pendente')
+        profs_pend = list(q_profs.stream())
+
+    profs_ativos = list(db.collection('professores').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'ativo').stream())
+    alunos_ativos = list(db.collection('alunos').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'ativo').stream())
+
+    for doc in alunos_pend + profs_pend + profs_ativos + alunos_ativos:
+        carregador.agendar('usuarios', doc.to_dict().get('usuario_id'))
+
     # === ABA 1: APROVAÇÕES PENDENTES ===
     with tabs[0]:
         st.markdown("#### Solicitações de Entrada")
         
         # A. ALUNOS
-        q_alunos = db.collection('alunos').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'pendente')
-        if nivel_poder == 1:
-            q_alunos = q_alunos.where('professor_id', '==', user_id)
-            msg_filtro = "Seus alunos diretos"
-        else:
-            msg_filtro = "Todos da equipe"
-            
-        alunos_pend = list(q_alunos.stream())
-
         if alunos_pend:
             st.info(f"Alunos Pendentes: {len(alunos_pend)} ({msg_filtro})")
             for doc in alunos_pend:
                 d = doc.to_dict()
-                udoc = db.collection('usuarios').document(d['usuario_id']).get()
-                nome_aluno = udoc.to_dict()['nome'] if udoc.exists else "Desconhecido"
+                udados = carregador.obter('usuarios', d['usuario_id'])
+                nome_aluno = udados['nome'] if udados is not None else "Desconhecido"
                 
                 with st.container(border=True):
                     c1, c2, c3 = st.columns([0.6, 0.2, 0.2])
@@ -133,14 +148,12 @@ def gestao_equipes():
         if nivel_poder >= 2:
             st.divider()
             st.markdown("#### Professores Pendentes")
-            q_profs = db.collection('professores').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'pendente')
-            profs_pend = list(q_profs.stream())
             
             if profs_pend:
                 for doc in profs_pend:
                     d = doc.to_dict()
-                    udoc = db.collection('usuarios').document(d['usuario_id']).get()
-                    nome_prof = udoc.to_dict()['nome'] if udoc.exists else "Desconhecido"
+                    udados = carregador.obter('usuarios', d['usuario_id'])
+                    nome_prof = udados['nome'] if udados is not None else "Desconhecido"
                     
                     with st.container(border=True):
                         c1, c2, c3 = st.columns([0.6, 0.2, 0.2])
@@ -154,10 +167,7 @@ def gestao_equipes():
 
     # === ABA 2: MEMBROS ATIVOS (COM TOTAIS) ===
     with tabs[1]:
-        # 1. BUSCAR DADOS (Queries)
-        # Fazemos a busca antes para poder contar e exibir os totais no topo
-        profs_ativos = list(db.collection('professores').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'ativo').stream())
-        alunos_ativos = list(db.collection('alunos').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'ativo').stream())
+        # 1. DADOS JÁ BUSCADOS ANTES DAS ABAS (profs_ativos / alunos_ativos)
 
         # 2. EXIBIR TOTAIS (Métricas)
         c_tot1, c_tot2 = st.columns(2)
@@ -172,14 +182,14 @@ def gestao_equipes():
         lista_profs = []
         for p in profs_ativos:
             pdados = p.to_dict()
-            u = db.collection('usuarios').document(pdados['usuario_id']).get()
-            if u.exists:
+            u = carregador.obter('usuarios', pdados['usuario_id'])
+            if u is not None:
                 cargo_raw = "Auxiliar"
                 if pdados.get('eh_responsavel'): cargo_raw = "Líder"
                 elif pdados.get('pode_aprovar'): cargo_raw = "Delegado"
                 
                 lista_profs.append({
-                    "Nome": u.to_dict()['nome'],
+                    "Nome": u['nome'],
                     "Cargo": get_cargo_decorado(cargo_raw)
                 })
         
@@ -206,9 +216,9 @@ def gestao_equipes():
         lista_alunos = []
         for a in alunos_ativos:
             adados = a.to_dict()
-            u = db.collection('usuarios').document(adados['usuario_id']).get()
-            if u.exists:
-                nome_real = u.to_dict()['nome']
+            u = carregador.obter('usuarios', adados['usuario_id'])
+            if u is not None:
+                nome_real = u['nome']
                 # Filtro visual
                 if filtro and filtro.upper() not in nome_real.upper():
                     continue
@@ -242,7 +252,7 @@ def gestao_equipes():
             st.markdown("#### Gestão de Delegados")
             st.info("Limite: 2 Delegados.")
             
-            profs_ativos_del = list(db.collection('professores').where('equipe_id', '==', meu_equipe_id).where('status_vinculo', '==', 'ativo').stream())
+            profs_ativos_del = profs_ativos
             delegados_existentes = [p for p in profs_ativos_del if p.to_dict().get('pode_aprovar') and not p.to_dict().get('eh_responsavel')]
             
             st.metric("Vagas Utilizadas", f"{len(delegados_existentes)} / 2")
@@ -255,8 +265,8 @@ def gestao_equipes():
             
             for doc in auxiliares:
                 d = doc.to_dict()
-                u = db.collection('usuarios').document(d['usuario_id']).get()
-                nome = u.to_dict()['nome'] if u.exists else "..."
+                u = carregador.obter('usuarios', d['usuario_id'])
+                nome = u['nome'] if u is not None else "..."
                 is_delegado = d.get('pode_aprovar', False)
                 
                 c1, c2 = st.columns([3, 2])
@@ -0,0 +1,189 @@
+# main/webhook_mp.py
+"""
+Receptor HTTP das notificações do Mercado Pago (processo separado do Streamlit).
+
+Fluxo: notificação -> confere assinatura (x-signature) -> busca o pagamento na
+API -> utils.registrar_pagamento_mp (inscrição + financeiro exatamente uma vez,
+deduplicado por payment_id). Responde 200 também para duplicadas/ignoradas
+para o MP parar de reenviar; 5xx faz o MP tentar de novo.
+
+Uso (na raiz do projeto, com .streamlit/secrets.toml):
+    python webhook_mp.py servir [--porta 8081]
+    python webhook_mp.py servir --stub exemplos/mp_notificacoes.jsonl --sem-assinatura
+    python webhook_mp.py replay exemplos/mp_notificacoes.jsonl [--url http://localhost:8081/webhook/mercadopago]
+
+O modo --stub responde a consulta do pagamento com o que está gravado no arquivo
+(campo "pagamento" de cada linha), sem chamar a API. O replay reenvia o campo
+"notificacao" de cada linha, assinando com o segredo se houver. Para testar de
+ponta a ponta, troque REFERENCIA_DO_PEDIDO pelo id de um doc de pagamentos_mp.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO_WEBHOOK = "/webhook/mercadopago"
+PORTA_PADRAO = 8081
+
+# ==============================================================================
+# ASSINATURA
+# ==============================================================================
+def ler_segredo():
+    """Segredo da assinatura: env MP_WEBHOOK_SECRET ou secrets [mercadopago].webhook_secret."""
+    if os.environ.get("MP_WEBHOOK_SECRET"):
+        return os.environ["MP_WEBHOOK_SECRET"]
+    try:
+        import streamlit as st
+        return st.secrets["mercadopago"].get("webhook_secret", "")
+    except Exception:
+        return ""
+
+def _manifesto(data_id, request_id, ts):
+    return f"id:{data_id};request-id:{request_id};ts:{ts};"
+
+def assinar(data_id, request_id, ts, segredo):
+    return hmac.new(segredo.encode(), _manifesto(data_id, request_id, ts).encode(), hashlib.sha256).hexdigest()
+
+def verificar_assinatura(x_signature, x_request_id, data_id, segredo):
+    """Confere o cabeçalho x-signature ("ts=...,v1=...") do Mercado Pago."""
+    if not x_signature or not segredo: return False
+    partes = dict(p.strip().split("=", 1) for p in x_signature.split(",") if "=" in p)
+    ts, v1 = partes.get("ts"), partes.get("v1")
+    if not ts or not v1: return False
+    return hmac.compare_digest(assinar(str(data_id).lower(), x_request_id or "", ts, segredo), v1)
+
+# ==============================================================================
+# RECEPTOR
+# ==============================================================================
+def _extrair_notificacao(corpo, query):
+    """(tipo, data_id) de uma notificação (corpo JSON ou query string)."""
+    tipo = corpo.get("type") or corpo.get("topic") or (query.get("type") or query.get("topic") or [""])[0]
+    data_id = (corpo.get("data") or {}).get("id") or (query.get("data.id") or query.get("id") or [""])[0]
+    return tipo, str(data_id or "")
+
+def criar_handler(consultar_pagamento, segredo, exigir_assinatura=True):
+    import utils
+
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, codigo, texto):
+            self.send_response(codigo)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(texto.encode())
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != CAMINHO_WEBHOOK:
+                return self._responder(404, "nao encontrado")
+            try:
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            except Exception:
+                return self._responder(400, "json invalido")
+
+            tipo, data_id = _extrair_notificacao(corpo, parse_qs(url.query))
+            if tipo != "payment" or not data_id:
+                return self._responder(200, "ignorado")
+
+            if exigir_assinatura and not verificar_assinatura(
+                    self.headers.get("x-signature"), self.headers.get("x-request-id"), data_id, segredo):
+                return self._responder(401, "assinatura invalida")
+
+            try:
+                pagamento = consultar_pagamento(data_id)
+                resultado = utils.registrar_pagamento_mp(pagamento)
+            except Exception as e:
+                print(f"[WEBHOOK_MP] pagamento {data_id}: erro {e}")
+                return self._responder(500, "erro")
+            print(f"[WEBHOOK_MP] pagamento {data_id}: {resultado}")
+            self._responder(200, resultado)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def carregar_gravacoes(caminho):
+    """Linhas JSON {"notificacao": {...}, "headers": {...}, "pagamento": {...}}."""
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def consultor_stub(caminho):
+    """
+    Consulta de pagamento que responde com os pagamentos gravados, na ordem em
+    que aparecem para cada payment_id (o último se repete quando acabam).
+    """
+    fila = {}
+    for g in carregar_gravacoes(caminho):
+        if g.get("pagamento"): fila.setdefault(str(g["pagamento"]["id"]), []).append(g["pagamento"])
+    def consultar(payment_id):
+        estados = fila.get(str(payment_id))
+        if not estados:
+            raise KeyError(f"pagamento {payment_id} não gravado")
+        return estados.pop(0) if len(estados) > 1 else estados[0]
+    return consultar
+
+def cmd_servir(args):
+    if args.stub:
+        consultar = consultor_stub(args.stub)
+    else:
+        import utils
+        consultar = utils.consultar_pagamento_mp
+    segredo = ler_segredo()
+    if not args.sem_assinatura and not segredo:
+        sys.exit("Sem segredo de assinatura (MP_WEBHOOK_SECRET). Use --sem-assinatura só em teste local.")
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_handler(consultar, segredo, not args.sem_assinatura))
+    print(f"Ouvindo em http://{args.host}:{args.porta}{CAMINHO_WEBHOOK}")
+    try: servidor.serve_forever()
+    except KeyboardInterrupt: pass
+
+# ==============================================================================
+# REPLAY (STUB LOCAL)
+# ==============================================================================
+def cmd_replay(args):
+    segredo = ler_segredo()
+    for i, g in enumerate(carregar_gravacoes(args.arquivo), 1):
+        notif = g["notificacao"]
+        _, data_id = _extrair_notificacao(notif, {})
+        headers = {"Content-Type": "application/json", **(g.get("headers") or {})}
+        if segredo and "x-signature" not in headers:
+            ts, request_id = str(int(time.time())), headers.get("x-request-id", f"replay-{i}")
+            headers["x-request-id"] = request_id
+            headers["x-signature"] = f"ts={ts},v1={assinar(data_id, request_id, ts, segredo)}"
+        req = urllib.request.Request(args.url, data=json.dumps(notif).encode(), headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=10) as r:
+                print(f"{i}: {r.status} {r.read().decode()}")
+        except urllib.error.HTTPError as e:
+            print(f"{i}: {e.code} {e.read().decode()}")
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook do Mercado Pago")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("servir", help="Sobe o receptor HTTP")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    p.add_argument("--stub", help="Arquivo de gravações: consulta de pagamento local, sem API")
+    p.add_argument("--sem-assinatura", action="store_true", help="Não exige x-signature (teste local)")
+    p.set_defaults(func=cmd_servir)
+
+    p = sub.add_parser("replay", help="Reenvia notificações gravadas para um receptor")
+    p.add_argument("arquivo")
+    p.add_argument("--url", default=f"http://localhost:{PORTA_PADRAO}{CAMINHO_WEBHOOK}")
+    p.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())